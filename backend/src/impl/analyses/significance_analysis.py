@@ -1,8 +1,187 @@
+from __future__ import annotations
+
+import logging
+import math
+import zlib
+from typing import Protocol
+
 import numpy as np
 from explainaboard.info import SysOutputInfo
 from explainaboard.metrics.metric import Metric, MetricStats
 
-from explainaboard_web.models import SignificanceTestInfo
+from explainaboard_web.models import SignificanceMatrix, SignificanceTestInfo
+
+# upper bound of the number of bootstrap indices drawn at once, which bounds the
+# memory used by the sampled stats
+_MAX_BATCH_INDICES = 2**22
+# with early stopping, the p-value is checked after each batch of this many samples
+_EARLY_STOPPING_BATCH_SIZE = 100
+# z-score of the confidence interval of the p-value used for early stopping
+_EARLY_STOPPING_Z = 2.576
+
+
+def _wilson_interval(successes: float, n: int, z: float) -> tuple[float, float]:
+    """Wilson score interval of a binomial proportion"""
+    p = successes / n
+    denominator = 1 + z**2 / n
+    center = (p + z**2 / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denominator
+    return center - half_width, center + half_width
+
+
+def _bootstrap_scores(
+    metric_func: Metric, metric_stat: MetricStats, indices: np.ndarray
+) -> np.ndarray:
+    """The score of the metric on each row of bootstrap `indices`"""
+    return np.asarray(
+        metric_func.calc_metric_from_aggregate(
+            metric_func.aggregate_stats(metric_stat.filter(indices))
+        )
+    ).reshape(len(indices))
+
+
+def bootstrap_wins(
+    metric_func: Metric,
+    sys1_metric_stat: MetricStats,
+    sys2_metric_stat: MetricStats,
+    n_samples: int,
+    prop_samples: float,
+    rng: np.random.Generator,
+    early_stopping_alpha: float | None = None,
+) -> tuple[np.ndarray, int]:
+    """
+    Counts how many times each system wins in bootstrapped resampling rounds.
+
+    Indices are drawn in batches of at most `_MAX_BATCH_INDICES` so memory is bounded
+    regardless of the size of the test set.
+    :param early_stopping_alpha: if set, sampling stops as soon as the confidence
+        interval of the p-value is entirely below or above this threshold
+    :return: [system1 wins, system2 wins, ties] and the number of samples drawn
+    """
+    n_elems = max(int(prop_samples * len(sys1_metric_stat)), 1)
+    batch_size = max(_MAX_BATCH_INDICES // n_elems, 1)
+    if early_stopping_alpha is not None:
+        batch_size = min(batch_size, _EARLY_STOPPING_BATCH_SIZE)
+
+    wins = np.zeros(3, dtype=np.int64)
+    n_drawn = 0
+    while n_drawn < n_samples:
+        n_batch = min(batch_size, n_samples - n_drawn)
+        indices = rng.integers(len(sys1_metric_stat), size=(n_batch, n_elems))
+        sys1_scores = _bootstrap_scores(metric_func, sys1_metric_stat, indices)
+        sys2_scores = _bootstrap_scores(metric_func, sys2_metric_stat, indices)
+        sys1_wins = np.count_nonzero(sys1_scores > sys2_scores)
+        sys2_wins = np.count_nonzero(sys1_scores < sys2_scores)
+        wins += [sys1_wins, sys2_wins, n_batch - sys1_wins - sys2_wins]
+        n_drawn += n_batch
+
+        if early_stopping_alpha is not None and n_drawn < n_samples:
+            # the p-value is the proportion of samples not won by the better system
+            low, high = _wilson_interval(
+                n_drawn - wins[:2].max(), n_drawn, _EARLY_STOPPING_Z
+            )
+            if high < early_stopping_alpha or low > early_stopping_alpha:
+                break
+    return wins, n_drawn
+
+
+def bootstrap_win_matrix(
+    metric_func: Metric,
+    metric_stats: list[MetricStats],
+    n_samples: int,
+    prop_samples: float,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Counts how many times each system beats each other system in bootstrapped
+    resampling rounds. All the systems are evaluated on the same bootstrap indices,
+    so each system's stats are aggregated once per sample instead of once per pair.
+    :return: a matrix where [i, j] is the number of samples in which system i has a
+        higher score than system j
+    """
+    n_systems = len(metric_stats)
+    n_elems = max(int(prop_samples * len(metric_stats[0])), 1)
+    # the scores of a batch take n_systems times as much memory as its indices
+    batch_size = max(_MAX_BATCH_INDICES // (n_elems * n_systems), 1)
+
+    wins = np.zeros((n_systems, n_systems), dtype=np.int64)
+    n_drawn = 0
+    while n_drawn < n_samples:
+        n_batch = min(batch_size, n_samples - n_drawn)
+        indices = rng.integers(len(metric_stats[0]), size=(n_batch, n_elems))
+        # (n_systems, n_batch)
+        scores = np.stack(
+            [_bootstrap_scores(metric_func, stats, indices) for stats in metric_stats]
+        )
+        for i in range(n_systems):
+            wins[i] += np.count_nonzero(scores[i] > scores, axis=1)
+        n_drawn += n_batch
+    return wins
+
+
+def multi_system_significance_test(
+    sys_infos: list[SysOutputInfo],
+    metric_stats: list[dict[str, MetricStats]],
+    n_samples: int = 1000,
+    prop_samples: float = 0.5,
+    seed: int | None = None,
+) -> list[SignificanceMatrix]:
+    """
+    Bootstrapped significance test between every pair of systems. Only the metrics
+    that all the systems have, with stats over the same number of examples, are
+    tested.
+    :param n_samples: The number of bootstrapped samples
+    :param prop_samples: The ratio of samples to take every time
+    :param seed: The seed of the random number generator
+    """
+    metric_funcs: dict[str, Metric] = {
+        metric_name: metric_config.to_metric()
+        for metric_name, metric_config in sys_infos[0]
+        .analysis_levels[0]
+        .metric_configs.items()
+    }
+    metric_names = set(metric_funcs).intersection(*metric_stats)
+    system_names = [
+        f"system{i + 1}" if info.system_name is None else info.system_name
+        for i, info in enumerate(sys_infos)
+    ]
+
+    matrices: list[SignificanceMatrix] = []
+    rng = np.random.default_rng(seed)
+    # sorted so that results are reproducible for a given seed
+    for metric_name in sorted(metric_names):
+        stats = [sys_stats[metric_name] for sys_stats in metric_stats]
+        if len({len(x) for x in stats}) != 1:
+            logging.getLogger().warning(
+                f"skipping significance test of {metric_name} because the systems "
+                "are evaluated on different numbers of examples"
+            )
+            continue
+        wins = bootstrap_win_matrix(
+            metric_funcs[metric_name], stats, n_samples, prop_samples, rng
+        )
+        matrices.append(
+            SignificanceMatrix(
+                metric_name=metric_name,
+                system_names=system_names,
+                win_rates=(wins / n_samples).tolist(),
+                n_samples=n_samples,
+                prop_samples=prop_samples,
+            )
+        )
+    return matrices
+
+
+class SignificanceTestCache(Protocol):
+    """Stores the results of `bootstrap_wins` for a pair of systems and a set of
+    test parameters"""
+
+    def get(self, metric_name: str) -> tuple[list[int], int] | None:
+        """:return: the wins and the number of samples drawn, or None if missing"""
+        ...
+
+    def put(self, metric_name: str, wins: list[int], n_drawn: int) -> None:
+        ...
 
 
 def pairwise_significance_test(
@@ -12,12 +191,22 @@ def pairwise_significance_test(
     sys2_metric_stats: dict[str, MetricStats],
     n_samples: int = 1000,
     prop_samples: float = 0.5,
+    early_stopping_alpha: float | None = None,
+    seed: int | None = None,
+    cache: SignificanceTestCache | None = None,
 ) -> list[SignificanceTestInfo]:
     """
     significance test based on bootstrapped resampling method, which are controlled by
     two major hyper-parameters:
     :param n_samples: The number of bootstrapped samples
     :param prop_samples: The ratio of samples to take every time
+    :param early_stopping_alpha: If set, stop sampling once the p-value is clearly
+        below or above this threshold. Fewer than `n_samples` samples may be drawn.
+    :param seed: The seed of the random number generator. If set, each metric gets
+        its own generator derived from the seed, so the result of a metric doesn't
+        depend on which other metrics are tested or cached.
+    :param cache: If set, the wins of each metric are looked up in the cache
+        before running the test, and stored in it afterwards
     """
 
     sys1_metric_names = set(sys1_metric_stats.keys())
@@ -41,34 +230,24 @@ def pairwise_significance_test(
     sig_info: list[SignificanceTestInfo] = []
 
     rng = np.random.default_rng()
-    for metric_name in sys1_metric_names:
-        sys1_metric_stat = sys1_metric_stats[metric_name]
-        sys2_metric_stat = sys2_metric_stats[metric_name]
-        metric_func = metric_funcs[metric_name]
-
-        n_elems = max(int(prop_samples * len(sys1_metric_stat)), 1)
-        all_indices = np.array(range(len(sys1_metric_stat)))
-        all_indices = rng.choice(all_indices, size=(n_samples, n_elems), replace=True)
-        # Get sampling examples
-        sys1_filt_stats = sys1_metric_stat.filter(all_indices)
-        sys2_filt_stats = sys2_metric_stat.filter(all_indices)
-
-        # Calculating performance for system 1
-        sys1_agg_stats = metric_func.aggregate_stats(sys1_filt_stats)
-        sys1_samp_results = metric_func.calc_metric_from_aggregate(sys1_agg_stats)
-        # Calculating performance for system 2
-        sys2_agg_stats = metric_func.aggregate_stats(sys2_filt_stats)
-        sys2_samp_results = metric_func.calc_metric_from_aggregate(sys2_agg_stats)
-
-        # Judge which system wins based on their performance in each sampling round
-        wins = [0.0, 0.0, 0.0]
-        for sys1_score, sys2_score in zip(sys1_samp_results, sys2_samp_results):
-            if sys1_score > sys2_score:
-                wins[0] += 1
-            elif sys1_score < sys2_score:
-                wins[1] += 1
-            else:
-                wins[2] += 1
+    for metric_name in sorted(sys1_metric_names):
+        cached = cache.get(metric_name) if cache else None
+        if cached:
+            wins_count, n_drawn = cached
+        else:
+            if seed is not None:
+                rng = np.random.default_rng([seed, zlib.crc32(metric_name.encode())])
+            wins_count, n_drawn = bootstrap_wins(
+                metric_funcs[metric_name],
+                sys1_metric_stats[metric_name],
+                sys2_metric_stats[metric_name],
+                n_samples,
+                prop_samples,
+                rng,
+                early_stopping_alpha,
+            )
+            if cache:
+                cache.put(metric_name, [int(x) for x in wins_count], n_drawn)
 
         # Get system names
         sys1_name = (
@@ -78,8 +257,7 @@ def pairwise_significance_test(
             "system2" if sys2_info.system_name is None else sys2_info.system_name
         )
 
-        for i in range(len(wins)):
-            wins[i] = wins[i] * 1.0 / n_samples
+        wins = [float(x) / n_drawn for x in wins_count]
         description = (
             (
                 f"{sys1_name} is superior to {sys2_name} with p-value: "
@@ -98,7 +276,7 @@ def pairwise_significance_test(
             "system1_win_count": wins[0],
             "system2_win_count": wins[1],
             "tie_count": wins[2],
-            "n_samples": n_samples,
+            "n_samples": n_drawn,
             "prop_samples": prop_samples,
         }
 
@@ -109,7 +287,7 @@ def pairwise_significance_test(
                 method_description="Bootstrapping method with sampling rate: "
                 + str(prop_samples)
                 + ", and sample size: "
-                + str(n_samples),
+                + str(n_drawn),
                 test_name=test_name,
                 test_data=test_data,
             )
@@ -1,14 +1,18 @@
 from __future__ import annotations
 
+import hashlib
 import logging
+import re
 import secrets
-from typing import Any
+import threading
+import time
+from typing import Any, Final
 
-import google.auth.transport.requests
-import google.oauth2.id_token
+import google.auth.jwt
+import requests
 from flask import current_app, g
 
-from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.caching import TTLCache
 from explainaboard_web.impl.db_utils.user_db_utils import UserDBUtils
 from explainaboard_web.impl.utils import abort_with_error_message
 from explainaboard_web.models.user import User
@@ -38,10 +42,8 @@ def check_BearerAuth(token: str):  # noqa: N802
     """JWT authentication. Signup is handled by firebaseui (frontend) so this function
     creates a new user in the database if it does not exist."""
     try:
-        decoded_jwt = google.oauth2.id_token.verify_firebase_token(
-            token,
-            google.auth.transport.requests.Request(),
-            audience=current_app.config["AUTH_AUDIENCE"],
+        decoded_jwt = _verify_firebase_token(
+            token, audience=current_app.config["AUTH_AUDIENCE"]
         )
     except Exception as e:
         logging.error(e)
@@ -53,6 +55,78 @@ def check_BearerAuth(token: str):  # noqa: N802
         return {}
 
 
+_FIREBASE_CERTS_URL: Final = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+# the certificates are cached for the max-age of the response or this long if the
+# response doesn't have one
+_DEFAULT_CERTS_TTL: Final = 3600
+# the certificates are fetched at most this often when a token is signed by an
+# unknown key, so invalid tokens cannot make us flood the certificate endpoint
+_MIN_CERTS_REFRESH_INTERVAL: Final = 60
+
+# reuses the connections to the certificate endpoint
+_http_session = requests.Session()
+# key id -> x509 certificate of the keys that sign firebase tokens
+_certs_cache: Final[TTLCache[str, dict[str, str]]] = TTLCache(maxsize=1, ttl=None)
+_certs_lock = threading.Lock()
+_certs_fetched_at = float("-inf")
+# hash of audience and token -> claims of a verified token. Entries expire when the
+# token does.
+_verified_tokens: Final[TTLCache[str, dict[str, Any]]] = TTLCache(
+    maxsize=4096, ttl=None
+)
+
+
+def _fetch_firebase_certs(refresh: bool = False) -> dict[str, str]:
+    """Returns the certificates of the keys that sign firebase tokens. They are
+    fetched again when the cached ones expire or if `refresh` (rate limited)."""
+    global _certs_fetched_at
+    with _certs_lock:
+        certs = _certs_cache.get(_FIREBASE_CERTS_URL)
+        if certs is not None and not (
+            refresh
+            and time.monotonic() - _certs_fetched_at >= _MIN_CERTS_REFRESH_INTERVAL
+        ):
+            return certs
+        response = _http_session.get(_FIREBASE_CERTS_URL, timeout=10)
+        response.raise_for_status()
+        certs = response.json()
+        max_age = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        _certs_cache.set(
+            _FIREBASE_CERTS_URL,
+            certs,
+            ttl=int(max_age.group(1)) if max_age else _DEFAULT_CERTS_TTL,
+        )
+        _certs_fetched_at = time.monotonic()
+        return certs
+
+
+def _verify_firebase_token(token: str, audience: str) -> dict[str, Any]:
+    """Verifies a firebase ID token and returns its claims. Same as
+    `google.oauth2.id_token.verify_firebase_token` except that the certificates and
+    the verified tokens are cached.
+
+    Raises:
+        ValueError: the token is invalid or expired.
+    """
+    key = hashlib.sha256(f"{audience}\0{token}".encode()).hexdigest()
+    claims = _verified_tokens.get(key)
+    if claims is not None:
+        return claims
+
+    certs = _fetch_firebase_certs()
+    if google.auth.jwt.decode_header(token).get("kid") not in certs:
+        # the keys may have been rotated
+        certs = _fetch_firebase_certs(refresh=True)
+    claims = google.auth.jwt.decode(token, certs=certs, audience=audience)
+    ttl = claims["exp"] - time.time()
+    if ttl > 0:
+        _verified_tokens.set(key, claims, ttl=ttl)
+    return claims
+
+
 def _find_or_create_user(user_id: str, user_info: dict[str, Any]) -> User:
     """Finds a user based on user_id or create the user in the DB according
     to user_info.
@@ -67,12 +141,7 @@ def _find_or_create_user(user_id: str, user_info: dict[str, Any]) -> User:
     user = UserDBUtils.find_user(user_id)
     if user:
         if user.email_verified != user_info["email_verified"]:
-            DBUtils.update_one_by_id(
-                DBUtils.USER_METADATA,
-                user_id,
-                {"email_verified": user_info["email_verified"]},
-            )
-            user.email_verified = user_info["email_verified"]
+            UserDBUtils.update_email_verified(user, user_info["email_verified"])
         return user
 
     user = UserDBUtils.create_user(
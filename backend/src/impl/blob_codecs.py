@@ -0,0 +1,307 @@
+"""Compression codecs of the blobs written by `Storage`.
+
+Every compressed blob starts with a header that identifies its codec and the
+dictionary it was compressed with, if any:
+
+    magic (3 bytes) | codec id (1 byte) | dictionary id (4 bytes, big-endian)
+
+A dictionary id of 0 means no dictionary. The first byte of the magic is not a valid
+first byte of a zlib stream, so blobs written before the header was introduced
+(zlib without a header) are recognized and still decoded.
+
+Formats that compress their contents themselves, such as the Arrow blobs of
+columnar_blob.py, are stored as is after a header with a "raw" codec, so every blob
+written by the app is self-describing. Decoding such a blob returns its contents
+unchanged and readers of the format check the codec before parsing them.
+
+Dictionaries are trained on samples of similar blobs (e.g. analysis cases, which
+are repetitive JSON) and improve the compression ratio of small blobs. They are
+stored as blobs themselves and identified by a hash of their contents.
+"""
+from __future__ import annotations
+
+import hashlib
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Final, Protocol
+
+import lz4.block
+import zstandard
+
+_MAGIC: Final = b"\xe5XB"
+_HEADER: Final = struct.Struct(">3sBI")
+HEADER_SIZE: Final = _HEADER.size
+
+
+class Decompressor(Protocol):
+    """Decompresses a stream piece by piece. Like the decompression objects of zlib,
+    `decompress` returns at most `max_length` bytes (0 means no limit) and keeps the
+    input it hasn't processed yet in `unconsumed_tail`, which must be passed to the
+    next call."""
+
+    @property
+    def unconsumed_tail(self) -> bytes:
+        ...
+
+    def decompress(self, data: bytes, max_length: int = 0) -> bytes:
+        ...
+
+    def flush(self) -> bytes:
+        ...
+
+
+class Codec(ABC):
+    """A compression algorithm. `dictionary` is raw bytes whose contents are
+    likely to appear in the data."""
+
+    codec_id: int
+    name: str
+
+    @abstractmethod
+    def compress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        raise NotImplementedError
+
+    @abstractmethod
+    def decompress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        raise NotImplementedError
+
+    def decompressobj(self, dictionary: bytes | None = None) -> Decompressor:
+        """Returns a streaming decompressor. By default, the whole stream is
+        buffered and decompressed by `flush`."""
+        return _BufferedDecompressor(self, dictionary)
+
+
+class _BufferedDecompressor:
+    def __init__(self, codec: Codec, dictionary: bytes | None) -> None:
+        self._codec = codec
+        self._dictionary = dictionary
+        self._buffer = bytearray()
+        self.unconsumed_tail = b""
+
+    def decompress(self, data: bytes, max_length: int = 0) -> bytes:
+        self._buffer += data
+        return b""
+
+    def flush(self) -> bytes:
+        return self._codec.decompress(bytes(self._buffer), self._dictionary)
+
+
+class _ZstdDecompressor:
+    """Bounds the output of a zstd decompression object, which doesn't support
+    `max_length`, by feeding it the input in small steps. The output of the last
+    step that exceeds `max_length` is returned by the next call."""
+
+    _STEP = 1 << 12
+
+    def __init__(self, decompressor: zstandard.ZstdDecompressor) -> None:
+        self._decompressobj = decompressor.decompressobj()
+        self._output = b""
+        self.unconsumed_tail = b""
+
+    def decompress(self, data: bytes, max_length: int = 0) -> bytes:
+        pieces = [self._output]
+        length = len(self._output)
+        pos = 0
+        while pos < len(data) and not (max_length and length >= max_length):
+            piece = self._decompressobj.decompress(data[pos : pos + self._STEP])
+            pieces.append(piece)
+            length += len(piece)
+            pos += self._STEP
+        self.unconsumed_tail = data[pos:]
+        output = b"".join(pieces)
+        if max_length:
+            output, self._output = output[:max_length], output[max_length:]
+        else:
+            self._output = b""
+        return output
+
+    def flush(self) -> bytes:
+        output, self._output = self._output, b""
+        return output + self._decompressobj.flush()
+
+
+class ZlibCodec(Codec):
+    codec_id = 1
+    name = "zlib"
+
+    def __init__(self, level: int = zlib.Z_DEFAULT_COMPRESSION) -> None:
+        self.level = level
+
+    def compress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        if dictionary is None:
+            return zlib.compress(data, self.level)
+        compressor = zlib.compressobj(self.level, zdict=dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        decompressor = self.decompressobj(dictionary)
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def decompressobj(self, dictionary: bytes | None = None) -> Decompressor:
+        if dictionary is None:
+            return zlib.decompressobj()
+        return zlib.decompressobj(zdict=dictionary)
+
+
+class ZstdCodec(Codec):
+    codec_id = 2
+    name = "zstd"
+
+    def __init__(self, level: int = 3) -> None:
+        self.level = level
+
+    def _dict_data(self, dictionary: bytes | None) -> zstandard.ZstdCompressionDict:
+        # dictionaries trained by zstd are loaded with their entropy tables, other
+        # ones as raw content
+        return zstandard.ZstdCompressionDict(dictionary)
+
+    def compress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        if dictionary is None:
+            compressor = zstandard.ZstdCompressor(level=self.level)
+        else:
+            compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self._dict_data(dictionary)
+            )
+        return compressor.compress(data)
+
+    def _decompressor(self, dictionary: bytes | None) -> zstandard.ZstdDecompressor:
+        if dictionary is None:
+            return zstandard.ZstdDecompressor()
+        return zstandard.ZstdDecompressor(dict_data=self._dict_data(dictionary))
+
+    def decompress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        return self._decompressor(dictionary).decompress(data)
+
+    def decompressobj(self, dictionary: bytes | None = None) -> Decompressor:
+        return _ZstdDecompressor(self._decompressor(dictionary))
+
+
+class Lz4Codec(Codec):
+    """LZ4 block format, which supports dictionaries (unlike the frame format of
+    the lz4 package) but not streaming."""
+
+    codec_id = 3
+    name = "lz4"
+
+    def __init__(self, level: int = 0) -> None:
+        # 0 is the fast mode, 1-16 the high compression mode
+        self.level = level
+
+    def compress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        kwargs: dict = {"mode": "default"}
+        if self.level:
+            kwargs = {"mode": "high_compression", "compression": self.level}
+        if dictionary is not None:
+            kwargs["dict"] = dictionary
+        return lz4.block.compress(data, store_size=True, **kwargs)
+
+    def decompress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        if dictionary is None:
+            return lz4.block.decompress(data)
+        return lz4.block.decompress(data, dict=dictionary)
+
+
+class ArrowCodec(Codec):
+    """Arrow IPC data (see columnar_blob.py), whose buffers are already compressed
+    by Arrow. The data is stored as is."""
+
+    codec_id = 4
+    name = "raw/arrow"
+
+    def compress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        return data
+
+    def decompress(self, data: bytes, dictionary: bytes | None = None) -> bytes:
+        return data
+
+
+# codecs that can be selected to compress blobs (`BLOB_CODEC`)
+_CODECS: Final[dict[str, type[Codec]]] = {
+    codec.name: codec for codec in [ZlibCodec, ZstdCodec, Lz4Codec]
+}
+_CODECS_BY_ID: Final[dict[int, type[Codec]]] = {
+    codec.codec_id: codec for codec in [*_CODECS.values(), ArrowCodec]
+}
+
+
+def get_codec(name: str, level: int | None = None) -> Codec:
+    """Returns the codec called `name` with the given compression level or its
+    default level. Raises ValueError if the codec is unknown."""
+    if name not in _CODECS:
+        raise ValueError(f"unknown codec: {name}. Supported: {', '.join(_CODECS)}")
+    return _CODECS[name]() if level is None else _CODECS[name](level)
+
+
+@dataclass(frozen=True)
+class CodecDictionary:
+    dictionary_id: int
+    data: bytes
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> CodecDictionary:
+        # 0 is reserved for "no dictionary"
+        digest = hashlib.sha256(data).digest()
+        return cls(max(int.from_bytes(digest[:4], "big"), 1), data)
+
+
+def train_dictionary(samples: list[bytes], size: int = 1 << 16) -> CodecDictionary:
+    """Trains a dictionary of at most `size` bytes on sample blobs (uncompressed).
+    The dictionary can be used by all the codecs. zlib only uses its last 32KB."""
+    data = zstandard.train_dictionary(size, samples).as_bytes()
+    return CodecDictionary.from_bytes(data)
+
+
+@dataclass(frozen=True)
+class BlobHeader:
+    codec: Codec
+    # None if the blob was compressed without a dictionary
+    dictionary_id: int | None
+    # 0 for legacy blobs, which don't have a header
+    size: int
+
+
+def read_header(data: bytes) -> BlobHeader:
+    """Parses the header at the beginning of `data`, which must contain at least
+    `HEADER_SIZE` bytes unless the blob is shorter. Blobs without a header are
+    legacy zlib blobs.
+
+    Raises:
+        ValueError: the codec of the blob is unknown
+    """
+    if len(data) < HEADER_SIZE or not data.startswith(_MAGIC):
+        return BlobHeader(ZlibCodec(), None, 0)
+    _, codec_id, dictionary_id = _HEADER.unpack_from(data)
+    if codec_id not in _CODECS_BY_ID:
+        raise ValueError(f"unknown codec id: {codec_id}")
+    return BlobHeader(_CODECS_BY_ID[codec_id](), dictionary_id or None, HEADER_SIZE)
+
+
+def encode(
+    data: bytes, codec: Codec, dictionary: CodecDictionary | None = None
+) -> bytes:
+    """Compresses `data` and prepends the header"""
+    header = _HEADER.pack(
+        _MAGIC, codec.codec_id, dictionary.dictionary_id if dictionary else 0
+    )
+    return header + codec.compress(data, dictionary.data if dictionary else None)
+
+
+def decode(
+    blob: bytes, get_dictionary: Callable[[int], CodecDictionary] | None = None
+) -> bytes:
+    """Decompresses a blob written by `encode` or a legacy zlib blob.
+
+    Args:
+        get_dictionary: returns the dictionary with the given id. Required to
+            decode blobs compressed with a dictionary.
+    """
+    header = read_header(blob)
+    dictionary = None
+    if header.dictionary_id is not None:
+        if get_dictionary is None:
+            raise ValueError("the blob was compressed with a dictionary")
+        dictionary = get_dictionary(header.dictionary_id).data
+    return header.codec.decompress(blob[header.size :], dictionary)
@@ -0,0 +1,79 @@
+"""In-process caches.
+
+The caches of the app are module or class attributes, so each one is shared by all
+the requests and threads served by a worker process and each worker process has its
+own copy. An entry may therefore be stale with respect to a change made by another
+worker: the TTL of the cache bounds how long such a change can go unnoticed, unless
+the entries are checked against a version that changes with the data (e.g. the
+`properties_version` of a system).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Generic, TypeVar
+
+KeyType = TypeVar("KeyType", bound=Hashable)
+ValueType = TypeVar("ValueType")
+
+
+class TTLCache(Generic[KeyType, ValueType]):
+    """A thread-safe LRU cache whose entries expire after a time-to-live.
+
+    Args:
+        maxsize: maximum number of entries. The least recently used entry is evicted
+            when the cache is full.
+        ttl: default lifetime of an entry in seconds. None means entries never expire.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: OrderedDict[KeyType, tuple[float | None, ValueType]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: KeyType) -> ValueType | None:
+        """Returns the value of `key` or None if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: KeyType, value: ValueType, ttl: float | None = None) -> None:
+        """Stores `value`. `ttl` overrides the default lifetime for this entry."""
+        ttl = self._ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: KeyType) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,163 @@
+"""A blob format for lists of JSON serializable items that supports reading a
+subset of the items without downloading and parsing the whole list.
+
+The items are split into chunks of `chunk_size` items. Each chunk is serialized to
+JSON and compressed on its own with the codec of the storage, and the compressed
+chunks are concatenated into a single blob. A `ChunkIndex` records the offset of
+every chunk within the blob so reading a handful of items only requires ranged
+reads of the chunks that contain them. The index is small and it is stored in the
+DB next to the blob name.
+"""
+from __future__ import annotations
+
+import json
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from explainaboard_web.impl.storage import Storage
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class ChunkIndex:
+    """Locates the chunks of a chunked blob.
+
+    Args:
+        chunk_size: number of items in each chunk. The last chunk may be smaller.
+        num_items: total number of items.
+        offsets: offsets[i] is the position of the first byte of chunk i and
+            offsets[-1] is the position right after the last chunk, which is the
+            size of a chunked blob.
+    """
+
+    chunk_size: int
+    num_items: int
+    offsets: list[int]
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.offsets) - 1
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, dikt: dict[str, Any]) -> ChunkIndex:
+        return cls(
+            chunk_size=dikt["chunk_size"],
+            num_items=dikt["num_items"],
+            offsets=list(dikt["offsets"]),
+        )
+
+
+def _encode_chunk(storage: Storage, items: list) -> bytes:
+    return storage.compress(json.dumps(items).encode())
+
+
+def _decode_chunk(storage: Storage, data: bytes) -> list:
+    return json.loads(storage.decompress(data))
+
+
+def consecutive_runs(sorted_ids: list[int]) -> Iterator[tuple[int, int]]:
+    """Groups sorted unique integers into (first, last) runs of consecutive
+    values."""
+    if not sorted_ids:
+        return
+    first = last = sorted_ids[0]
+    for i in sorted_ids[1:]:
+        if i != last + 1:
+            yield first, last
+            first = i
+        last = i
+    yield first, last
+
+
+def upload_chunked(
+    storage: Storage,
+    blob_name: str,
+    items: list,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> ChunkIndex:
+    """Uploads `items` as a chunked blob and returns its index."""
+    chunks = [
+        _encode_chunk(storage, items[i : i + chunk_size])
+        for i in range(0, len(items), chunk_size)
+    ]
+    offsets = [0]
+    for chunk in chunks:
+        offsets.append(offsets[-1] + len(chunk))
+    storage.upload(blob_name, b"".join(chunks))
+    return ChunkIndex(chunk_size=chunk_size, num_items=len(items), offsets=offsets)
+
+
+def download_chunked(
+    storage: Storage,
+    blob_name: str,
+    index: ChunkIndex,
+    item_ids: list[int] | None,
+) -> list:
+    """Returns the items associated with `item_ids` (or all items if None).
+
+    Only the chunks that contain the requested items are downloaded. Adjacent chunks
+    are fetched with a single ranged read.
+
+    Raises:
+        IndexError: an item_id is out of range. Negative ids are counted from the end
+            like Python list indices.
+    """
+    offsets = index.offsets
+    if item_ids is None:
+        contents = storage.download(blob_name)
+        items: list = []
+        for i in range(index.num_chunks):
+            items.extend(_decode_chunk(storage, contents[offsets[i] : offsets[i + 1]]))
+        return items
+
+    normalized_ids = []
+    for item_id in item_ids:
+        if not -index.num_items <= item_id < index.num_items:
+            raise IndexError(f"item id {item_id} is out of range")
+        normalized_ids.append(item_id % index.num_items)
+
+    chunk_ids = sorted({item_id // index.chunk_size for item_id in normalized_ids})
+    chunks: dict[int, list] = {}
+    for first, last in consecutive_runs(chunk_ids):
+        start = offsets[first]
+        data = storage.download_range(blob_name, start, offsets[last + 1])
+        for chunk_id in range(first, last + 1):
+            chunk = data[offsets[chunk_id] - start : offsets[chunk_id + 1] - start]
+            chunks[chunk_id] = _decode_chunk(storage, chunk)
+    return [
+        chunks[item_id // index.chunk_size][item_id % index.chunk_size]
+        for item_id in normalized_ids
+    ]
+
+
+def iter_chunked(
+    storage: Storage, blob_name: str, index: ChunkIndex, chunks_per_read: int = 16
+) -> Iterator[list]:
+    """Yields the items of a chunked blob one chunk at a time. Each ranged read
+    fetches up to `chunks_per_read` chunks so memory usage is bounded regardless of
+    the size of the blob."""
+    offsets = index.offsets
+    for first in range(0, index.num_chunks, chunks_per_read):
+        last = min(first + chunks_per_read, index.num_chunks)
+        start = offsets[first]
+        data = storage.download_range(blob_name, start, offsets[last])
+        for chunk_id in range(first, last):
+            chunk = data[offsets[chunk_id] - start : offsets[chunk_id + 1] - start]
+            yield _decode_chunk(storage, chunk)
+
+
+def convert_legacy_blob(
+    storage: Storage,
+    legacy_blob_name: str,
+    blob_name: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> ChunkIndex:
+    """Re-uploads a blob that stores the whole list as one compressed JSON document
+    in the chunked format. The legacy blob is left untouched."""
+    items = json.loads(storage.download_and_decompress(legacy_blob_name))
+    return upload_chunked(storage, blob_name, items, chunk_size)
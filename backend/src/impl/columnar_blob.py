@@ -0,0 +1,226 @@
+"""A columnar blob format for lists of dicts that have the same keys, such as the
+analysis cases of a level.
+
+The items are stored as an Arrow IPC stream: every key becomes a typed column
+(nested dicts become struct columns) and the rows are split into record batches of
+`batch_size` rows whose buffers are compressed individually. Like chunked_blob.py,
+a `ChunkIndex` records the offset of every batch within the blob so reading a
+handful of items only requires ranged reads of the schema and of the batches that
+contain them. Only those batches are decompressed and only the requested rows are
+converted back to dicts, so the cost of a read doesn't depend on the size of the
+list.
+
+The blob starts with the header of blob_codecs.py with the `ArrowCodec` codec,
+followed by the Arrow stream.
+"""
+from __future__ import annotations
+
+from collections.abc import Iterator
+from typing import BinaryIO, Final
+
+import pyarrow as pa
+
+from explainaboard_web.impl.blob_codecs import (
+    HEADER_SIZE,
+    ArrowCodec,
+    encode,
+    read_header,
+)
+from explainaboard_web.impl.chunked_blob import ChunkIndex, consecutive_runs
+from explainaboard_web.impl.storage import Storage
+
+DEFAULT_BATCH_SIZE: Final = 1000
+_BATCH_SIZE_KEY: Final = b"batch_size"
+_NUM_ITEMS_KEY: Final = b"num_items"
+
+
+def _has_fields(value: dict, fields: list[pa.Field]) -> bool:
+    """Returns True if `value` has exactly the keys of `fields` and its values are
+    read back unchanged from columns of their types"""
+    return len(value) == len(fields) and all(
+        field.name in value and _matches_type(value[field.name], field.type)
+        for field in fields
+    )
+
+
+def _matches_type(value, value_type: pa.DataType) -> bool:
+    if value is None:
+        return True
+    if pa.types.is_struct(value_type):
+        return _has_fields(value, list(value_type))
+    if pa.types.is_list(value_type):
+        element_type = value_type.value_type
+        if pa.types.is_nested(element_type) or pa.types.is_floating(element_type):
+            return all(_matches_type(element, element_type) for element in value)
+        return True
+    if pa.types.is_floating(value_type):
+        # ints are converted to floats when the same column also has floats
+        return isinstance(value, float)
+    return True
+
+
+def encode_columnar(
+    items: list[dict], batch_size: int = DEFAULT_BATCH_SIZE
+) -> tuple[bytes, ChunkIndex]:
+    """Encodes `items` as an Arrow IPC stream and returns the blob and its index.
+
+    Raises:
+        ValueError: the items can't be stored as typed columns without changing
+            them, e.g. the type of a value varies between items (including ints
+            and floats) or some items don't have all the keys.
+    """
+    try:
+        table = pa.Table.from_pylist(items)
+    except (pa.ArrowException, TypeError) as e:
+        raise ValueError(f"items can't be converted to columns: {e}") from e
+    # the columns are inferred from the first item. Keys missing from other items
+    # would be read back as None and extra keys would be lost. Columns that mix ints
+    # and floats are converted to floats.
+    fields = list(table.schema)
+    if not all(_has_fields(item, fields) for item in items):
+        raise ValueError("items don't have the same keys and value types")
+    schema = table.schema.with_metadata(
+        {_BATCH_SIZE_KEY: str(batch_size), _NUM_ITEMS_KEY: str(len(items))}
+    )
+    table = table.replace_schema_metadata(schema.metadata)
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    num_batches = 0
+    with pa.ipc.new_stream(sink, schema, options=options) as writer:
+        for start in range(0, len(items), batch_size):
+            # one record batch per slice
+            writer.write_table(table.slice(start, batch_size).combine_chunks())
+            num_batches += 1
+    arrow_data = sink.getvalue()
+
+    # the offsets are read back from the messages of the stream
+    stream = pa.BufferReader(arrow_data)
+    pa.ipc.read_message(stream)
+    offsets = [HEADER_SIZE + stream.tell()]
+    for _ in range(num_batches):
+        pa.ipc.read_message(stream)
+        offsets.append(HEADER_SIZE + stream.tell())
+    index = ChunkIndex(chunk_size=batch_size, num_items=len(items), offsets=offsets)
+    return encode(arrow_data.to_pybytes(), ArrowCodec()), index
+
+
+def _check_header(data: bytes) -> None:
+    """Raises ValueError if `data` is not the beginning of a columnar blob"""
+    header = read_header(data)
+    if not isinstance(header.codec, ArrowCodec):
+        raise ValueError(f"not a columnar blob: {header.codec.name} codec")
+
+
+def _read_schema(data: bytes) -> pa.Schema:
+    """Reads the schema from the beginning of a columnar blob"""
+    _check_header(data)
+    return pa.ipc.read_schema(pa.py_buffer(data)[HEADER_SIZE:])
+
+
+def _rows_by_batch(
+    item_ids: list[int], num_items: int, batch_size: int
+) -> tuple[list[int], dict[int, list[int]]]:
+    """Returns the normalized item ids and batch id -> row ids within the batch.
+
+    Raises:
+        IndexError: an item_id is out of range. Negative ids are counted from the end
+            like Python list indices.
+    """
+    rows: dict[int, list[int]] = {}
+    normalized_ids = []
+    for item_id in item_ids:
+        if not -num_items <= item_id < num_items:
+            raise IndexError(f"item id {item_id} is out of range")
+        item_id %= num_items
+        normalized_ids.append(item_id)
+        rows.setdefault(item_id // batch_size, []).append(item_id % batch_size)
+    return normalized_ids, rows
+
+
+def _take(
+    batches: dict[int, pa.RecordBatch],
+    normalized_ids: list[int],
+    rows: dict[int, list[int]],
+    batch_size: int,
+) -> list[dict]:
+    """Converts the requested rows of the decoded batches to dicts"""
+    items: dict[int, dict] = {}
+    for batch_id, row_ids in rows.items():
+        batch = batches[batch_id]
+        for row_id, item in zip(row_ids, batch.take(row_ids).to_pylist()):
+            items[batch_id * batch_size + row_id] = item
+    return [items[item_id] for item_id in normalized_ids]
+
+
+def decode_columnar(data: bytes, item_ids: list[int] | None) -> list[dict]:
+    """Returns the items associated with `item_ids` (or all items if None) from a
+    whole blob. Batches that don't contain requested items are skipped without
+    being decompressed.
+
+    Raises:
+        IndexError: an item_id is out of range. Negative ids are counted from the end
+            like Python list indices.
+        ValueError: the blob is not a columnar blob
+    """
+    _check_header(data)
+    arrow_data = pa.py_buffer(data)[HEADER_SIZE:]
+    if item_ids is None:
+        return pa.ipc.open_stream(arrow_data).read_all().to_pylist()
+
+    stream = pa.BufferReader(arrow_data)
+    schema = pa.ipc.read_schema(pa.ipc.read_message(stream))
+
+    batch_size = int(schema.metadata[_BATCH_SIZE_KEY])
+    num_items = int(schema.metadata[_NUM_ITEMS_KEY])
+    normalized_ids, rows = _rows_by_batch(item_ids, num_items, batch_size)
+    batches: dict[int, pa.RecordBatch] = {}
+    for batch_id in range(max(rows, default=-1) + 1):
+        message = pa.ipc.read_message(stream)
+        if batch_id in rows:
+            batches[batch_id] = pa.ipc.read_record_batch(message, schema)
+    return _take(batches, normalized_ids, rows, batch_size)
+
+
+def download_columnar(
+    storage: Storage,
+    blob_name: str,
+    index: ChunkIndex,
+    item_ids: list[int] | None,
+) -> list[dict]:
+    """Same as `decode_columnar` but only the schema and the batches that contain
+    the requested items are downloaded. Adjacent batches are fetched with a single
+    ranged read and the schema is fetched with the first batch if it is requested.
+    """
+    if item_ids is None:
+        return decode_columnar(storage.download(blob_name), None)
+
+    offsets = index.offsets
+    normalized_ids, rows = _rows_by_batch(item_ids, index.num_items, index.chunk_size)
+    runs = list(consecutive_runs(sorted(rows)))
+    schema = None
+    if not runs or runs[0][0] != 0:
+        schema = _read_schema(storage.download_range(blob_name, 0, offsets[0]))
+    batches: dict[int, pa.RecordBatch] = {}
+    for first, last in runs:
+        start = 0 if first == 0 else offsets[first]
+        data = storage.download_range(blob_name, start, offsets[last + 1])
+        if schema is None:
+            schema = _read_schema(data)
+        for batch_id in range(first, last + 1):
+            batch_data = pa.py_buffer(data)[
+                offsets[batch_id] - start : offsets[batch_id + 1] - start
+            ]
+            batches[batch_id] = pa.ipc.read_record_batch(batch_data, schema)
+    return _take(batches, normalized_ids, rows, index.chunk_size)
+
+
+def iter_columnar(f: BinaryIO) -> Iterator[dict]:
+    """Yields the items of a blob opened for streaming reads (e.g. by
+    `Storage.open`) one at a time. Only one batch is read and decoded at a time.
+
+    Raises:
+        ValueError: the blob is not a columnar blob
+    """
+    _check_header(f.read(HEADER_SIZE))
+    for batch in pa.ipc.open_stream(f):
+        yield from batch.to_pylist()
@@ -0,0 +1,75 @@
+"""Helpers to run the work of one request concurrently."""
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import TypeVar
+
+from flask import current_app, g
+
+ItemType = TypeVar("ItemType")
+ResultType = TypeVar("ResultType")
+
+
+def map_in_threads(
+    fn: Callable[[ItemType], ResultType],
+    items: Iterable[ItemType],
+    max_workers: int,
+) -> list[ResultType]:
+    """Applies `fn` to `items` with at most `max_workers` threads and returns the
+    results in order. If `max_workers` <= 1, `fn` runs in the calling thread.
+
+    `fn` runs in an app context that shares the globals (`g`) of the caller, so the
+    DB client, the storage client and the logged in user of the request are reused.
+    Exceptions raised by `fn` are re-raised in the caller.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    app = current_app._get_current_object()  # type: ignore
+    request_globals = dict(vars(g))
+
+    def run(item: ItemType) -> ResultType:
+        with app.app_context():
+            vars(g).update(request_globals)
+            return fn(item)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(run, items))
+
+
+class StageTimer:
+    """Records how long each stage of the work on each item of a request takes so
+    it can be reported in a `Server-Timing` response header. Thread-safe."""
+
+    def __init__(self) -> None:
+        self._durations: dict[tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, item: str, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                key = (item, stage)
+                self._durations[key] = self._durations.get(key, 0) + duration
+
+    def durations(self) -> dict[tuple[str, str], float]:
+        """(item, stage) -> seconds"""
+        with self._lock:
+            return dict(self._durations)
+
+    def to_server_timing(self) -> str:
+        """Formats the durations (in milliseconds) as a Server-Timing header value,
+        e.g. `refresh;desc="sys1";dur=12.5, analyses;desc="sys1";dur=40.1`"""
+        return ", ".join(
+            f'{stage};desc="{item}";dur={duration * 1000:.1f}'
+            for (item, stage), duration in self.durations().items()
+        )
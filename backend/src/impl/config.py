@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import os
 
 from dotenv import load_dotenv
@@ -5,7 +7,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _optional_int(value: str | None) -> int | None:
+    return int(value) if value else None
+
+
 class Config:
+    # variables that are empty (e.g. `X=` as in .env.example) get the default value
     def __init__(self) -> None:
         self.SECRET_KEY = os.urandom(12)
         self.DEBUG = False
@@ -14,7 +21,78 @@ class Config:
         self.AWS_SECRET_ACCESS_KEY = os.environ["AWS_SECRET_ACCESS_KEY"]
         self.AWS_DEFAULT_REGION = os.environ["AWS_DEFAULT_REGION"]
 
-        self.STORAGE_BUCKET_NAME = os.environ["STORAGE_BUCKET_NAME"]
+        # where blobs are stored: "gcs" (the STORAGE_BUCKET_NAME bucket),
+        # "filesystem" (files under STORAGE_DIR) or "memory" (lost on restart, for
+        # tests)
+        self.STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND") or "gcs"
+        self.STORAGE_BUCKET_NAME = os.environ.get("STORAGE_BUCKET_NAME")
+        self.STORAGE_DIR = os.environ.get("STORAGE_DIR")
+        # local cache of downloaded blobs, shared by all workers on the host. The
+        # default directory is under the explainaboard cache dir. Set the size to 0
+        # to disable the cache.
+        self.BLOB_CACHE_DIR = os.environ.get("BLOB_CACHE_DIR")
+        self.BLOB_CACHE_MAX_BYTES = int(
+            os.environ.get("BLOB_CACHE_MAX_BYTES") or 2 * 1024**3
+        )
+
+        # compression of the blobs (zlib, zstd or lz4), its level (optional) and the
+        # id (hex) of a dictionary uploaded by scripts/perf_blob_codecs.py
+        # (optional). Blobs record their codec so changing it doesn't affect
+        # existing blobs.
+        self.BLOB_CODEC = os.environ.get("BLOB_CODEC") or "zlib"
+        self.BLOB_CODEC_LEVEL = _optional_int(os.environ.get("BLOB_CODEC_LEVEL"))
+        dictionary_id = os.environ.get("BLOB_CODEC_DICTIONARY")
+        self.BLOB_CODEC_DICTIONARY = int(dictionary_id, 16) if dictionary_id else None
+
+        # connections of the HTTP pool of the storage client and the maximum number
+        # of blobs transferred concurrently by each worker process
+        self.STORAGE_HTTP_POOL_SIZE = int(
+            os.environ.get("STORAGE_HTTP_POOL_SIZE") or 32
+        )
+        self.STORAGE_TRANSFER_WORKERS = int(
+            os.environ.get("STORAGE_TRANSFER_WORKERS") or 8
+        )
+
+        # number of threads that load and analyze the systems of /systems/analyses.
+        # 0 runs everything serially in the request thread.
+        self.ANALYSIS_THREAD_WORKERS = int(
+            os.environ.get("ANALYSIS_THREAD_WORKERS") or 0
+        )
+
+        # number of threads that process systems submitted with
+        # `async_processing`. 0 (the default) disables background jobs and
+        # processes all systems in the request thread.
+        self.SYSTEM_JOB_WORKERS = int(os.environ.get("SYSTEM_JOB_WORKERS") or 0)
+        # systems that are still pending or processing this long after they were
+        # submitted are marked as failed. Their job was lost, e.g. because the
+        # worker that ran it exited.
+        self.SYSTEM_JOB_TIMEOUT_SECONDS = int(
+            os.environ.get("SYSTEM_JOB_TIMEOUT_SECONDS") or 3600
+        )
+
+        # mongo client. There is one client (and connection pool) per worker process.
+        # Timeouts are in milliseconds. Unset values use the pymongo defaults.
+        self.DB_MAX_POOL_SIZE = int(os.environ.get("DB_MAX_POOL_SIZE") or 100)
+        self.DB_MIN_POOL_SIZE = int(os.environ.get("DB_MIN_POOL_SIZE") or 0)
+        self.DB_MAX_IDLE_TIME_MS = _optional_int(os.environ.get("DB_MAX_IDLE_TIME_MS"))
+        self.DB_WAIT_QUEUE_TIMEOUT_MS = _optional_int(
+            os.environ.get("DB_WAIT_QUEUE_TIMEOUT_MS")
+        )
+        self.DB_CONNECT_TIMEOUT_MS = int(
+            os.environ.get("DB_CONNECT_TIMEOUT_MS") or 20000
+        )
+        self.DB_SERVER_SELECTION_TIMEOUT_MS = int(
+            os.environ.get("DB_SERVER_SELECTION_TIMEOUT_MS") or 30000
+        )
+        self.DB_SOCKET_TIMEOUT_MS = _optional_int(
+            os.environ.get("DB_SOCKET_TIMEOUT_MS")
+        )
+        # primary, primaryPreferred, secondary, secondaryPreferred or nearest. Only
+        # applies to queries (listings, lookups by email, ...), which may miss a
+        # write made a moment before on other preferences. Reads by id and
+        # transactions always use the primary because they must see the latest
+        # writes (see `DBUtils.find_one_by_id`).
+        self.DB_READ_PREFERENCE = os.environ.get("DB_READ_PREFERENCE") or "primary"
 
         # firebase
         self.AUTH_AUDIENCE = os.environ["AUTH_AUDIENCE"]
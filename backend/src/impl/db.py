@@ -1,18 +1,134 @@
-from flask import current_app, g
-from flask_pymongo import PyMongo
+from __future__ import annotations
 
+import os
+import threading
 
-def get_db():
+from flask import current_app
+from pymongo import MongoClient
+from pymongo.monitoring import (
+    ConnectionCheckedInEvent,
+    ConnectionCheckedOutEvent,
+    ConnectionCheckOutFailedEvent,
+    ConnectionCheckOutStartedEvent,
+    ConnectionClosedEvent,
+    ConnectionCreatedEvent,
+    ConnectionPoolListener,
+    ConnectionReadyEvent,
+    PoolClearedEvent,
+    PoolClosedEvent,
+    PoolCreatedEvent,
+)
+
+
+class PoolStats(ConnectionPoolListener):
+    """Counts the connection pool events of a client. Thread-safe."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = 0
+        self._checked_out = 0
+        self._waiting = 0
+        self._check_out_failed = 0
+
+    def _add(self, **deltas: int) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, f"_{name}", getattr(self, f"_{name}") + delta)
+
+    def connection_created(self, event: ConnectionCreatedEvent) -> None:
+        self._add(created=1)
+
+    def connection_closed(self, event: ConnectionClosedEvent) -> None:
+        self._add(closed=1)
+
+    def connection_check_out_started(
+        self, event: ConnectionCheckOutStartedEvent
+    ) -> None:
+        self._add(waiting=1)
+
+    def connection_checked_out(self, event: ConnectionCheckedOutEvent) -> None:
+        self._add(waiting=-1, checked_out=1)
+
+    def connection_check_out_failed(self, event: ConnectionCheckOutFailedEvent) -> None:
+        self._add(waiting=-1, check_out_failed=1)
+
+    def connection_checked_in(self, event: ConnectionCheckedInEvent) -> None:
+        self._add(checked_out=-1)
+
+    def connection_ready(self, event: ConnectionReadyEvent) -> None:
+        pass
+
+    def pool_created(self, event: PoolCreatedEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: PoolClearedEvent) -> None:
+        pass
+
+    def pool_closed(self, event: PoolClosedEvent) -> None:
+        pass
+
+    def stats(self) -> dict[str, int]:
+        """`checked_out` and `waiting` are the current numbers of connections in use
+        and of threads waiting for one. The others are totals."""
+        with self._lock:
+            return {
+                "pool_connections_created": self._created,
+                "pool_connections_closed": self._closed,
+                "pool_checked_out": self._checked_out,
+                "pool_waiting": self._waiting,
+                "pool_check_out_failed": self._check_out_failed,
+            }
+
+
+_client: MongoClient | None = None
+_client_key: tuple | None = None
+_pool_stats = PoolStats()
+_client_lock = threading.Lock()
+
+
+def get_db() -> MongoClient:
     """
-    returns the global db instance. a PyMongo instance is created if not present in g.
+    returns the client of the current process. It is created on first use so each
+    gunicorn worker creates its own client after the fork (a client must not be
+    shared by forked processes). All the requests and threads of a process share the
+    client and its connection pool.
     """
-    db = getattr(g, "_database", None)
-    if db is None:
-        uri: str = current_app.config.get("DATABASE_URI")
-        username: str = current_app.config.get("DB_USERNAME")
-        password: str = current_app.config.get("DB_PASSWORD")
-        uri = uri.replace("<username>", username)
-        uri = uri.replace("<password>", password)
-
-        db = g._database = PyMongo(current_app, uri=uri)
-    return db
+    global _client, _client_key, _pool_stats
+    config = current_app.config
+    uri: str = config.get("DATABASE_URI")
+    username: str = config.get("DB_USERNAME")
+    password: str = config.get("DB_PASSWORD")
+    uri = uri.replace("<username>", username)
+    uri = uri.replace("<password>", password)
+    options = {
+        "maxPoolSize": config.get("DB_MAX_POOL_SIZE", 100),
+        "minPoolSize": config.get("DB_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": config.get("DB_MAX_IDLE_TIME_MS"),
+        "waitQueueTimeoutMS": config.get("DB_WAIT_QUEUE_TIMEOUT_MS"),
+        "connectTimeoutMS": config.get("DB_CONNECT_TIMEOUT_MS", 20000),
+        "serverSelectionTimeoutMS": config.get("DB_SERVER_SELECTION_TIMEOUT_MS", 30000),
+        "socketTimeoutMS": config.get("DB_SOCKET_TIMEOUT_MS"),
+        "readPreference": config.get("DB_READ_PREFERENCE", "primary"),
+    }
+    key = (os.getpid(), uri, tuple(sorted(options.items())))
+    with _client_lock:
+        if _client is None or _client_key != key:
+            if _client is not None and _client_key and _client_key[0] == key[0]:
+                # the config changed. The client of the parent process (after a
+                # fork) is abandoned rather than closed because the parent still
+                # uses its sockets.
+                _client.close()
+            _pool_stats = PoolStats()
+            _client = MongoClient(
+                uri,
+                event_listeners=[_pool_stats],
+                **{name: value for name, value in options.items() if value is not None},
+            )
+            _client_key = key
+        return _client
+
+
+def get_pool_stats() -> dict[str, int]:
+    """connection pool statistics of the client of the current process"""
+    return _pool_stats.stats()
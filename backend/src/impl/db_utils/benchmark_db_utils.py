@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import datetime
+import hashlib
+import itertools
 import json
 import logging
 import os
@@ -9,14 +11,18 @@ from typing import Any
 
 import numpy as np
 import pandas as pd
-from explainaboard.utils.cache_api import get_cache_dir, open_cached_file
+from explainaboard.utils.cache_api import get_cache_dir, sanitize_path
+from explainaboard.utils.typing_utils import unwrap
 from pandas import Series
 
 from explainaboard_web.impl.auth import get_user
 from explainaboard_web.impl.constants import ALL_LANG, LING_WEIGHT, POP_WEIGHT
 from explainaboard_web.impl.db_utils.dataset_db_utils import DatasetDBUtils
-from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.db_utils.db_utils import CountMode, DBUtils
 from explainaboard_web.impl.db_utils.system_db_utils import SystemDBUtils
+from explainaboard_web.impl.db_utils.system_generation_db_utils import (
+    SystemGenerationDBUtils,
+)
 from explainaboard_web.impl.db_utils.user_db_utils import UserDBUtils
 from explainaboard_web.impl.internal_models.system_model import SystemModel
 from explainaboard_web.impl.utils import abort_with_error_message
@@ -36,6 +42,8 @@ class BenchmarkDBUtils:
 
     _SPECIAL_WEIGHT_MAPS = {"pop_weight": POP_WEIGHT, "ling_weight": LING_WEIGHT}
     _DEFAULT_SETS = {"all_lang": ALL_LANG}
+    # bumped when the format of the persisted plots changes
+    _PLOT_STATE_VERSION = 2
 
     @staticmethod
     def _update_with_not_none_values(dest: dict, source: dict) -> None:
@@ -71,7 +79,10 @@ class BenchmarkDBUtils:
 
         filt = {"$and": and_list}
         cursor, _ = DBUtils.find(
-            DBUtils.BENCHMARK_METADATA, filt=filt, limit=page * page_size
+            DBUtils.BENCHMARK_METADATA,
+            filt=filt,
+            limit=page * page_size,
+            count=CountMode.NONE,
         )
 
         config_dicts = []
@@ -120,7 +131,9 @@ class BenchmarkDBUtils:
 
     @staticmethod
     def find_configs_featured() -> list[BenchmarkConfig]:
-        cursor, _ = DBUtils.find(DBUtils.BENCHMARK_FEATURED_LIST, limit=1)
+        cursor, _ = DBUtils.find(
+            DBUtils.BENCHMARK_FEATURED_LIST, limit=1, count=CountMode.NONE
+        )
         cursor_list = list(cursor)
         if len(cursor_list) < 1:
             abort_with_error_message(500, "featured list not found")
@@ -182,6 +195,8 @@ class BenchmarkDBUtils:
 
     @staticmethod
     def load_sys_infos(config: BenchmarkConfig) -> list[SystemModel]:
+        """Returns the public systems of a benchmark. Private systems are left out
+        because leaderboards and plots are persisted and served to all users."""
         if config.system_query is not None:
             systems_return = SystemDBUtils.find_systems(
                 dataset_name=config.system_query.get("dataset_name"),
@@ -191,6 +206,8 @@ class BenchmarkDBUtils:
                 target_language=config.system_query.get("target_language"),
                 page=0,
                 page_size=0,
+                count=CountMode.NONE,
+                public_only=True,
             )
         elif config.datasets is not None:
             dataset_list = []
@@ -200,7 +217,11 @@ class BenchmarkDBUtils:
                 dataset_split = record.get("dataset_split", "test")
                 dataset_list.append((dataset_name, subdataset_name, dataset_split))
             systems_return = SystemDBUtils.find_systems(
-                page=0, page_size=0, dataset_list=dataset_list
+                page=0,
+                page_size=0,
+                dataset_list=dataset_list,
+                count=CountMode.NONE,
+                public_only=True,
             )
         else:
             raise ValueError("system_query or datasets must be set by each benchmark")
@@ -213,13 +234,52 @@ class BenchmarkDBUtils:
         return NotImplementedError
 
     @staticmethod
-    def generate_dataframe_from_sys_infos(
+    def _dataset_key(dataset_config: dict) -> tuple[str, str | None, str]:
+        return (
+            dataset_config["dataset_name"],
+            dataset_config.get("sub_dataset", None),
+            dataset_config.get("split", "test"),
+        )
+
+    @staticmethod
+    def _system_dataset_key(sys: SystemModel) -> tuple[str, str | None, str]:
+        return (sys.dataset.dataset_name, sys.dataset.sub_dataset, sys.dataset.split)
+
+    @staticmethod
+    def _dataset_configs(
         benchmark_config: BenchmarkConfig, systems: list[SystemModel]
+    ) -> list[dict]:
+        """
+        :return: the datasets of the benchmark config if it lists them, otherwise
+            the datasets of `systems` in order of appearance
+        """
+        if benchmark_config.datasets:
+            return [dict(x) for x in benchmark_config.datasets]
+        dataset_tuples = dict.fromkeys(
+            BenchmarkDBUtils._system_dataset_key(x) for x in systems
+        )
+        return [
+            {"dataset_name": x, "sub_dataset": y, "split": z}
+            for x, y, z in dataset_tuples
+        ]
+
+    @staticmethod
+    def generate_dataframe_from_sys_infos(
+        benchmark_config: BenchmarkConfig,
+        systems: list[SystemModel],
+        dataset_metadata_cache: dict[tuple, DatasetMetadata | None] | None = None,
+        dataset_configs: list[dict] | None = None,
     ):
         """
         Generate a leaderboard from a list of system_output_info:SysOutputInfo
         :param config: A benchmark config
         :param systems: A list of SystemModel
+        :param dataset_metadata_cache: (dataset_name, sub_dataset) -> metadata.
+            Filled with the datasets looked up in the DB so that callers building
+            several dataframes for the same benchmark only look up each dataset once.
+        :param dataset_configs: the datasets that each system has rows for (see
+            `_dataset_configs`). Defaults to the datasets of the benchmark or of
+            `systems`.
         :return: leaderboard:Leaderboard
         """
         # --- Get df entries
@@ -229,46 +289,27 @@ class BenchmarkDBUtils:
         #                incomplete. Should be fixed.
 
         # --- Collect each dataset to be included in the benchmark
-        # Get from configuration if it exists
-        if benchmark_config.datasets:
-            dataset_configs = [dict(x) for x in benchmark_config.datasets]
-            dataset_to_id = {
-                (
-                    x["dataset_name"],
-                    x.get("sub_dataset", None),
-                    x.get("split", "test"),
-                ): i
-                for i, x in enumerate(dataset_configs)
-            }
-            systems = [
-                x
-                for x in systems
-                if (x.dataset.dataset_name, x.dataset.sub_dataset, x.dataset.split)
-                in dataset_to_id
-            ]
-        # Collect (and deduplicate) all datasets from system infos otherwise
-        else:
-            dataset_tuples = list(
-                {
-                    (x.dataset.dataset_name, x.dataset.sub_dataset, x.dataset.split)
-                    for x in systems
-                }
+        if dataset_configs is None:
+            dataset_configs = BenchmarkDBUtils._dataset_configs(
+                benchmark_config, systems
             )
-            dataset_configs = [
-                {"dataset_name": x, "sub_dataset": y, "split": z}
-                for x, y, z in dataset_tuples
-            ]
-            dataset_to_id = {
-                (
-                    x["dataset_name"],
-                    x.get("sub_dataset", None),
-                    x.get("split", "test"),
-                ): i
-                for i, x in enumerate(dataset_configs)
-            }
+        dataset_to_id = {
+            BenchmarkDBUtils._dataset_key(x): i for i, x in enumerate(dataset_configs)
+        }
+        systems = [
+            x
+            for x in systems
+            if BenchmarkDBUtils._system_dataset_key(x) in dataset_to_id
+        ]
 
         dataset_metadatas: list[DatasetMetadata | None] = []
         for x in dataset_configs:
+            dataset_key = (x["dataset_name"], x.get("sub_dataset", None))
+            if dataset_metadata_cache is not None and (
+                dataset_key in dataset_metadata_cache
+            ):
+                dataset_metadatas.append(dataset_metadata_cache[dataset_key])
+                continue
             dataset_return = DatasetDBUtils.find_datasets(
                 dataset_name=x["dataset_name"],
                 sub_dataset=x.get("sub_dataset", None),
@@ -282,6 +323,8 @@ class BenchmarkDBUtils:
                     f'{x["dataset_name"]}, {x.get("sub_dataset", None)}'
                 )
                 dataset_metadatas.append(None)
+            if dataset_metadata_cache is not None:
+                dataset_metadata_cache[dataset_key] = dataset_metadatas[-1]
 
         # --- Rearrange so we have each system's result over each dataset
         system_dataset_results: dict[str, list[SystemModel | None]] = {}
@@ -289,9 +332,7 @@ class BenchmarkDBUtils:
             sys_name = sys.system_name
             if sys_name not in system_dataset_results:
                 system_dataset_results[sys_name] = [None for _ in dataset_configs]
-            dataset_id = dataset_to_id[
-                (sys.dataset.dataset_name, sys.dataset.sub_dataset, sys.dataset.split)
-            ]
+            dataset_id = dataset_to_id[BenchmarkDBUtils._system_dataset_key(sys)]
             system_dataset_results[sys_name][dataset_id] = sys
 
         system_to_creator: dict[str, str] = {
@@ -300,40 +341,41 @@ class BenchmarkDBUtils:
 
         # --- Set up the columns of the dataframe
         # Default dataset information columns
-        df_input: dict[str, list] = {
-            "system_name": [],
-            "dataset_name": [],
-            "sub_dataset": [],
-            "dataset_split": [],
-            "creator": [],
-        }
+        columns = ["system_name", "dataset_name", "sub_dataset", "dataset_split"]
+        columns += ["creator"]
         # Extra dataset information columns needed by datasets or operations
         exclude_keys = ["metrics"] + list(BenchmarkDBUtils._SPECIAL_WEIGHT_MAPS.keys())
         for dataset_config in dataset_configs:
             for dataset_key in dataset_config.keys():
-                if not (dataset_key in df_input or dataset_key in exclude_keys):
-                    df_input[dataset_key] = []
+                if not (dataset_key in columns or dataset_key in exclude_keys):
+                    columns.append(dataset_key)
         for view in benchmark_config.views:
             for operation in view.operations:
                 op_keys = [operation.get("weight")] + operation.get("group_by", [])
                 for op_key in op_keys:
-                    if op_key and not (op_key in df_input or op_key in exclude_keys):
-                        df_input[op_key] = []
-
+                    if op_key and not (op_key in columns or op_key in exclude_keys):
+                        columns.append(op_key)
         # Columns regarding metric scores
-        df_input["metric"] = []
-        df_input["metric_weight"] = []
-        df_input["score"] = []
-
-        # --- Create the actual data
-        for sys_name, systems in system_dataset_results.items():
-            for dataset_config, dataset_metadata, sys in zip(
-                dataset_configs, dataset_metadatas, systems
+        columns += ["metric", "metric_weight", "score"]
+        # Columns whose values depend on the system
+        system_columns = {"system_name", "creator", "metric", "metric_weight", "score"}
+
+        # --- Collect the values that only depend on the dataset
+        # Each system has one row for each metric of each dataset, and the rows of
+        # a system are ordered the same way. `block` holds the values of these rows
+        # for the columns that don't depend on the system.
+        block: dict[str, list] = {k: [] for k in columns if k not in system_columns}
+        block_metrics: list[str] = []
+        block_weights: list[float] = []
+        block_defaults: list[float] = []
+        # dataset id of each row of the block
+        block_dataset_ids: list[int] = []
+        if system_dataset_results:
+            for dataset_id, (dataset_config, dataset_metadata) in enumerate(
+                zip(dataset_configs, dataset_metadatas)
             ):
                 if dataset_metadata is None:
                     continue
-                column_dict = dict(dataset_config)
-                column_dict["system_name"] = sys_name
                 dataset_metrics: list[BenchmarkMetric] = dataset_config.get(
                     "metrics", benchmark_config.metrics
                 )
@@ -341,97 +383,135 @@ class BenchmarkDBUtils:
                     raise ValueError(
                         f"metrics must be specified either on a global or "
                         f'local level, but {dataset_config["dataset_name"]} -- '
-                        f'{dataset_config["sub_dataset"]} -- '
-                        f'{dataset_config["dataset_split"]} specified neither'
+                        f'{dataset_config.get("sub_dataset")} -- '
+                        f'{dataset_config.get("dataset_split")} specified neither'
                     )
+                for df_key in block:
+                    info = BenchmarkDBUtils._dataset_column_value(
+                        df_key, dataset_config, dataset_metadata
+                    )
+                    block[df_key] += [info] * len(dataset_metrics)
                 for dataset_metric in dataset_metrics:
                     if type(dataset_metric) != dict:
                         dataset_metric = dataset_metric.to_dict()
-                    column_dict["metric"] = dataset_metric["name"]
-                    column_dict["metric_weight"] = dataset_metric.get(
-                        "weight", 1.0 / len(dataset_metrics)
+                    block_metrics.append(dataset_metric["name"])
+                    block_weights.append(
+                        dataset_metric.get("weight", 1.0 / len(dataset_metrics))
                     )
-                    if sys is not None:
-
-                        column_dict["creator"] = sys.creator
-                        matching_results = []
-                        for level, m in sys.results.items():
-                            for k, v in m.items():
-                                if k == dataset_metric["name"]:
-                                    matching_results.append(v)
-                        if len(matching_results) == 0:
-                            performance = None
-                        else:
-                            performance = max(matching_results)
-                        column_dict["score"] = (
-                            performance
-                            if performance
-                            else (dataset_metric.get("default") or 0.0)
-                        )
-                    else:
-                        column_dict["creator"] = system_to_creator[sys_name]
-                        column_dict["score"] = dataset_metric.get("default") or 0.0
-                    for df_key, df_arr in df_input.items():
-                        if df_key in column_dict:
-                            info = column_dict[df_key]
-                        elif df_key == "sub_dataset":
-                            info = None
-                        elif df_key == "dataset_split":
-                            info = "test"
-                        elif df_key == "source_language":
-                            if len(dataset_metadata.languages) == 0:
-                                logging.getLogger().warning(
-                                    f"No languages found for "
-                                    f"{dataset_metadata.dataset_name}."
-                                )
-                                info = "eng"
-                            else:
-                                info = dataset_metadata.languages[0]
-                        elif df_key == "target_language":
-                            if len(dataset_metadata.languages) == 0:
-                                logging.getLogger().warning(
-                                    f"No languages found for "
-                                    f"{dataset_metadata.dataset_name}."
-                                )
-                                info = "eng"
-                            else:
-                                info = dataset_metadata.languages[-1]
-                        else:
-                            logging.getLogger().warning(
-                                f"No {df_key} found for "
-                                f"{dataset_metadata.dataset_name}."
-                            )
-                            info = None
-                        df_arr.append(info)
+                    block_defaults.append(dataset_metric.get("default") or 0.0)
+                    block_dataset_ids.append(dataset_id)
+
+        num_systems = len(system_dataset_results)
+        block_size = len(block_metrics)
+        if num_systems * block_size == 0:
+            return pd.DataFrame({k: [] for k in columns})
+
+        # --- Look up the scores and creators of each system
+        block_dataset_ids_arr = np.array(block_dataset_ids)
+        # dataset id -> the metrics of the dataset and the position of its rows
+        dataset_rows: dict[int, tuple[int, list[str]]] = {}
+        for j, (dataset_id, metric_name) in enumerate(
+            zip(block_dataset_ids, block_metrics)
+        ):
+            dataset_rows.setdefault(dataset_id, (j, []))[1].append(metric_name)
+        scores = np.tile(np.array(block_defaults, dtype=np.float64), (num_systems, 1))
+        creators = np.empty((num_systems, block_size), dtype=object)
+        for i, (sys_name, sys_results) in enumerate(system_dataset_results.items()):
+            dataset_creators = np.array(
+                [
+                    system_to_creator[sys_name] if sys is None else sys.creator
+                    for sys in sys_results
+                ],
+                dtype=object,
+            )
+            creators[i] = dataset_creators[block_dataset_ids_arr]
+            for dataset_id, (start, metric_names) in dataset_rows.items():
+                sys = sys_results[dataset_id]
+                if sys is None:
+                    continue
+                metric_to_score = BenchmarkDBUtils._best_scores(sys)
+                for j, metric_name in enumerate(metric_names, start):
+                    performance = metric_to_score.get(metric_name)
+                    if performance:
+                        scores[i, j] = performance
+
+        # --- Assemble the columns
+        df_input: dict[str, Any] = {}
+        for df_key in columns:
+            if df_key == "system_name":
+                column = np.repeat(
+                    np.array(list(system_dataset_results), dtype=object), block_size
+                )
+            elif df_key == "creator":
+                column = creators.reshape(-1)
+            elif df_key == "metric":
+                column = np.tile(np.array(block_metrics, dtype=object), num_systems)
+            elif df_key == "metric_weight":
+                column = np.tile(pd.Series(block_weights).to_numpy(), num_systems)
+            elif df_key == "score":
+                column = scores.reshape(-1)
+            else:
+                # infer the dtype the same way pandas does for a list of values
+                column = np.tile(pd.Series(block[df_key]).to_numpy(), num_systems)
+            df_input[df_key] = column
         return pd.DataFrame(df_input)
 
+    @staticmethod
+    def _best_scores(sys: SystemModel) -> dict[str, float]:
+        """:return: metric name -> the best score of the metric over all levels"""
+        metric_to_score: dict[str, float] = {}
+        for level, m in sys.results.items():
+            for k, v in m.items():
+                if k not in metric_to_score or v > metric_to_score[k]:
+                    metric_to_score[k] = v
+        return metric_to_score
+
+    @staticmethod
+    def _dataset_column_value(
+        df_key: str, dataset_config: dict, dataset_metadata: DatasetMetadata
+    ) -> Any:
+        """The value of a column that only depends on the dataset"""
+        if df_key in dataset_config:
+            return dataset_config[df_key]
+        elif df_key == "sub_dataset":
+            return None
+        elif df_key == "dataset_split":
+            return "test"
+        elif df_key in {"source_language", "target_language"}:
+            if len(dataset_metadata.languages) == 0:
+                logging.getLogger().warning(
+                    f"No languages found for {dataset_metadata.dataset_name}."
+                )
+                return "eng"
+            elif df_key == "source_language":
+                return dataset_metadata.languages[0]
+            else:
+                return dataset_metadata.languages[-1]
+        logging.getLogger().warning(
+            f"No {df_key} found for {dataset_metadata.dataset_name}."
+        )
+        return None
+
     @staticmethod
     def _gini(df: pd.DataFrame, numeric_only: bool) -> pd.Series:
-        """Calculate the Gini coefficient of a numpy array."""
+        """Calculate the Gini coefficient of each column of a dataframe."""
         # based on bottom eq:
         # http://www.statsdirect.com/help/generatedimages/equations/equation154.svg
         # from:
         # http://www.statsdirect.com/help/default.htm#nonparametric_methods/gini.htm
-        # All values are treated equally, arrays must be 1d:
-        # Get the score column for each task in df as a numpy array:
+        # All values are treated equally. For values sorted in ascending order, the
+        # sum of |x_i - x_j| over all pairs i < j equals sum_i (2i - n - 1) * x_i
+        # (1-indexed), so all columns are computed at once with one matrix product
+        # instead of O(n^2) pairwise differences.
         if numeric_only:
             numerics = ["int16", "int32", "int64", "float16", "float32", "float64"]
             df = df.select_dtypes(include=numerics)
-        data = []
-        index = []
-        for col in df.columns:
-            array = df[col].to_numpy()
-            x = np.sort(array)
-            # Gini coefficient:
-            total = 0
-            for i, xi in enumerate(x[:-1], 1):
-                total += np.sum(np.abs(xi - x[i:]))
-            gini = total / (len(x) ** 2 * np.mean(x))
-            # Round off to 5 decimal places:
-            data.append(gini)
-            index.append(col)
-
-        return pd.Series(data=data, index=index)
+        values = np.sort(df.to_numpy(dtype=np.float64), axis=0)
+        n = len(values)
+        rank_weights = 2 * np.arange(1, n + 1) - n - 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gini = (rank_weights @ values) / (n**2 * values.mean(axis=0))
+        return pd.Series(data=gini, index=df.columns)
 
     @staticmethod
     def aggregate_view(
@@ -547,16 +627,20 @@ class BenchmarkDBUtils:
         return view_dfs
 
     @staticmethod
-    def _col_name(elem_names: list[str], df_entry):
+    def _col_names(elem_names: list[str], input_df: pd.DataFrame) -> pd.Series:
+        """
+        Names the table column of each row of `input_df` after the values of the
+        string columns in `elem_names`, e.g. "score\\nsource_language=eng"
+        """
         # TODO(gneubig): This string-based representation may not be ideal
-        return "\n".join(
-            ["score"]
-            + [
-                f"{elem}={df_entry[elem]}"
-                for elem in elem_names
-                if df_entry[elem] and type(df_entry[elem]) == str
-            ]
-        )
+        col_names = pd.Series("score", index=input_df.index, dtype=object)
+        for elem in elem_names:
+            values = input_df[elem]
+            # only non-empty strings are part of the name
+            is_name = values.map(lambda x: type(x) == str and x != "").astype(bool)
+            if is_name.any():
+                col_names[is_name] = col_names[is_name] + f"\n{elem}=" + values[is_name]
+        return col_names
 
     @staticmethod
     def dataframe_to_table(
@@ -564,9 +648,7 @@ class BenchmarkDBUtils:
     ) -> BenchmarkTableData:
         elem_names = [x for x in input_df.columns if x not in {"score", col_name}]
         system_idx = sorted(list(set(input_df[col_name])))
-        row_col_names = [
-            BenchmarkDBUtils._col_name(elem_names, x) for _, x in input_df.iterrows()
-        ]
+        row_col_names = BenchmarkDBUtils._col_names(elem_names, input_df)
         column_idx = sorted(list(set(row_col_names)))
         # Terminate on empty data
         if len(system_idx) == 0 or len(column_idx) == 0:
@@ -578,65 +660,335 @@ class BenchmarkDBUtils:
                 plot_y_values=[],
                 plot_x_values=[],
             )
-        scores = pd.DataFrame(
-            {k: [0.0 for _ in system_idx] for k in column_idx}, index=system_idx
-        )
-        for (_, df_data), col_id in zip(input_df.iterrows(), row_col_names):
-            row_id = df_data[col_name]
-            val = df_data["score"]
-            scores[col_id][row_id] = val
+        # Scatter the scores into a system x column matrix. Missing scores are 0 and
+        # the last score wins if there are several for the same cell.
+        cells = pd.DataFrame(
+            {
+                "row": pd.Index(system_idx).get_indexer(input_df[col_name]),
+                "col": pd.Index(column_idx).get_indexer(row_col_names),
+                "score": input_df["score"].to_numpy(),
+            }
+        ).drop_duplicates(subset=["row", "col"], keep="last")
+        score_matrix = np.zeros((len(system_idx), len(column_idx)))
+        score_matrix[cells["row"], cells["col"]] = cells["score"]
+        scores = pd.DataFrame(score_matrix, index=system_idx, columns=column_idx)
         scores = scores.sort_values(scores.columns[0], axis=0, ascending=False)
         return BenchmarkTableData(
             name=view_name,
             system_names=list(scores.index),
             column_names=list(scores.columns),
-            scores=[[scores[j][i] for j in scores.columns] for i in scores.index],
+            scores=scores.to_numpy().tolist(),
             plot_y_values=[pt[1] for pt in plot_dict[view_name]],
             plot_x_values=[pt[0] for pt in plot_dict[view_name]],
         )
 
+    @staticmethod
+    def generation_keys(config: BenchmarkConfig) -> list[str]:
+        """The keys of the system generation counters that cover the systems of a
+        benchmark (see `load_sys_infos`)"""
+        if config.system_query is not None:
+            if config.system_query.get("dataset_name"):
+                return [
+                    SystemGenerationDBUtils.dataset_key(
+                        config.system_query["dataset_name"]
+                    )
+                ]
+            if config.system_query.get("task"):
+                return [SystemGenerationDBUtils.task_key(config.system_query["task"])]
+            return [SystemGenerationDBUtils.ALL_KEY]
+        elif config.datasets is not None:
+            return sorted(
+                {
+                    SystemGenerationDBUtils.dataset_key(record["dataset_name"])
+                    for record in config.datasets
+                }
+            )
+        return [SystemGenerationDBUtils.ALL_KEY]
+
+    @staticmethod
+    def benchmark_signature(config: BenchmarkConfig) -> dict:
+        """
+        Summarizes the inputs of the results computed for a benchmark. The results
+        stay valid as long as the signature doesn't change.
+        :return: a hash of the benchmark config and the generations of the systems
+            in the benchmark
+        """
+        config_hash = hashlib.sha256(
+            json.dumps(config.to_dict(), sort_keys=True, default=str).encode()
+        ).hexdigest()
+        generations = SystemGenerationDBUtils.find_generations(
+            BenchmarkDBUtils.generation_keys(config)
+        )
+        # results computed before they were restricted to public systems may
+        # include private ones, so the scope is part of the signature
+        return {
+            "config_hash": config_hash,
+            "generations": generations,
+            "scope": "public",
+        }
+
+    @staticmethod
+    def cached_result_path(file_name: str) -> str:
+        return os.path.join(get_cache_dir(), sanitize_path(file_name))
+
+    @staticmethod
+    def load_cached_result(file_name: str, signature: dict) -> dict | None:
+        """Returns the result cached in `file_name` if it was computed for the same
+        `signature`, None otherwise."""
+        path = BenchmarkDBUtils.cached_result_path(file_name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+        except ValueError:
+            logging.getLogger().warning(f"ignoring corrupted cache file {path}")
+            return None
+        if cached.get("signature") != signature:
+            return None
+        return cached["result"]
+
+    @staticmethod
+    def save_cached_result(file_name: str, signature: dict, result: dict) -> dict:
+        """Caches `result` in `file_name` and returns it as `load_cached_result`
+        would (e.g. tuples become lists and keys become strings), so that fresh and
+        cached results look the same to the callers."""
+        path = BenchmarkDBUtils.cached_result_path(file_name)
+        data = json.dumps({"signature": signature, "result": result})
+        # write to a temporary file first so that other workers never read a
+        # partially written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as outfile:
+            outfile.write(data)
+        os.replace(tmp_path, path)
+        return json.loads(data)["result"]
+
+    @staticmethod
+    def _system_versions(sys_infos: list[SystemModel]) -> dict[str, list[str]]:
+        """
+        :return: system_id -> [creation date, last modified time, properties
+            version, system name]. The properties version changes when the results
+            are recomputed. The name is included because `update_system_by_id`
+            doesn't touch last_modified and systems are grouped by name.
+        """
+        return {
+            sys.system_id: [
+                str(sys.created_at.date()),
+                str(sys.last_modified),
+                str(sys._properties_version),
+                sys.system_name,
+            ]
+            for sys in sys_infos
+        }
+
+    @staticmethod
+    def _first_affected_date(
+        plot_state: dict | None,
+        config_hash: str,
+        systems: dict[str, list[str]],
+    ) -> str | None:
+        """
+        Compares the persisted plot state with the current inputs.
+        :return: the earliest date whose plot points are affected by the changes,
+            "" if all the points need to be recomputed, or None if the persisted
+            plots are up to date
+        """
+        if (
+            not plot_state
+            or plot_state.get("version") != BenchmarkDBUtils._PLOT_STATE_VERSION
+            or plot_state.get("config_hash") != config_hash
+        ):
+            return ""
+        old_systems: dict[str, list[str]] = plot_state["systems"]
+        # the first element of each version is the creation date
+        affected_dates = [
+            version[0]
+            for sys_id, version in systems.items()
+            if old_systems.get(sys_id) != version
+        ] + [
+            version[0]
+            for sys_id, version in old_systems.items()
+            if sys_id not in systems
+        ]
+        return min(affected_dates) if affected_dates else None
+
     @staticmethod
     def generate_plots(benchmark_id):
+        """
+        Generates the time series of the best score of each view of a benchmark.
+
+        A point at a given date only depends on the systems created up to that date.
+        The series are persisted along with the systems they were computed from, and
+        when systems are added, updated or removed only the points on or after the
+        earliest affected date are recomputed.
+        """
         config = BenchmarkDBUtils.find_config_by_id(benchmark_id)
         if config.type == "abstract":
             return {}
-        plot_path = os.path.join(get_cache_dir(), benchmark_id + "_plot.json")
-        plot_file = open_cached_file(
-            benchmark_id + "_plot.json", datetime.timedelta(seconds=1)
+        plot_file = benchmark_id + "_plot.json"
+        signature = BenchmarkDBUtils.benchmark_signature(config)
+        plot_state = BenchmarkDBUtils.load_cached_result(plot_file, signature)
+        if plot_state and plot_state.get("version") == (
+            BenchmarkDBUtils._PLOT_STATE_VERSION
+        ):
+            return plot_state["plots"]
+        # the signature changed, so the persisted plots are loaded regardless of
+        # their signature to find out which points can be reused
+        try:
+            with open(BenchmarkDBUtils.cached_result_path(plot_file)) as f:
+                plot_state = json.load(f)["result"]
+        except (OSError, ValueError, KeyError):
+            plot_state = None
+
+        sys_infos = BenchmarkDBUtils.load_sys_infos(config)
+        config_hash = signature["config_hash"]
+        systems = BenchmarkDBUtils._system_versions(sys_infos)
+        first_date = BenchmarkDBUtils._first_affected_date(
+            plot_state, config_hash, systems
         )
-        if not plot_file:
-            sys_infos = BenchmarkDBUtils.load_sys_infos(config)
-            # Default trend is "increase",
-            # meaning show the next date when there is improvement
-            plot_dict = {
-                k.name: (k.trend if k.trend else "increase") for k in config.views
+        if first_date is None:
+            # the systems of this benchmark didn't change
+            json_dict = unwrap(plot_state)["plots"]
+        else:
+            json_dict = BenchmarkDBUtils._compute_plots(
+                config, sys_infos, plot_state, first_date
+            )
+
+        plot_state = {
+            "version": BenchmarkDBUtils._PLOT_STATE_VERSION,
+            "config_hash": config_hash,
+            "systems": systems,
+            "plots": json_dict,
+        }
+        plot_state = BenchmarkDBUtils.save_cached_result(
+            plot_file, signature, plot_state
+        )
+        return plot_state["plots"]
+
+    @staticmethod
+    def _aggregates_by_system(view_spec: BenchmarkViewConfig) -> bool:
+        """
+        :return: True if each system's rows of the aggregated view only depend on
+            the rows of that system, so the view can be aggregated system by system
+        """
+        for operation in view_spec.operations:
+            op = operation["op"]
+            if op == "subtract":
+                continue
+            if operation.get("weight_logit_multiplier") is not None:
+                # the weights are normalized over all the rows
+                return False
+            if op == "multiply":
+                continue
+            if op not in {"mean", "sum", "max", "min", "weighted_sum"} or (
+                operation.get("skip_group_system")
+            ):
+                return False
+        return True
+
+    @staticmethod
+    def _compute_plots(
+        config: BenchmarkConfig,
+        sys_infos: list[SystemModel],
+        plot_state: dict | None,
+        first_date: str,
+    ) -> dict:
+        """
+        Computes the points of the plots on or after `first_date`. The points before
+        it are taken from `plot_state`. An empty `first_date` computes all the points.
+        """
+        # Default trend is "increase",
+        # meaning show the next date when there is improvement
+        plot_dict = {k.name: (k.trend if k.trend else "increase") for k in config.views}
+        plot_dict["Original"] = "original"
+        # only the views with these trends have plots
+        plotted_views = [
+            k for k in config.views if plot_dict[k.name] in {"all", "increase"}
+        ]
+        if first_date:
+            json_dict = {
+                k: [pt for pt in v if pt[0] < first_date]
+                for k, v in unwrap(plot_state)["plots"].items()
             }
-            plot_dict["Original"] = "original"
+        else:
             json_dict = {k.name: [] for k in config.views}
             json_dict["Original"] = []
             json_dict["times"] = []
-            unique_dates = sorted(list({x.created_at.date() for x in sys_infos}))
 
-            for date in unique_dates:
-                systems = [sys for sys in sys_infos if sys.created_at.date() <= date]
-                orig_df = BenchmarkDBUtils.generate_dataframe_from_sys_infos(
-                    config, systems
-                )
-                system_dfs = BenchmarkDBUtils.generate_view_dataframes(
-                    config, orig_df, by_creator=False
+        # Systems are added to the running table in order of creation. The table
+        # is kept as the rows of each system name: the systems created on a date
+        # only change the rows of their names, so only those rows are built and
+        # only the aggregates of those names are updated. All the rows are
+        # rebuilt when a date adds a dataset because every system gets rows for it.
+        sys_infos = sorted(sys_infos, key=lambda x: x.created_at)
+        dataset_configs = BenchmarkDBUtils._dataset_configs(config, [])
+        dataset_keys = {BenchmarkDBUtils._dataset_key(x) for x in dataset_configs}
+        dataset_metadata_cache: dict[tuple, DatasetMetadata | None] = {}
+        systems_by_name: dict[str, list[SystemModel]] = {}
+        rows: dict[str, pd.DataFrame] = {}
+        # names whose rows are out of date
+        touched: set[str] = set()
+        # view name -> system name -> best score of the aggregated rows of the
+        # system, for the views that can be aggregated system by system
+        view_scores: dict[str, dict[str, float]] = {
+            k.name: {}
+            for k in plotted_views
+            if BenchmarkDBUtils._aggregates_by_system(k)
+        }
+        for date, date_systems in itertools.groupby(
+            sys_infos, key=lambda x: x.created_at.date()
+        ):
+            for sys in date_systems:
+                dataset_key = BenchmarkDBUtils._system_dataset_key(sys)
+                if dataset_key not in dataset_keys:
+                    if config.datasets:
+                        # not part of the benchmark
+                        continue
+                    dataset_keys.add(dataset_key)
+                    dataset_configs += BenchmarkDBUtils._dataset_configs(config, [sys])
+                    touched.update(systems_by_name)
+                systems_by_name.setdefault(sys.system_name, []).append(sys)
+                touched.add(sys.system_name)
+            if str(date) < first_date:
+                continue
+
+            if touched:
+                new_rows = BenchmarkDBUtils.generate_dataframe_from_sys_infos(
+                    config,
+                    [sys for name in touched for sys in systems_by_name[name]],
+                    dataset_metadata_cache,
+                    dataset_configs,
                 )
-                for k, v in system_dfs:
-                    if plot_dict[k] == "all":
-                        json_dict[k].append((str(date), v.max()["score"]))
-                    elif plot_dict[k] == "increase":
-                        if len(json_dict[k]) == 0 or (
-                            len(json_dict[k]) > 0
-                            and json_dict[k][-1][1] < v.max()["score"]
-                        ):
-                            json_dict[k].append((str(date), v.max()["score"]))
-            with open(plot_path, "w") as outfile:
-                json.dump(json_dict, outfile)
-
-        with open(plot_path) as f:
-            plot_data = json.load(f)
-        return plot_data
+                for name in touched:
+                    rows.pop(name, None)
+                for name, name_rows in new_rows.groupby("system_name", sort=False):
+                    rows[name] = name_rows
+                for view_spec in plotted_views:
+                    scores = view_scores.get(view_spec.name)
+                    if scores is None:
+                        continue
+                    for name in touched:
+                        scores.pop(name, None)
+                        if name in rows:
+                            scores[name] = BenchmarkDBUtils.aggregate_view(
+                                rows[name], view_spec, False
+                            ).max()["score"]
+                touched = set()
+
+            for view_spec in plotted_views:
+                k = view_spec.name
+                if k in view_scores:
+                    best = pd.Series(view_scores[k].values(), dtype=float).max()
+                elif rows:
+                    best = BenchmarkDBUtils.aggregate_view(
+                        pd.concat(rows.values(), ignore_index=True), view_spec, False
+                    ).max()["score"]
+                else:
+                    best = np.nan
+                if plot_dict[k] == "all":
+                    json_dict[k].append((str(date), best))
+                elif plot_dict[k] == "increase":
+                    if len(json_dict[k]) == 0 or json_dict[k][-1][1] < best:
+                        json_dict[k].append((str(date), best))
+
+        return json_dict
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import threading
 from collections.abc import Callable
 from dataclasses import dataclass
-from typing import TypeVar
+from enum import Enum
+from typing import Final, TypeVar
 
 from bson.objectid import InvalidId, ObjectId
+from pymongo import MongoClient, ReadPreference, ReturnDocument
 from pymongo.client_session import ClientSession
 from pymongo.cursor import Cursor
+from pymongo.database import Database
 from pymongo.results import DeleteResult, InsertManyResult, UpdateResult
 
 from explainaboard_web.impl.db import get_db
@@ -18,6 +22,62 @@ class DBCollection:
     collection_name: str
 
 
+class CountMode(str, Enum):
+    """How `DBUtils.find` counts the documents that match the filter"""
+
+    # don't count. The total is None.
+    NONE = "none"
+    # count_documents
+    EXACT = "exact"
+    # the number of documents in the collection from the collection metadata. It
+    # doesn't scan anything but ignores the filter, so it is exact only if there is
+    # no filter.
+    ESTIMATED = "estimated"
+    # count_documents but stops at `count_cap`
+    CAPPED = "capped"
+
+
+class _CollectionRegistry:
+    """Names of the collections known to exist in each database, so the existence
+    of a collection is checked without a round trip to the DB. The names of a
+    database are listed again only when a collection is not found, so collections
+    created after the listing are still found. Thread-safe."""
+
+    def __init__(self) -> None:
+        self._names: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self._checks = 0
+        self._round_trips = 0
+
+    def refresh(self, database: Database) -> set[str]:
+        """Lists the collections of `database` and returns their names"""
+        names = set(database.list_collection_names())
+        with self._lock:
+            self._round_trips += 1
+            self._names[database.name] = names
+        return names
+
+    def exists(self, database: Database, collection_name: str) -> bool:
+        with self._lock:
+            self._checks += 1
+            if collection_name in self._names.get(database.name, ()):
+                return True
+        return collection_name in self.refresh(database)
+
+    def discard(self, db_name: str, collection_name: str) -> None:
+        with self._lock:
+            self._names.get(db_name, set()).discard(collection_name)
+
+    def stats(self) -> dict[str, int]:
+        """number of existence checks and the round trips they took"""
+        with self._lock:
+            return {
+                "collection_checks": self._checks,
+                "collection_list_round_trips": self._round_trips,
+                "round_trips_saved": self._checks - self._round_trips,
+            }
+
+
 class DBUtils:
 
     # Names of DBs or collections
@@ -32,6 +92,17 @@ class DBUtils:
     BENCHMARK_FEATURED_LIST = DBCollection(
         db_name="metadata", collection_name="benchmark_featured_list"
     )
+    SYSTEM_GENERATIONS = DBCollection(
+        db_name="metadata", collection_name="system_generations"
+    )
+    SIGNIFICANCE_TEST_CACHE = DBCollection(
+        db_name="metadata", collection_name="significance_test_cache"
+    )
+
+    _collection_registry: Final = _CollectionRegistry()
+    # id of a session -> callbacks to call once its transaction is committed
+    _after_commit: Final[dict[int, list[Callable[[], None]]]] = {}
+    _after_commit_lock: Final = threading.Lock()
 
     @staticmethod
     def _convert_id(_id: str | ObjectId):
@@ -43,24 +114,44 @@ class DBUtils:
 
     @staticmethod
     def get_database(db_name: str):
-        return get_db().cx[db_name]
+        return get_db()[db_name]
 
     @staticmethod
-    def get_client() -> ClientSession:
-        return get_db().db.client
+    def get_client() -> MongoClient:
+        return get_db()
 
     @staticmethod
     def get_collection(collection: DBCollection, check_collection_exist=True):
+        """
+        :param check_collection_exist: if True and collection doesn't exist, raise
+              exception. Collections known to exist are not checked again so a
+              collection dropped by another process is not detected.
+        """
         database = DBUtils.get_database(collection.db_name)
-        if check_collection_exist:
-            collection_names = database.list_collection_names()
-            if collection.collection_name in collection_names:
-                return database.get_collection(collection.collection_name)
+        if check_collection_exist and not DBUtils._collection_registry.exists(
+            database, collection.collection_name
+        ):
             raise DBUtilsException(
                 f"collection: {collection.collection_name} does not exist"
             )
         return database.get_collection(collection.collection_name)
 
+    @staticmethod
+    def refresh_collection_registry() -> None:
+        """Lists the collections of all the databases used by the app so that
+        subsequent existence checks don't need a round trip to the DB."""
+        db_names = {
+            value.db_name
+            for value in vars(DBUtils).values()
+            if isinstance(value, DBCollection)
+        }
+        for db_name in sorted(db_names):
+            DBUtils._collection_registry.refresh(DBUtils.get_database(db_name))
+
+    @staticmethod
+    def collection_registry_stats() -> dict[str, int]:
+        return DBUtils._collection_registry.stats()
+
     @staticmethod
     def drop(collection: DBCollection, check_collection_exist=False):
         """
@@ -69,6 +160,9 @@ class DBUtils:
               exception
         """
         DBUtils.get_collection(collection, check_collection_exist).drop()
+        DBUtils._collection_registry.discard(
+            collection.db_name, collection.collection_name
+        )
 
     @staticmethod
     def insert_one(
@@ -101,14 +195,20 @@ class DBUtils:
         session: ClientSession | None = None,
     ):
         """
-        Find and return a document with the _id field
+        Find and return a document with the _id field. The document is always read
+        from the primary whatever the read preference of the client
+        (`DB_READ_PREFERENCE`): reads by id usually follow a write (e.g. the private
+        properties of a system that has just been updated) and a lagging secondary
+        would return the document from before the write.
         Prameters:
           - id: value of _id
           - projection: include or exclude fields in the document
         """
         _id = DBUtils._convert_id(docid)
-        return DBUtils.get_collection(collection).find_one(
-            {"_id": _id}, projection, session=session
+        return (
+            DBUtils.get_collection(collection)
+            .with_options(read_preference=ReadPreference.PRIMARY)
+            .find_one({"_id": _id}, projection, session=session)
         )
 
     @staticmethod
@@ -133,6 +233,50 @@ class DBUtils:
             return True
         return False
 
+    @staticmethod
+    def find_one_by_id_and_update(
+        collection: DBCollection,
+        docid: str | ObjectId,
+        field_to_value: dict,
+        projection: dict | None = None,
+        session: ClientSession | None = None,
+    ) -> dict | None:
+        """
+        Update a document with the _id field and return it as it was before the
+        update, in one round trip
+        Parameters:
+          - id: value of _id
+          - field_to_value: the new "field to value"(s) to be set in the document
+          - projection: include or exclude fields in the returned document
+        Returns: the document before the update or None if it doesn't exist
+        """
+        _id = DBUtils._convert_id(docid)
+        return DBUtils.get_collection(collection).find_one_and_update(
+            {"_id": _id},
+            {"$set": field_to_value},
+            projection=projection,
+            return_document=ReturnDocument.BEFORE,
+            session=session,
+        )
+
+    @staticmethod
+    def update_many(
+        collection: DBCollection,
+        filt: dict,
+        field_to_value: dict,
+        session: ClientSession | None = None,
+    ) -> int:
+        """
+        Update all the documents that match `filt`
+        Parameters:
+          - field_to_value: the new "field to value"(s) to be set in the documents
+        Returns: Number of updated documents
+        """
+        result: UpdateResult = DBUtils.get_collection(collection).update_many(
+            filt, {"$set": field_to_value}, session=session
+        )
+        return int(result.modified_count)
+
     @staticmethod
     def replace_one_by_id(collection: DBCollection, doc: dict):
         """
@@ -186,7 +330,9 @@ class DBUtils:
         skip=0,
         limit: int = 10,
         projection: dict | None = None,
-    ) -> tuple[Cursor, int]:
+        count: CountMode = CountMode.EXACT,
+        count_cap: int = 1000,
+    ) -> tuple[Cursor, int | None]:
         """
         Find multiple documents
         TODO: error handling for find
@@ -198,20 +344,74 @@ class DBUtils:
                    the pyMongo API)
           - projection: include or exclude certain fields
           (https://docs.mongodb.com/manual/tutorial/project-fields-from-query-results/)
+          - count: how to count the total. Counting takes an additional round trip
+                   unless it is `CountMode.NONE`.
+          - count_cap: the maximum total if count is `CountMode.CAPPED`
         Return:
           - a cursor that can be iterated over
           - a number that represents the total matching documents without considering
-            skip/limit
+            skip/limit, or None if count is `CountMode.NONE`
         """
         if not filt:
             filt = {}
-        cursor = DBUtils.get_collection(collection).find(filt, projection)
+        mongo_collection = DBUtils.get_collection(collection)
+        cursor = mongo_collection.find(filt, projection)
         if sort:
             cursor = cursor.sort(sort)
         cursor = cursor.skip(skip).limit(limit)
-        total = DBUtils.count(collection, filt)
+        total: int | None = None
+        if count == CountMode.EXACT:
+            total = mongo_collection.count_documents(filt)
+        elif count == CountMode.ESTIMATED:
+            total = mongo_collection.estimated_document_count()
+        elif count == CountMode.CAPPED:
+            total = mongo_collection.count_documents(filt, limit=count_cap)
         return cursor, total
 
+    @staticmethod
+    def find_page(
+        collection: DBCollection,
+        filt: dict | None = None,
+        sort: list | None = None,
+        skip=0,
+        limit: int = 10,
+        projection: dict | None = None,
+    ) -> tuple[list[dict], int]:
+        """
+        Same as `find` with an exact count but the documents and the total are
+        retrieved with one aggregation ($facet), so it takes one round trip instead
+        of two. All the documents of the page are returned in one BSON document so
+        large documents should be excluded with `projection`.
+        """
+        pipeline = DBUtils.page_pipeline(filt, sort, skip, limit, projection)
+        result = next(DBUtils.get_collection(collection).aggregate(pipeline))
+        total = result["total"][0]["total"] if result["total"] else 0
+        return result["documents"], total
+
+    @staticmethod
+    def page_pipeline(
+        filt: dict | None,
+        sort: list | None,
+        skip: int,
+        limit: int,
+        projection: dict | None,
+    ) -> list[dict]:
+        """The aggregation pipeline of `find_page`. $sort and $project come before
+        $facet because the stages of a facet can't use indexes: the sort is served
+        by an index and only the projected documents are passed to the facet."""
+        pipeline: list[dict] = [{"$match": filt or {}}]
+        if sort:
+            pipeline.append({"$sort": dict(sort)})
+        if projection:
+            pipeline.append({"$project": projection})
+        page_stages: list[dict] = [{"$skip": skip}]
+        if limit:
+            page_stages.append({"$limit": limit})
+        pipeline.append(
+            {"$facet": {"documents": page_stages, "total": [{"$count": "total"}]}}
+        )
+        return pipeline
+
     CallbackRetType = TypeVar("CallbackRetType")
 
     @staticmethod
@@ -220,12 +420,35 @@ class DBUtils:
     ) -> CallbackRetType:
         """
         Executes `callback` in a transaction. Returns the return of callback. An
-        exception is raised if failure.
+        exception is raised if failure. Transactions read from the primary whatever
+        the read preference of the client (`DB_READ_PREFERENCE`) because
+        multi-document transactions don't support other read preferences.
         - Ref: https://pymongo.readthedocs.io/en/stable/api/pymongo/client_session.html
         """
         with DBUtils.get_client().start_session() as session:
-            with session.start_transaction():
-                return callback(session)
+            try:
+                with session.start_transaction(read_preference=ReadPreference.PRIMARY):
+                    result = callback(session)
+            finally:
+                with DBUtils._after_commit_lock:
+                    after_commit = DBUtils._after_commit.pop(id(session), [])
+            for after_commit_callback in after_commit:
+                after_commit_callback()
+            return result
+
+    @staticmethod
+    def after_commit(session: ClientSession | None, callback: Callable[[], None]):
+        """
+        Calls `callback` once the transaction of `session` (started by
+        `execute_transaction`) is committed, or right away if `session` is None. The
+        callback is dropped if the transaction is aborted. Used to invalidate caches
+        so that concurrent readers can't cache data that is about to change.
+        """
+        if session is None or not session.in_transaction:
+            callback()
+            return
+        with DBUtils._after_commit_lock:
+            DBUtils._after_commit.setdefault(id(session), []).append(callback)
 
 
 class DBUtilsException(Exception):
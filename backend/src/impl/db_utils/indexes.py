@@ -0,0 +1,136 @@
+"""Indexes of the metadata collections.
+
+Each index serves one of the access patterns of the DB utils, which are noted next to
+it. The indexes are created by `scripts/ensure_indexes.py`, not by the app.
+"""
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Final
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.collection import Collection
+
+from explainaboard_web.impl.db_utils.db_utils import DBCollection, DBUtils
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: DBCollection
+    name: str
+    keys: list[tuple[str, int]]
+    # only documents that match this filter are indexed. A query can use the index
+    # only if its filter implies this one.
+    partial_filter: dict | None = None
+    options: dict = field(default_factory=dict)
+
+    def to_index_model(self) -> IndexModel:
+        kwargs = dict(self.options)
+        if self.partial_filter is not None:
+            kwargs["partialFilterExpression"] = self.partial_filter
+        return IndexModel(self.keys, name=self.name, **kwargs)
+
+
+INDEXES: Final[list[IndexSpec]] = [
+    # SystemDBUtils.query_systems: every query is an $or of the permission
+    # conditions (public, created by the user, shared with the user) and is sorted
+    # by created_at by default. An $or uses indexes only if all its branches do.
+    IndexSpec(
+        DBUtils.DEV_SYSTEM_METADATA,
+        "public_created_at",
+        [("created_at", DESCENDING)],
+        partial_filter={"is_private": False},
+    ),
+    IndexSpec(
+        DBUtils.DEV_SYSTEM_METADATA,
+        "creator_created_at",
+        [("creator", ASCENDING), ("created_at", DESCENDING)],
+    ),
+    IndexSpec(
+        DBUtils.DEV_SYSTEM_METADATA,
+        "shared_users_created_at",
+        [("shared_users", ASCENDING), ("created_at", DESCENDING)],
+        partial_filter={"shared_users": {"$exists": True}},
+    ),
+    # SystemDBUtils.find_systems filters
+    IndexSpec(
+        DBUtils.DEV_SYSTEM_METADATA,
+        "task_created_at",
+        [("task", ASCENDING), ("created_at", DESCENDING)],
+    ),
+    # also used by benchmarks, which look up systems by dataset
+    IndexSpec(
+        DBUtils.DEV_SYSTEM_METADATA,
+        "dataset_created_at",
+        [
+            ("dataset.dataset_name", ASCENDING),
+            ("dataset.sub_dataset", ASCENDING),
+            ("dataset.split", ASCENDING),
+            ("created_at", DESCENDING),
+        ],
+        partial_filter={"dataset.dataset_name": {"$exists": True}},
+    ),
+    # system_name is searched by prefix
+    IndexSpec(
+        DBUtils.DEV_SYSTEM_METADATA,
+        "system_name",
+        [("system_name", ASCENDING)],
+    ),
+    IndexSpec(
+        DBUtils.DEV_SYSTEM_METADATA,
+        "system_tags_created_at",
+        [("system_tags", ASCENDING), ("created_at", DESCENDING)],
+    ),
+    # SystemDBUtils.fail_interrupted_systems
+    IndexSpec(
+        DBUtils.DEV_SYSTEM_METADATA,
+        "status_created_at",
+        [("status", ASCENDING), ("created_at", ASCENDING)],
+        partial_filter={"status": {"$exists": True}},
+    ),
+    # UserDBUtils.find_user looks up users by _id or email
+    IndexSpec(DBUtils.USER_METADATA, "email", [("email", ASCENDING)]),
+    # BenchmarkDBUtils.find_configs
+    IndexSpec(
+        DBUtils.BENCHMARK_METADATA,
+        "parent",
+        [("parent", ASCENDING)],
+        partial_filter={"parent": {"$exists": True}},
+    ),
+    # SignificanceTestDBCache and SignificanceTestDBUtils.delete_results_of_system
+    IndexSpec(
+        DBUtils.SIGNIFICANCE_TEST_CACHE,
+        "system_ids",
+        [("system_ids", ASCENDING)],
+    ),
+]
+
+
+def ensure_indexes(
+    get_collection: Callable[[DBCollection], Collection] | None = None,
+    specs: list[IndexSpec] = INDEXES,
+    dry_run: bool = False,
+) -> list[str]:
+    """Creates the indexes in `specs` that don't exist yet and returns their names
+    as `collection.index`. Existing indexes are left unchanged, so to change an
+    index, it needs to be given a new name.
+
+    :param get_collection: returns the collection to create the indexes in. By
+        default, the collections of the app DB are used.
+    :param dry_run: only returns the names of the missing indexes
+    """
+    if get_collection is None:
+
+        def get_collection(collection: DBCollection) -> Collection:
+            return DBUtils.get_collection(collection, check_collection_exist=False)
+
+    created: list[str] = []
+    for spec in specs:
+        mongo_collection = get_collection(spec.collection)
+        if spec.name in mongo_collection.index_information():
+            continue
+        if not dry_run:
+            mongo_collection.create_indexes([spec.to_index_model()])
+        created.append(f"{spec.collection.collection_name}.{spec.name}")
+    return created
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hashlib
+import json
+
+from explainaboard_web.impl.db_utils.db_utils import DBUtils
+
+
+def significance_test_seed(system_ids: list[str], params: dict) -> int:
+    """A seed derived from the tested systems and the test parameters so that
+    results are reproducible. The order of `system_ids` matters."""
+    key = json.dumps([system_ids, params], sort_keys=True)
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "little")
+
+
+class SignificanceTestDBCache:
+    """Results of the significance test between two systems for one set of test
+    parameters, persisted in the DB so they are shared by all the workers.
+
+    Results are stored for the system pair in sorted order and flipped when the
+    systems are requested the other way around. The metric stats of a system change
+    when they are recomputed (e.g. with another SDK version or by a forced update),
+    which also changes the `properties_version` of the system (see `SystemModel`), so
+    the versions of both systems are part of the key. Results of older versions are
+    never hit again and are deleted with the systems.
+    """
+
+    def __init__(
+        self,
+        system1_id: str,
+        system2_id: str,
+        n_samples: int,
+        prop_samples: float,
+        early_stopping_alpha: float | None,
+        sdk_version: str,
+        properties_versions: tuple[str | None, str | None],
+    ) -> None:
+        self._flipped = system1_id > system2_id
+        self._system_ids = sorted([system1_id, system2_id])
+        if self._flipped:
+            properties_versions = (properties_versions[1], properties_versions[0])
+        self._params = {
+            "n_samples": n_samples,
+            "prop_samples": prop_samples,
+            "early_stopping_alpha": early_stopping_alpha,
+            "sdk_version": sdk_version,
+            "properties_versions": list(properties_versions),
+        }
+        self._entries: dict[str, dict] | None = None
+
+    @property
+    def seed(self) -> int:
+        """A seed derived from the key so that results are reproducible"""
+        return significance_test_seed(self._system_ids, self._params)
+
+    def _doc_id(self, metric_name: str) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                [self._system_ids, metric_name, self._params], sort_keys=True
+            ).encode()
+        ).hexdigest()
+
+    def _load(self) -> dict[str, dict]:
+        """Loads the results of all the metrics in one round trip"""
+        if self._entries is None:
+            cursor = DBUtils.get_collection(
+                DBUtils.SIGNIFICANCE_TEST_CACHE, check_collection_exist=False
+            ).find({"system_ids": self._system_ids, **self._params})
+            self._entries = {doc["metric_name"]: doc for doc in cursor}
+        return self._entries
+
+    def get(self, metric_name: str) -> tuple[list[int], int] | None:
+        doc = self._load().get(metric_name)
+        if doc is None:
+            return None
+        wins = doc["wins"]
+        if self._flipped:
+            wins = [wins[1], wins[0], wins[2]]
+        return wins, doc["n_drawn"]
+
+    def put(self, metric_name: str, wins: list[int], n_drawn: int) -> None:
+        if self._flipped:
+            wins = [wins[1], wins[0], wins[2]]
+        doc = {
+            "_id": self._doc_id(metric_name),
+            "system_ids": self._system_ids,
+            "metric_name": metric_name,
+            **self._params,
+            "wins": wins,
+            "n_drawn": n_drawn,
+        }
+        # upserts create the collection if it doesn't exist
+        DBUtils.get_collection(
+            DBUtils.SIGNIFICANCE_TEST_CACHE, check_collection_exist=False
+        ).replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        self._load()[metric_name] = doc
+
+
+class SignificanceTestDBUtils:
+    @staticmethod
+    def delete_results_of_system(system_id: str) -> int:
+        """Deletes the cached significance tests that involve a system
+        Returns: Number of deleted entries
+        """
+        result = DBUtils.get_collection(
+            DBUtils.SIGNIFICANCE_TEST_CACHE, check_collection_exist=False
+        ).delete_many({"system_ids": system_id})
+        return int(result.deleted_count)
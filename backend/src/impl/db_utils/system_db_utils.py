@@ -3,19 +3,29 @@ from __future__ import annotations
 import json
 import logging
 import re
+import time
 import traceback
-from datetime import datetime
-from typing import Any, NamedTuple
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from typing import Any, Final, NamedTuple
 
 from bson import ObjectId
 from explainaboard import DatalabLoaderOption, FileType, Source, get_loader_class
+from flask import current_app
 from pymongo.client_session import ClientSession
 
 from explainaboard_web.impl.auth import get_user
 from explainaboard_web.impl.db_utils.dataset_db_utils import DatasetDBUtils
-from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.db_utils.db_utils import CountMode, DBUtils
+from explainaboard_web.impl.db_utils.significance_test_db_utils import (
+    SignificanceTestDBUtils,
+)
+from explainaboard_web.impl.db_utils.system_generation_db_utils import (
+    SystemGenerationDBUtils,
+)
 from explainaboard_web.impl.db_utils.user_db_utils import UserDBUtils
 from explainaboard_web.impl.internal_models.system_model import SystemModel
+from explainaboard_web.impl.jobs import get_job_queue
 from explainaboard_web.impl.utils import abort_with_error_message
 from explainaboard_web.models import (
     AnalysisCase,
@@ -26,10 +36,22 @@ from explainaboard_web.models import (
     SystemOutputProps,
 )
 
+# monotonic time at which this process last looked for interrupted systems
+_interrupted_systems_checked_at: float | None = None
+
 
 class SystemDBUtils:
 
     _COLON_RE = r"^([A-Za-z0-9_-]+): (.+)$"
+    # private properties that can be large and are not part of `System`. They are
+    # excluded when systems are listed.
+    _LISTING_PROJECTION: Final = {
+        "system_info": False,
+        "metric_stats": False,
+        "system_output_index": False,
+        "analysis_cases_index": False,
+        "system_output_metadata": False,
+    }
 
     @staticmethod
     def _parse_colon_line(line) -> tuple[str, str]:
@@ -77,10 +99,17 @@ class SystemDBUtils:
         page: int,
         page_size: int,
         sort: list | None = None,
+        count: CountMode = CountMode.EXACT,
+        public_only: bool = False,
     ) -> FindSystemsReturn:
-
-        permissions_list = [{"is_private": False}]
-        user = get_user()
+        """
+        :param count: how to count the total. An exact count of a page (page_size >
+            0) is retrieved together with the page in one aggregation.
+        :param public_only: only returns public systems regardless of the user, for
+            results that are shared by all users
+        """
+        permissions_list: list[dict] = [{"is_private": False}]
+        user = None if public_only else get_user()
         if user:
             permissions_list.append({"creator": user.id})
             permissions_list.append({"shared_users": user.email})
@@ -90,10 +119,28 @@ class SystemDBUtils:
             query = [query]
         query = {"$and": query + [permission_query]}
 
-        cursor, total = DBUtils.find(
-            DBUtils.DEV_SYSTEM_METADATA, query, sort, page * page_size, page_size
-        )
-        documents = list(cursor)
+        documents: list[dict]
+        total: int | None
+        if count == CountMode.EXACT and page_size:
+            documents, total = DBUtils.find_page(
+                DBUtils.DEV_SYSTEM_METADATA,
+                query,
+                sort,
+                page * page_size,
+                page_size,
+                projection=SystemDBUtils._LISTING_PROJECTION,
+            )
+        else:
+            cursor, total = DBUtils.find(
+                DBUtils.DEV_SYSTEM_METADATA,
+                query,
+                sort,
+                page * page_size,
+                page_size,
+                projection=SystemDBUtils._LISTING_PROJECTION,
+                count=count,
+            )
+            documents = list(cursor)
 
         # query preferred_usernames in batch to make it more efficient
         # use set to deduplicate ids
@@ -127,8 +174,15 @@ class SystemDBUtils:
         shared_users: list[str] | None = None,
         dataset_list: list[tuple[str, str, str]] | None = None,
         system_tags: list[str] | None = None,
+        count: CountMode = CountMode.EXACT,
+        public_only: bool = False,
     ) -> FindSystemsReturn:
-        """find multiple systems that matches the filters"""
+        """find multiple systems that matches the filters
+
+        :param count: how to count the total. Callers that don't need the total
+            should use `CountMode.NONE` to save a round trip.
+        :param public_only: see `query_systems`
+        """
 
         search_conditions: list[dict[str, Any]] = []
 
@@ -154,6 +208,20 @@ class SystemDBUtils:
             search_conditions.append({"shared_users": shared_users})
         if system_tags:
             search_conditions.append({"system_tags": {"$all": system_tags}})
+        if not creator and not ids:
+            # systems that are not ready are only listed to filter by creator. They
+            # are returned by id lookups so the caller can report their status.
+            search_conditions.append(
+                {
+                    "status": {
+                        "$nin": [
+                            SystemModel._STATUS_PENDING,
+                            SystemModel._STATUS_PROCESSING,
+                            SystemModel._STATUS_FAILED,
+                        ]
+                    }
+                }
+            )
 
         if dataset_list:
             dataset_dicts = [
@@ -167,7 +235,7 @@ class SystemDBUtils:
             search_conditions.append({"$or": dataset_dicts})
 
         systems, total = SystemDBUtils.query_systems(
-            search_conditions, page, page_size, sort
+            search_conditions, page, page_size, sort, count, public_only
         )
         if ids and not sort:
             # preserve id order if no `sort` is provided
@@ -215,9 +283,14 @@ class SystemDBUtils:
         metadata: SystemMetadata,
         system_output: SystemOutputProps,
         custom_dataset: SystemOutputProps | None = None,
+        async_processing: bool = False,
     ) -> System:
         """
         Create a system given metadata and outputs, etc.
+
+        If `async_processing` and background jobs are enabled, the system is saved
+        with status `pending` and returned right away. The outputs are processed by
+        a background job which updates the status when it is done.
         """
 
         def _validate_and_create_system():
@@ -273,6 +346,18 @@ class SystemDBUtils:
 
         system = _validate_and_create_system()
 
+        job_queue = get_job_queue() if async_processing else None
+        if job_queue:
+            SystemDBUtils._check_interrupted_systems()
+            system.status = SystemModel._STATUS_PENDING
+            system.save_to_db()
+            job_queue.submit(
+                lambda: SystemDBUtils._process_pending_system(
+                    system, system_output, custom_dataset
+                )
+            )
+            return system
+
         try:
             # -- load the system output into memory from the uploaded file(s)
             system_output_data = SystemDBUtils._load_sys_output(
@@ -295,8 +380,103 @@ class SystemDBUtils:
                     abort_with_error_message(400, str(e))
 
             DBUtils.execute_transaction(db_operations)
+            SystemDBUtils._bump_generations(system)
             return system
 
+    @staticmethod
+    def fail_interrupted_systems() -> int:
+        """
+        Marks the systems that are still pending or processing
+        `SYSTEM_JOB_TIMEOUT_SECONDS` after they were submitted as failed. Their job
+        was lost (e.g. the worker that ran it was restarted) and can't be resumed
+        because the outputs were only kept in memory. Returns the number of systems
+        marked as failed.
+        """
+        timeout = timedelta(
+            seconds=current_app.config.get("SYSTEM_JOB_TIMEOUT_SECONDS", 3600)
+        )
+        return DBUtils.update_many(
+            DBUtils.DEV_SYSTEM_METADATA,
+            {
+                "status": {
+                    "$in": [
+                        SystemModel._STATUS_PENDING,
+                        SystemModel._STATUS_PROCESSING,
+                    ]
+                },
+                "created_at": {"$lt": datetime.utcnow() - timeout},
+            },
+            {
+                "status": SystemModel._STATUS_FAILED,
+                "status_message": "processing was interrupted, please submit the "
+                "system again",
+            },
+        )
+
+    @staticmethod
+    def _check_interrupted_systems() -> None:
+        """Runs `fail_interrupted_systems` at most once a minute per process, so
+        jobs lost while the app keeps running are eventually reported."""
+        global _interrupted_systems_checked_at
+        now = time.monotonic()
+        if (
+            _interrupted_systems_checked_at is not None
+            and now - _interrupted_systems_checked_at < 60
+        ):
+            return
+        _interrupted_systems_checked_at = now
+        SystemDBUtils.fail_interrupted_systems()
+
+    @staticmethod
+    def _process_pending_system(
+        system: SystemModel,
+        system_output: SystemOutputProps,
+        custom_dataset: SystemOutputProps | None,
+    ) -> None:
+        """
+        Loads and analyzes the outputs of a system saved with status `pending`. The
+        outcome is recorded in the status of the system instead of being raised.
+        """
+        DBUtils.update_one_by_id(
+            DBUtils.DEV_SYSTEM_METADATA,
+            system.system_id,
+            {"status": SystemModel._STATUS_PROCESSING},
+        )
+        try:
+            system_output_data = SystemDBUtils._load_sys_output(
+                system, system_output, custom_dataset
+            )
+
+            def db_operations(session: ClientSession) -> None:
+                system.save_system_output(system_output_data, session)
+                system.update_overall_statistics(session)
+                system.status = SystemModel._STATUS_READY
+                DBUtils.update_one_by_id(
+                    DBUtils.DEV_SYSTEM_METADATA,
+                    system.system_id,
+                    {"status": system.status},
+                    session=session,
+                )
+
+            DBUtils.execute_transaction(db_operations)
+        except Exception as e:
+            logging.getLogger().exception(
+                f"failed to process system {system.system_id}"
+            )
+            # ValueErrors are caused by invalid inputs and are safe to show
+            DBUtils.update_one_by_id(
+                DBUtils.DEV_SYSTEM_METADATA,
+                system.system_id,
+                {
+                    "status": SystemModel._STATUS_FAILED,
+                    "status_message": str(e)
+                    if isinstance(e, ValueError)
+                    else "internal error, please contact the sysadmins",
+                },
+            )
+        else:
+            SystemDBUtils._bump_generations(system)
+
     @staticmethod
     def update_system_by_id(system_id: str, metadata: SystemMetadataUpdatable) -> bool:
         document = metadata.to_dict()
@@ -313,9 +493,25 @@ class SystemDBUtils:
             "system_tags": metadata.system_tags,
         }
 
-        return DBUtils.update_one_by_id(
-            DBUtils.DEV_SYSTEM_METADATA, system_id, field_to_value
+        # the previous values tell if the document was modified and the task and
+        # dataset give the generation counters to bump, without another query
+        sys_doc = DBUtils.find_one_by_id_and_update(
+            DBUtils.DEV_SYSTEM_METADATA,
+            system_id,
+            field_to_value,
+            projection={field: True for field in ["task", "dataset", *field_to_value]},
+        )
+        if sys_doc is None or all(
+            field in sys_doc and sys_doc[field] == value
+            for field, value in field_to_value.items()
+        ):
+            return False
+        SystemGenerationDBUtils.bump(
+            SystemGenerationDBUtils.keys_of_system(
+                sys_doc.get("task"), (sys_doc.get("dataset") or {}).get("dataset_name")
+            )
         )
+        return True
 
     @staticmethod
     def find_system_by_id(system_id: str):
@@ -374,6 +570,45 @@ class SystemDBUtils:
             abort_with_error_message(400, "invalid case_ids")
         return [SystemDBUtils.analysis_case_from_dict(doc) for doc in sys_data]
 
+    @staticmethod
+    def _strip_id(dikt: dict[str, Any]) -> dict[str, Any]:
+        dikt.pop("_id", None)
+        return dikt
+
+    @staticmethod
+    def iter_system_outputs(
+        system: SystemModel, output_ids: list[int] | None
+    ) -> Iterator[dict]:
+        """
+        Same as find_system_outputs but yields the outputs as dicts one at a time.
+        Outputs are decoded incrementally if all outputs are requested.
+        """
+        if output_ids is None:
+            sys_data: Iterator[dict] = system.iter_raw_system_outputs()
+        else:
+            try:
+                sys_data = iter(system.get_raw_system_outputs(output_ids))
+            except ValueError:
+                abort_with_error_message(400, "invalid output_ids")
+        return (SystemDBUtils._strip_id(doc) for doc in sys_data)
+
+    @staticmethod
+    def iter_analysis_cases(
+        system: SystemModel, level: str, case_ids: list[int] | None
+    ) -> Iterator[dict]:
+        """
+        Same as find_analysis_cases but yields the cases as dicts one at a time.
+        Cases are decoded incrementally if all cases are requested.
+        """
+        try:
+            if case_ids is None:
+                sys_data: Iterator[dict] = system.iter_raw_analysis_cases(level)
+            else:
+                sys_data = iter(system.get_raw_analysis_cases(level, case_ids))
+        except ValueError:
+            abort_with_error_message(400, "invalid case_ids")
+        return (SystemDBUtils._strip_id(doc) for doc in sys_data)
+
     @staticmethod
     def delete_system_by_id(system_id: str) -> None:
         """aborts if the system does not exist or if the user doesn't have permission"""
@@ -384,8 +619,20 @@ class SystemDBUtils:
         if sys.creator != user.id:
             abort_with_error_message(403, "you can only delete your own systems")
         sys.delete()
+        SystemDBUtils._bump_generations(sys)
+        SignificanceTestDBUtils.delete_results_of_system(system_id)
+
+    @staticmethod
+    def _bump_generations(system: SystemModel) -> None:
+        """Invalidates the results computed from the systems that include `system`"""
+        SystemGenerationDBUtils.bump(
+            SystemGenerationDBUtils.keys_of_system(
+                system.task, system.dataset.dataset_name if system.dataset else None
+            )
+        )
 
 
 class FindSystemsReturn(NamedTuple):
     systems: list[SystemModel]
-    total: int
+    # None if the systems are not counted
+    total: int | None
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from pymongo import UpdateOne
+
+from explainaboard_web.impl.db_utils.db_utils import DBUtils
+
+
+class SystemGenerationDBUtils:
+    """Counters that are incremented whenever a system is created, updated or
+    deleted. Each counter covers the systems that match a key: all the systems, the
+    systems of a task or the systems evaluated on a dataset. Results computed from a
+    set of systems (e.g. leaderboards) stay valid as long as the counters of the keys
+    covering that set don't change.
+
+    The counters are stored in the DB so they are shared by all the workers.
+    """
+
+    ALL_KEY = "all"
+
+    @staticmethod
+    def task_key(task: str) -> str:
+        return f"task:{task}"
+
+    @staticmethod
+    def dataset_key(dataset_name: str) -> str:
+        return f"dataset:{dataset_name}"
+
+    @staticmethod
+    def keys_of_system(task: str | None, dataset_name: str | None) -> list[str]:
+        """The keys whose systems are affected when a system changes."""
+        keys = [SystemGenerationDBUtils.ALL_KEY]
+        if task:
+            keys.append(SystemGenerationDBUtils.task_key(task))
+        if dataset_name:
+            keys.append(SystemGenerationDBUtils.dataset_key(dataset_name))
+        return keys
+
+    @staticmethod
+    def bump(keys: list[str]) -> None:
+        """Increments the counters of `keys` in one round trip. It should be called
+        after the transaction that modifies the systems is committed so that anyone
+        who sees the new counters also sees the modified systems."""
+        if not keys:
+            return
+        # upserts create the collection if it doesn't exist
+        DBUtils.get_collection(
+            DBUtils.SYSTEM_GENERATIONS, check_collection_exist=False
+        ).bulk_write(
+            [
+                UpdateOne({"_id": key}, {"$inc": {"generation": 1}}, upsert=True)
+                for key in keys
+            ],
+            ordered=False,
+        )
+
+    @staticmethod
+    def find_generations(keys: list[str]) -> dict[str, int]:
+        """Returns the counters of `keys`. Counters that have never been incremented
+        are 0."""
+        cursor = DBUtils.get_collection(
+            DBUtils.SYSTEM_GENERATIONS, check_collection_exist=False
+        ).find({"_id": {"$in": keys}})
+        generations = {key: 0 for key in keys}
+        for doc in cursor:
+            generations[doc["_id"]] = doc["generation"]
+        return generations
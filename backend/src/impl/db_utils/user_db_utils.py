@@ -1,13 +1,26 @@
 from __future__ import annotations
 
 import logging
+from typing import Final
 
-from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from flask import g, has_app_context
+
+from explainaboard_web.impl.caching import TTLCache
+from explainaboard_web.impl.db_utils.db_utils import CountMode, DBUtils
 from explainaboard_web.impl.utils import abort_with_error_message
 from explainaboard_web.models.user import User
 
 
 class UserDBUtils:
+
+    # id -> user document (see caching.py). Users are only cached by id: lookups
+    # by email authenticate API keys so they always read `api_key` and
+    # `email_verified` from the DB, which also checks that the email matches a
+    # single user. The `email_verified` of a cached user may be stale but it is
+    # only read by `check_BearerAuth`, which overwrites it with the claim of the
+    # token. Firebase user ids are not emails so ids and emails don't collide.
+    _user_cache: Final[TTLCache[str, dict]] = TTLCache(maxsize=1024, ttl=60)
+
     @staticmethod
     def insert_preferred_username(doc: dict) -> None:
         user = UserDBUtils.find_users([doc["creator"]])[0]
@@ -27,40 +40,106 @@ class UserDBUtils:
         doc["_id"] = doc["id"]
         doc.pop("id")
         DBUtils.insert_one(DBUtils.USER_METADATA, doc)
+        UserDBUtils._remember(doc)
+        return user
+
+    @staticmethod
+    def _request_scope() -> dict[str, User]:
+        """Users looked up by the current request, keyed by id and email, so the
+        request sees the same user objects throughout."""
+        if not has_app_context():
+            return {}
+        if "_users" not in g:
+            g._users = {}
+        return g._users
+
+    @staticmethod
+    def _remember(doc: dict) -> User:
+        """Caches a user document and returns the user"""
+        UserDBUtils._user_cache.set(doc["_id"], doc)
+        user = User.from_dict({**doc, "id": doc["_id"]})
+        scope = UserDBUtils._request_scope()
+        scope[user.id] = user
+        if user.email:
+            scope[user.email] = user
+        return user
+
+    @staticmethod
+    def _find_cached(id_or_email: str) -> User | None:
+        user = UserDBUtils._request_scope().get(id_or_email)
+        if user is None:
+            doc = UserDBUtils._user_cache.get(id_or_email)
+            if doc is not None:
+                user = UserDBUtils._remember(doc)
         return user
 
+    @staticmethod
+    def _invalidate(user: User) -> None:
+        scope = UserDBUtils._request_scope()
+        UserDBUtils._user_cache.pop(user.id)
+        for key in (user.id, user.email):
+            if key:
+                scope.pop(key, None)
+
+    @staticmethod
+    def cache_stats() -> dict[str, int]:
+        return UserDBUtils._user_cache.stats()
+
     @staticmethod
     def find_user(id_or_email: str) -> User | None:
-        docs, total = DBUtils.find(
+        user = UserDBUtils._find_cached(id_or_email)
+        if user:
+            return user
+        # two documents are enough to tell if there are multiple matches
+        cursor, _ = DBUtils.find(
             DBUtils.USER_METADATA,
             filt={"$or": [{"_id": id_or_email}, {"email": id_or_email}]},
+            limit=2,
+            count=CountMode.NONE,
         )
-        if total == 0:
+        docs = list(cursor)
+        if len(docs) == 0:
             return None
-        elif total == 1:
-            doc = next(docs)
-            doc["id"] = doc["_id"]
-            return User.from_dict(doc)
+        elif len(docs) == 1:
+            return UserDBUtils._remember(docs[0])
         raise RuntimeError(f"{id_or_email} matches multiple users")
 
     @staticmethod
     def find_users(ids: list[str]) -> list[User]:
-        filt = {"_id": {"$in": ids}}
-        cursor, _ = DBUtils.find(DBUtils.USER_METADATA, filt=filt, limit=0)
+        """Returns the users in the order of `ids`. Users that are not cached are
+        retrieved with one query."""
+        ids = list(dict.fromkeys(ids))
+        found: dict[str, User] = {}
+        missing_ids: list[str] = []
+        for _id in ids:
+            user = UserDBUtils._find_cached(_id)
+            if user and user.id == _id:
+                found[_id] = user
+            else:
+                missing_ids.append(_id)
 
-        users = []
-
-        for doc in cursor:
-            doc["id"] = doc["_id"]
-            users.append(User.from_dict(doc))
+        if missing_ids:
+            filt = {"_id": {"$in": missing_ids}}
+            cursor, _ = DBUtils.find(
+                DBUtils.USER_METADATA, filt=filt, limit=0, count=CountMode.NONE
+            )
+            for doc in cursor:
+                found[doc["_id"]] = UserDBUtils._remember(doc)
 
-        if len(users) < len(ids):
-            found_ids = {x.id for x in users}
-            missing_ids = [id for id in ids if id not in found_ids]
+        if len(found) < len(ids):
+            missing_ids = [id for id in ids if id not in found]
             logging.getLogger().error(
                 f"system creator ID(s) {missing_ids} not found in DB"
             )
             abort_with_error_message(
                 500, "system creator not found in DB, please contact the system admins"
             )
-        return users
+        return [found[_id] for _id in ids]
+
+    @staticmethod
+    def update_email_verified(user: User, email_verified: bool) -> None:
+        DBUtils.update_one_by_id(
+            DBUtils.USER_METADATA, user.id, {"email_verified": email_verified}
+        )
+        UserDBUtils._invalidate(user)
+        user.email_verified = email_verified
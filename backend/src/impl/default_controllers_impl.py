@@ -5,6 +5,7 @@ import datetime
 import json
 import logging
 import os
+from collections.abc import Iterable
 from functools import lru_cache
 
 import pandas as pd
@@ -20,20 +21,28 @@ from explainaboard.analysis.case import AnalysisCase
 from explainaboard.info import SysOutputInfo
 from explainaboard.metrics.metric import SimpleMetricStats
 from explainaboard.serialization.serializers import PrimitiveSerializer
-from explainaboard.utils.cache_api import get_cache_dir, open_cached_file, sanitize_path
 from explainaboard.utils.typing_utils import narrow
-from flask import current_app
+from flask import Response, current_app, request, stream_with_context
 from pymongo import ASCENDING, DESCENDING
 from pymongo.client_session import ClientSession
 
 from explainaboard_web.impl.analyses.significance_analysis import (
+    multi_system_significance_test,
     pairwise_significance_test,
 )
 from explainaboard_web.impl.auth import get_user
+from explainaboard_web.impl.concurrency import StageTimer, map_in_threads
+from explainaboard_web.impl.db import get_pool_stats
 from explainaboard_web.impl.db_utils.benchmark_db_utils import BenchmarkDBUtils
 from explainaboard_web.impl.db_utils.dataset_db_utils import DatasetDBUtils
-from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.db_utils.db_utils import CountMode, DBUtils
+from explainaboard_web.impl.db_utils.significance_test_db_utils import (
+    SignificanceTestDBCache,
+    significance_test_seed,
+)
 from explainaboard_web.impl.db_utils.system_db_utils import SystemDBUtils
+from explainaboard_web.impl.db_utils.user_db_utils import UserDBUtils
+from explainaboard_web.impl.internal_models.system_model import SystemModel
 from explainaboard_web.impl.language_code import get_language_codes
 from explainaboard_web.impl.metric_descriptions import get_metric_descriptions
 from explainaboard_web.impl.private_dataset import is_private_dataset
@@ -90,6 +99,36 @@ def _has_read_access(obj: System | BenchmarkConfig) -> bool:
     )
 
 
+def _abort_if_not_ready(system: System) -> None:
+    """aborts if the system is still being processed or its processing failed"""
+    if system.status not in (None, SystemModel._STATUS_READY):
+        abort_with_error_message(
+            409, f"system {system.system_id} is {system.status}", 40901
+        )
+
+
+_NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def _ndjson_requested() -> bool:
+    """check if the client prefers a streamed NDJSON response over a JSON array"""
+    return (
+        request.accept_mimetypes.best_match(["application/json", _NDJSON_MIMETYPE])
+        == _NDJSON_MIMETYPE
+    )
+
+
+def _ndjson_response(items: Iterable[dict]) -> Response:
+    """streams `items` as newline delimited JSON. Items are serialized as they are
+    produced so the response never has to be held in memory."""
+
+    def generate():
+        for item in items:
+            yield json.dumps(item) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype=_NDJSON_MIMETYPE)
+
+
 """ /info """
 
 
@@ -102,6 +141,22 @@ def info_get():
     }
 
 
+def info_stats_get():
+    """the counters change on every request so they are not cached"""
+    if not get_user():
+        abort_with_error_message(401, "login required")
+    return {
+        "db_stats": {
+            **DBUtils.collection_registry_stats(),
+            **get_pool_stats(),
+            **{
+                f"user_cache_{name}": value
+                for name, value in UserDBUtils.cache_stats().items()
+            },
+        },
+    }
+
+
 """ /user """
 
 
@@ -203,8 +258,10 @@ def benchmark_get_by_id(benchmark_id: str, by_creator: bool) -> Benchmark:
     if config.type == "abstract":
         return Benchmark(config, None, None)
     file_path = benchmark_id + "_benchmark.json"
-    benchmark_file = open_cached_file(file_path, datetime.timedelta(seconds=1))
-    if not benchmark_file:
+    # the cached result stays valid until a system of the benchmark changes
+    signature = BenchmarkDBUtils.benchmark_signature(config)
+    json_dict = BenchmarkDBUtils.load_cached_result(file_path, signature)
+    if json_dict is None:
         sys_infos = BenchmarkDBUtils.load_sys_infos(config)
         orig_df = BenchmarkDBUtils.generate_dataframe_from_sys_infos(config, sys_infos)
 
@@ -218,17 +275,16 @@ def benchmark_get_by_id(benchmark_id: str, by_creator: bool) -> Benchmark:
         creator_dict = {k: v.to_dict() for k, v in creator_dfs}
 
         json_dict = {"system": system_dict, "creator": creator_dict}
-        benchmark_file = os.path.join(get_cache_dir(), sanitize_path(file_path))
-        with open(benchmark_file, "w") as outfile:
-            json.dump(json_dict, outfile)
+        json_dict = BenchmarkDBUtils.save_cached_result(file_path, signature, json_dict)
     update_time = (
-        datetime.datetime.fromtimestamp(os.path.getmtime(benchmark_file))
+        datetime.datetime.fromtimestamp(
+            os.path.getmtime(BenchmarkDBUtils.cached_result_path(file_path))
+        )
     ).strftime("%m-%d-%Y %H:%M:%S")
-    f = open(benchmark_file)
     if by_creator:
-        view_dict = json.load(f)["creator"]
+        view_dict = json_dict["creator"]
     else:
-        view_dict = json.load(f)["system"]
+        view_dict = json_dict["system"]
     plot_dict = BenchmarkDBUtils.generate_plots(benchmark_id)
     views = []
     for k, v in view_dict.items():
@@ -347,7 +403,10 @@ def systems_post(body: SystemCreateProps) -> System:
         )
     else:
         system = SystemDBUtils.create_system(
-            body.metadata, body.system_output, body.custom_dataset
+            body.metadata,
+            body.system_output,
+            body.custom_dataset,
+            async_processing=bool(body.async_processing),
         )
         return system
 
@@ -367,6 +426,7 @@ def system_outputs_get_by_id(
     system_id: str, output_ids: list[int] | None
 ) -> list[SystemOutput]:
     """
+    Streams the result as NDJSON if the client accepts application/x-ndjson.
     TODO: return special error/warning if some ids cannot be found
     """
     system = SystemDBUtils.find_system_by_id(system_id)
@@ -382,7 +442,10 @@ def system_outputs_get_by_id(
         abort_with_error_message(
             403, f"{system.dataset.dataset_name} is a private dataset", 40301
         )
+    _abort_if_not_ready(system)
 
+    if _ndjson_requested():
+        return _ndjson_response(SystemDBUtils.iter_system_outputs(system, output_ids))
     return SystemDBUtils.find_system_outputs(system_id, output_ids)
 
 
@@ -392,6 +455,7 @@ def system_cases_get_by_id(
     case_ids: list[int] | None,
 ) -> list[AnalysisCase]:
     """
+    Streams the result as NDJSON if the client accepts application/x-ndjson.
     TODO: return special error/warning if some ids cannot be found
     """
     system = SystemDBUtils.find_system_by_id(system_id)
@@ -407,7 +471,12 @@ def system_cases_get_by_id(
         abort_with_error_message(
             403, f"{system.dataset.dataset_name} is a private dataset", 40301
         )
+    _abort_if_not_ready(system)
 
+    if _ndjson_requested():
+        return _ndjson_response(
+            SystemDBUtils.iter_analysis_cases(system, level=level, case_ids=case_ids)
+        )
     return SystemDBUtils.find_analysis_cases(system_id, level=level, case_ids=case_ids)
 
 
@@ -416,24 +485,94 @@ def systems_delete_by_id(system_id: str):
     return "Success"
 
 
+def _load_analysis_inputs(
+    system: SystemModel,
+    feature_to_bucket_info: dict,
+) -> tuple[SysOutputInfo, list[list[AnalysisCase]], list[dict[str, SimpleMetricStats]]]:
+    """Loads what `_perform_analyses` needs from the DB and storage"""
+    system_output_info: SysOutputInfo = system.get_system_info()
+
+    for analysis in system_output_info.analyses:
+        if (
+            isinstance(analysis, BucketAnalysis)
+            and analysis.feature in feature_to_bucket_info
+        ):
+            # The "fixed" method is required for SDK to perform
+            # custom-interval analysis
+            analysis.method = "fixed"
+            analysis.number = feature_to_bucket_info[analysis.feature].number
+            # Convert interval to type tuple so it becomes hashable,
+            # as required by SDK
+            analysis.setting = [
+                (interval[0], interval[1])
+                for interval in feature_to_bucket_info[analysis.feature].setting
+            ]
+
+    logging.getLogger().warning("user-defined bucket analyses are not re-implemented")
+
+    metric_stats = [
+        {metric_name: SimpleMetricStats(stats) for metric_name, stats in level.items()}
+        for level in system.get_metric_stats()
+    ]
+
+    # Get analysis cases
+    analysis_cases = []
+    for analysis_level in system_output_info.analysis_levels:
+        level_cases = [
+            SystemDBUtils.analysis_case_from_dict(x)
+            for x in system.get_raw_analysis_cases(analysis_level.name, case_ids=None)
+        ]
+        # Note we are casting here, as SystemOutput.from_dict() actually just
+        # returns a dict
+        level_cases = [AnalysisCase.from_dict(narrow(dict, x)) for x in level_cases]
+        analysis_cases.append(level_cases)
+    return system_output_info, analysis_cases, metric_stats
+
+
+def _perform_analyses(
+    system_output_info: SysOutputInfo,
+    analysis_cases: list[list[AnalysisCase]],
+    metric_stats: list[dict[str, SimpleMetricStats]],
+) -> list:
+    """CPU-bound part of `systems_analyses_post`"""
+    processor = get_processor_class(TaskType(system_output_info.task_name))()
+    return processor.perform_analyses(
+        system_output_info,
+        analysis_cases,
+        metric_stats,
+        skip_failed_analyses=True,
+    )
+
+
 def systems_analyses_post(body: SystemsAnalysesBody):
+    """
+    Per-system timings of each stage are reported in the Server-Timing header. The
+    systems are loaded and analyzed concurrently if `ANALYSIS_THREAD_WORKERS` is
+    set. They are refreshed in a single transaction so the refresh of all the
+    systems is all or nothing.
+    """
     system_ids_str = body.system_ids
     feature_to_bucket_info = body.feature_to_bucket_info
+    thread_workers: int = current_app.config.get("ANALYSIS_THREAD_WORKERS", 0)
+    timer = StageTimer()
 
     system_analyses: list[SingleAnalysis] = []
     system_ids: list = system_ids_str.split(",")
     page = 0
     page_size = len(system_ids)
     systems = SystemDBUtils.find_systems(
-        ids=system_ids, page=page, page_size=page_size
+        ids=system_ids, page=page, page_size=page_size, count=CountMode.NONE
     ).systems
     if len(systems) == 0:
         return SystemAnalysesReturn(system_analyses)
+    for sys in systems:
+        _abort_if_not_ready(sys)
 
     def update_overall_statistics(session: ClientSession) -> None:
         for sys in systems:
             # refresh overall_statistics if it is outdated
-            sys.update_overall_statistics(session=session)
+            with timer.time(sys.system_id, "refresh"):
+                sys.update_overall_statistics(session=session)
 
     DBUtils.execute_transaction(update_overall_statistics)
 
@@ -454,66 +593,76 @@ def systems_analyses_post(body: SystemsAnalysesBody):
             for name, stats in systems[1].get_metric_stats()[0].items()
         }
 
+        n_samples = body.n_samples or 1000
+        prop_samples = body.prop_samples or 0.5
+        early_stopping_alpha = 0.05 if body.early_stopping else None
+        significance_cache = SignificanceTestDBCache(
+            systems[0].system_id,
+            systems[1].system_id,
+            n_samples,
+            prop_samples,
+            early_stopping_alpha,
+            SystemModel._CURRENT_SDK_VERSION,
+            (systems[0]._properties_version, systems[1]._properties_version),
+        )
         sig_info = pairwise_significance_test(
             system1_output_info,
             system2_output_info,
             system1_metric_stats,
             system2_metric_stats,
+            n_samples=n_samples,
+            prop_samples=prop_samples,
+            early_stopping_alpha=early_stopping_alpha,
+            seed=significance_cache.seed,
+            cache=significance_cache,
         )
-
-    system_output_infos = []
-    for system in systems:
-        system_output_info: SysOutputInfo = system.get_system_info()
-
-        for analysis in system_output_info.analyses:
-            if (
-                isinstance(analysis, BucketAnalysis)
-                and analysis.feature in feature_to_bucket_info
-            ):
-                # The "fixed" method is required for SDK to perform
-                # custom-interval analysis
-                analysis.method = "fixed"
-                analysis.number = feature_to_bucket_info[analysis.feature].number
-                # Convert interval to type tuple so it becomes hashable,
-                # as required by SDK
-                analysis.setting = [
-                    (interval[0], interval[1])
-                    for interval in feature_to_bucket_info[analysis.feature].setting
-                ]
-
-        logging.getLogger().warning(
-            "user-defined bucket analyses are not " "re-implemented"
+    # significance tests between all the pairs of systems otherwise. Early stopping
+    # doesn't apply: all the pairs are tested on the same samples.
+    significance_matrix = None
+    if len(systems) > 2:
+        n_samples = body.n_samples or 1000
+        prop_samples = body.prop_samples or 0.5
+        significance_matrix = multi_system_significance_test(
+            [sys.get_system_info() for sys in systems],
+            [
+                {
+                    name: SimpleMetricStats(stats)
+                    for name, stats in sys.get_metric_stats()[0].items()
+                }
+                for sys in systems
+            ],
+            n_samples=n_samples,
+            prop_samples=prop_samples,
+            # like the pairwise test, the same request returns the same matrix
+            seed=significance_test_seed(
+                sorted(sys.system_id for sys in systems),
+                {
+                    "n_samples": n_samples,
+                    "prop_samples": prop_samples,
+                    "sdk_version": SystemModel._CURRENT_SDK_VERSION,
+                },
+            ),
         )
 
-        metric_stats = [
-            {
-                metric_name: SimpleMetricStats(stats)
-                for metric_name, stats in level.items()
-            }
-            for level in system.get_metric_stats()
-        ]
+    def load_analysis_inputs(system: SystemModel):
+        with timer.time(system.system_id, "load"):
+            return _load_analysis_inputs(system, feature_to_bucket_info)
 
-        # Get analysis cases
-        analysis_cases = []
-        case_ids = None
-        for analysis_level in system.get_system_info().analysis_levels:
-            level_cases = SystemDBUtils.find_analysis_cases(
-                system_id=system.system_id,
-                level=analysis_level.name,
-                case_ids=case_ids,
-            )
-            # Note we are casting here, as SystemOutput.from_dict() actually just
-            # returns a dict
-            level_cases = [AnalysisCase.from_dict(narrow(dict, x)) for x in level_cases]
-            analysis_cases.append(level_cases)
-
-        processor = get_processor_class(TaskType(system_output_info.task_name))()
-        processor_result = processor.perform_analyses(
-            system_output_info,
-            analysis_cases,
-            metric_stats,
-            skip_failed_analyses=True,
-        )
+    analysis_inputs = map_in_threads(load_analysis_inputs, systems, thread_workers)
+
+    def perform_analyses(system_and_inputs: tuple[SystemModel, tuple]) -> list:
+        system, inputs = system_and_inputs
+        with timer.time(system.system_id, "analyses"):
+            return _perform_analyses(*inputs)
+
+    processor_results = map_in_threads(
+        perform_analyses, zip(systems, analysis_inputs), thread_workers
+    )
+
+    system_output_infos = []
+    for (system_output_info, _, _), processor_result in zip(
+        analysis_inputs, processor_results
+    ):
         single_analysis = SingleAnalysis(
             system_info=SystemInfo.from_dict(serializer.serialize(system_output_info)),
             analysis_results=serializer.serialize(processor_result),
@@ -540,6 +689,14 @@ def systems_analyses_post(body: SystemsAnalysesBody):
             headers=headers,
         )
         system_insights = json.loads(r.text)
-        return SystemAnalysesReturn(system_analyses, sig_info, system_insights)
+        analyses_return = SystemAnalysesReturn(
+            system_analyses,
+            sig_info,
+            system_insights,
+            significance_matrix=significance_matrix,
+        )
     except Exception:
-        return SystemAnalysesReturn(system_analyses, sig_info)
+        analyses_return = SystemAnalysesReturn(
+            system_analyses, sig_info, significance_matrix=significance_matrix
+        )
+    return analyses_return, 200, {"Server-Timing": timer.to_server_timing()}
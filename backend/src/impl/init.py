@@ -1,18 +1,24 @@
+import logging
 import os
 
 from flask import Flask, request
+from pymongo.errors import PyMongoError
 
 from explainaboard_web.impl.config import (
     LocalDevelopmentConfig,
     ProductionConfig,
     StagingConfig,
 )
+from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.db_utils.system_db_utils import SystemDBUtils
 from explainaboard_web.impl.utils import abort_with_error_message, get_api_version
 
 
 def init(app: Flask) -> Flask:
     """Initializes the flask app"""
     _init_config(app)
+    _init_collection_registry(app)
+    _init_interrupted_systems(app)
 
     @app.before_request
     def check_api_version():
@@ -38,3 +44,31 @@ def _init_config(app: Flask):
         app.config.from_object(LocalDevelopmentConfig())
     elif env == "staging":
         app.config.from_object(StagingConfig())
+
+
+def _init_collection_registry(app: Flask):
+    """Lists the existing collections once at startup. If the DB is unreachable,
+    the collections are listed on first use instead."""
+    if not app.config.get("DATABASE_URI"):
+        return
+    try:
+        with app.app_context():
+            DBUtils.refresh_collection_registry()
+    except PyMongoError:
+        logging.getLogger().warning(
+            "failed to list collections at startup", exc_info=True
+        )
+
+
+def _init_interrupted_systems(app: Flask):
+    """Marks the systems whose job was lost by a previous run of the app as failed
+    (see `SystemDBUtils.fail_interrupted_systems`)."""
+    if not app.config.get("DATABASE_URI"):
+        return
+    try:
+        with app.app_context():
+            SystemDBUtils.fail_interrupted_systems()
+    except PyMongoError:
+        logging.getLogger().warning(
+            "failed to check for interrupted systems at startup", exc_info=True
+        )
@@ -5,6 +5,7 @@ from __future__ import annotations
 import dataclasses
 import json
 import re
+from collections.abc import Iterator
 from datetime import datetime
 from importlib.metadata import version
 from typing import Any, Final
@@ -17,24 +18,61 @@ from explainaboard.metrics.metric import MetricConfig, Score
 from explainaboard.serialization.serializers import PrimitiveSerializer
 from pymongo.client_session import ClientSession
 
+from explainaboard_web.impl.caching import TTLCache
+from explainaboard_web.impl.chunked_blob import (
+    ChunkIndex,
+    download_chunked,
+    iter_chunked,
+    upload_chunked,
+)
+from explainaboard_web.impl.columnar_blob import (
+    download_columnar,
+    encode_columnar,
+    iter_columnar,
+)
 from explainaboard_web.impl.db_utils.db_utils import DBUtils
 from explainaboard_web.impl.storage import get_storage
 from explainaboard_web.impl.utils import (
     abort_with_error_message,
     binarize_bson,
+    iter_json_array,
     unbinarize_bson,
 )
 from explainaboard_web.models.system import System
 
 
 class SystemModel(System):
-
-    _SYSTEM_OUTPUT_CONST: Final = "__SYSOUT__"
-    _CURRENT_SDK_VERSION: Final = version("explainaboard")
     """Same as System but implements several helper functions that retrieves
     additional information and persists data to the DB.
     """
 
+    # legacy format: all system outputs are stored as one compressed JSON list
+    _SYSTEM_OUTPUT_CONST: Final = "__SYSOUT__"
+    # system outputs are stored in chunks (see chunked_blob.py). The chunk index is
+    # stored in `system_output_index`.
+    _CHUNKED_SYSTEM_OUTPUT_CONST: Final = "__SYSOUT_CHUNKED__"
+    # analysis cases are stored in the columnar format (see columnar_blob.py) in
+    # blobs whose names end with this suffix. Their indexes are stored in
+    # `analysis_cases_index`. Cases that can't be stored as columns and cases of
+    # older systems are stored as one compressed JSON list.
+    _COLUMNAR_ANALYSIS_CASES_SUFFIX: Final = ".arrow"
+    _CURRENT_SDK_VERSION: Final = version("explainaboard")
+    # values of `status`. Systems created before `status` was introduced don't
+    # have one and are ready.
+    _STATUS_PENDING: Final = "pending"
+    _STATUS_PROCESSING: Final = "processing"
+    _STATUS_READY: Final = "ready"
+    _STATUS_FAILED: Final = "failed"
+
+    # system_id -> (properties_version, private properties) (see caching.py)
+    _properties_cache: Final[TTLCache[str, tuple[str | None, dict]]] = TTLCache(
+        maxsize=256, ttl=60
+    )
+    # `properties_version` of the document the system was loaded from. It is an
+    # internal field that changes whenever the private properties change, unlike
+    # `last_modified` which records the changes made by users.
+    _properties_version: str | None = None
+
     @classmethod
     def from_dict(cls, dikt: dict) -> SystemModel:
         """Validates and initialize a SystemModel object from a dict"""
@@ -60,32 +98,63 @@ class SystemModel(System):
         if system_tags is None or len(system_tags) == 0:
             document["system_tags"] = []
 
-        return super().from_dict(document)
+        properties_version = document.pop("properties_version", None)
+        system = super().from_dict(document)
+        system._properties_version = properties_version
+        return system
+
+    @staticmethod
+    def _new_blob_name(system_id: str, name: str) -> str:
+        """Returns a blob name that hasn't been used before. Blobs are never
+        overwritten: the blob caches of other hosts would keep serving the old
+        contents (see `BlobCache`)."""
+        return f"{system_id}/{name}-{ObjectId()}"
+
+    @staticmethod
+    def _new_properties_version() -> str:
+        """Returns a new value for `properties_version`. It must be set whenever the
+        private properties are updated so other processes don't keep using the
+        properties they cached."""
+        return str(ObjectId())
 
     def _get_private_properties(self, session: ClientSession | None = None) -> dict:
         """Retrieves privates properties of the system. These properties are meant
         for internal use only.
 
+        The properties are cached in memory (keyed by system_id and
+        properties_version) so the returned dict is shared and must not be modified.
+
         Args:
             session: A mongodb session. Private properties are stored in the DB so
                 we need to query the DB to retrieve this data. If multiple DB operations
                 needs to be performed in one session, the same session should be used
-                to query private properties.
-                TODO(lyuyang): cache this data in memory. Even if it is cached in
-                memory, session is still required in situations where we need to refresh
-                the cache.
+                to query private properties. The cache is bypassed if a session is
+                provided so reads within a transaction are always consistent.
 
         Raises:
             ValueError: The system cannot be found in the DB. This method should not be
                 called on a system that hasn't been created or has been deleted.
         """
+        if session is None:
+            cached = self._properties_cache.get(self.system_id)
+            if cached is not None and cached[0] == self._properties_version:
+                return cached[1]
         sys_doc = DBUtils.find_one_by_id(
             DBUtils.DEV_SYSTEM_METADATA, self.system_id, session=session
         )
         if not sys_doc:
             raise ValueError(f"system {self.system_id} does not exist in the DB")
+        if session is None:
+            self._properties_cache.set(
+                self.system_id, (sys_doc.get("properties_version"), sys_doc)
+            )
         return sys_doc
 
+    def _invalidate_private_properties(self) -> None:
+        """Removes the cached private properties of this system. It should be called
+        whenever the private properties are modified."""
+        self._properties_cache.pop(self.system_id)
+
     def get_system_info(self) -> SysOutputInfo:
         """retrieves system info from DB"""
         properties = self._get_private_properties()
@@ -123,14 +192,10 @@ class SystemModel(System):
         """Saves `system_output` to storage. If `system_output` has been saved
         previously, it is replaced with the new one."""
         properties = self._get_private_properties(session=session)
-        if properties.get("system_output"):
-            # delete previously saved system_output
-            get_storage().delete([properties["system_output"]])
-        blob_name = f"{self.system_id}/{self._SYSTEM_OUTPUT_CONST}"
-        get_storage().compress_and_upload(
-            blob_name,
-            json.dumps(system_output.samples),
+        blob_name = self._new_blob_name(
+            self.system_id, self._CHUNKED_SYSTEM_OUTPUT_CONST
         )
+        chunk_index = upload_chunked(get_storage(), blob_name, system_output.samples)
         system_output_metadata = dataclasses.asdict(system_output.metadata)
 
         serializer = PrimitiveSerializer()
@@ -144,15 +209,22 @@ class SystemModel(System):
             system_output.metadata.custom_analyses
         )
 
+        self._properties_version = self._new_properties_version()
         DBUtils.update_one_by_id(
             DBUtils.DEV_SYSTEM_METADATA,
             self.system_id,
             {
                 "system_output": blob_name,
+                "system_output_index": chunk_index.to_dict(),
                 "system_output_metadata": system_output_metadata,
+                "properties_version": self._properties_version,
             },
             session=session,
         )
+        DBUtils.after_commit(session, self._invalidate_private_properties)
+        if properties.get("system_output"):
+            # delete previously saved system_output
+            get_storage().delete([properties["system_output"]])
 
     def update_overall_statistics(
         self, session: ClientSession, force_update=False
@@ -230,20 +302,27 @@ class SystemModel(System):
                             Score, "score"
                         ).value
             serializer = PrimitiveSerializer()
+            analysis_cases, analysis_cases_index = update_analysis_cases()
+            self._properties_version = self._new_properties_version()
             system_update_values = {
                 "results": self.results,
+                "properties_version": self._properties_version,
                 # cache
                 "sdk_version_used": self._CURRENT_SDK_VERSION,
                 "system_info": serializer.serialize(sys_info),
                 "metric_stats": binarized_metric_stats,
-                "analysis_cases": update_analysis_cases(),
+                "analysis_cases": analysis_cases,
+                "analysis_cases_index": analysis_cases_index,
             }
             return system_update_values
 
-        def update_analysis_cases() -> dict[str, str]:
-            """saves analysis cases to storage and returns an updated analysis_cases
-            dict for the DB"""
+        def update_analysis_cases() -> tuple[dict[str, str], dict[str, dict]]:
+            """saves analysis cases to storage and returns updated analysis_cases
+            and analysis_cases_index dicts for the DB"""
             analysis_cases_lookup: dict[str, str] = {}  # level: data_path
+            analysis_cases_index: dict[str, dict] = {}  # level: columnar index
+            blobs: list[tuple[str, bytes]] = []
+            storage = get_storage()
 
             # Update analysis cases
             for analysis_level, analysis_cases in zip(
@@ -252,10 +331,18 @@ class SystemModel(System):
             ):
                 case_list = [dataclasses.asdict(v) for v in analysis_cases]
 
-                blob_name = f"{self.system_id}/{analysis_level.name}"
-                get_storage().compress_and_upload(blob_name, json.dumps(case_list))
+                blob_name = self._new_blob_name(self.system_id, analysis_level.name)
+                try:
+                    contents, index = encode_columnar(case_list)
+                    blob_name += self._COLUMNAR_ANALYSIS_CASES_SUFFIX
+                    analysis_cases_index[analysis_level.name] = index.to_dict()
+                except ValueError:
+                    contents = storage.compress(json.dumps(case_list).encode())
+                blobs.append((blob_name, contents))
                 analysis_cases_lookup[analysis_level.name] = blob_name
-            return analysis_cases_lookup
+            # the levels are uploaded concurrently
+            storage.upload_many(blobs)
+            return analysis_cases_lookup, analysis_cases_index
 
         update_values = generate_system_update_values()
         DBUtils.update_one_by_id(
@@ -264,6 +351,9 @@ class SystemModel(System):
             update_values,
             session=session,
         )
+        # invalidating before the commit would let concurrent readers cache the
+        # old properties again
+        DBUtils.after_commit(session, self._invalidate_private_properties)
         if properties.get("analysis_cases"):
             # remove stale data. This needs to be the last operation so it is
             # protected by the transaction.
@@ -278,8 +368,22 @@ class SystemModel(System):
         self, output_ids: list[int] | None, session: ClientSession | None = None
     ) -> list[dict]:
         """Downloads the system outputs and returns the outputs associated with
-        output_ids. If output_ids=None, all system outputs are returned."""
-        data_path: str = self._get_private_properties(session=session)["system_output"]
+        output_ids. If output_ids=None, all system outputs are returned.
+
+        Systems saved in the chunked format only download the chunks that contain
+        output_ids. Systems saved in the legacy format download everything.
+        """
+        properties = self._get_private_properties(session=session)
+        data_path: str = properties["system_output"]
+        if properties.get("system_output_index"):
+            chunk_index = ChunkIndex.from_dict(properties["system_output_index"])
+            try:
+                return download_chunked(
+                    get_storage(), data_path, chunk_index, output_ids
+                )
+            except IndexError as e:
+                raise ValueError(f"{output_ids=} contains invalid value") from e
+
         sys_data_str = get_storage().download_and_decompress(data_path)
         sys_data: list = json.loads(sys_data_str)
 
@@ -290,11 +394,23 @@ class SystemModel(System):
                 raise ValueError(f"{output_ids=} contains invalid value") from e
         return sys_data
 
-    def get_raw_analysis_cases(
-        self, analysis_level: str, case_ids: list[int] | None
-    ) -> list[dict]:
-        """Downloads the analysis cases for the analysis_level and returns the
-        cases associated with case_ids. If case_ids=None, all cases are returned."""
+    def iter_raw_system_outputs(self) -> Iterator[dict]:
+        """Same as `get_raw_system_outputs(output_ids=None)` but the outputs are
+        downloaded and decoded incrementally and yielded one at a time, so memory
+        usage is bounded regardless of the number of outputs."""
+        properties = self._get_private_properties()
+        data_path: str = properties["system_output"]
+        storage = get_storage()
+        if properties.get("system_output_index"):
+            chunk_index = ChunkIndex.from_dict(properties["system_output_index"])
+            return (
+                output
+                for chunk in iter_chunked(storage, data_path, chunk_index)
+                for output in chunk
+            )
+        return iter_json_array(storage.iter_decompressed(data_path))
+
+    def _get_analysis_cases_path(self, analysis_level: str) -> str:
         case_data_lookup: dict[str, str] = self._get_private_properties()[
             "analysis_cases"
         ]
@@ -303,7 +419,27 @@ class SystemModel(System):
                 f"analysis level {analysis_level} does not exist for"
                 f" system {self.system_id}"
             )
-        data_path = case_data_lookup[analysis_level]
+        return case_data_lookup[analysis_level]
+
+    def get_raw_analysis_cases(
+        self, analysis_level: str, case_ids: list[int] | None
+    ) -> list[dict]:
+        """Downloads the analysis cases for the analysis_level and returns the
+        cases associated with case_ids. If case_ids=None, all cases are returned.
+
+        Cases stored in the columnar format are converted to dicts only if they are
+        requested.
+        """
+        data_path = self._get_analysis_cases_path(analysis_level)
+        if data_path.endswith(self._COLUMNAR_ANALYSIS_CASES_SUFFIX):
+            index = ChunkIndex.from_dict(
+                self._get_private_properties()["analysis_cases_index"][analysis_level]
+            )
+            try:
+                return download_columnar(get_storage(), data_path, index, case_ids)
+            except IndexError as e:
+                raise ValueError(f"{case_ids=} contains invalid value") from e
+
         sys_data_str = get_storage().download_and_decompress(data_path)
         sys_data: list = json.loads(sys_data_str)
         if case_ids is not None:
@@ -313,12 +449,32 @@ class SystemModel(System):
                 raise ValueError(f"{case_ids=} contains invalid value") from e
         return sys_data
 
+    def iter_raw_analysis_cases(self, analysis_level: str) -> Iterator[dict]:
+        """Same as `get_raw_analysis_cases(analysis_level, case_ids=None)` but the
+        cases are decoded incrementally and yielded one at a time."""
+        data_path = self._get_analysis_cases_path(analysis_level)
+        if data_path.endswith(self._COLUMNAR_ANALYSIS_CASES_SUFFIX):
+            return self._iter_columnar(data_path)
+        return iter_json_array(get_storage().iter_decompressed(data_path))
+
+    @staticmethod
+    def _iter_columnar(blob_name: str) -> Iterator[dict]:
+        """Streams a columnar blob. The blob is closed once it is fully read."""
+        with get_storage().open(blob_name) as f:
+            yield from iter_columnar(f)
+
     def delete(self) -> None:
         """Deletes the system from the DB. Subsequent call of save_to_db()
         recreates the system again in the DB."""
         properties = self._get_private_properties()
-        blob_names_to_delete: list[str] = [properties["system_output"]]
+        # the system output is missing if the processing of the system failed
+        blob_names_to_delete: list[str] = (
+            [properties["system_output"]] if properties.get("system_output") else []
+        )
         blob_names_to_delete.extend(properties.get("analysis_cases", {}).values())
+        # left by scripts/migrate_system_outputs.py until it is safe to delete
+        if properties.get("legacy_system_output"):
+            blob_names_to_delete.append(properties["legacy_system_output"]["blob_name"])
 
         def db_operations(session: ClientSession):
             result = DBUtils.delete_one_by_id(
@@ -329,3 +485,4 @@ class SystemModel(System):
             get_storage().delete(blob_names_to_delete)
 
         DBUtils.execute_transaction(db_operations)
+        self._invalidate_private_properties()
@@ -0,0 +1,89 @@
+"""Background jobs that outlive the request that submitted them."""
+from __future__ import annotations
+
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from flask import current_app, g
+
+from explainaboard_web.impl.auth import get_user
+
+
+class JobQueue(ABC):
+    """Runs jobs outside of the request that submits them."""
+
+    @abstractmethod
+    def submit(self, job: Callable[[], None]) -> None:
+        """Schedules `job`. Exceptions raised by `job` are logged and dropped so a
+        job should record its own failures."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def join(self) -> None:
+        """Blocks until all the submitted jobs are done."""
+        raise NotImplementedError
+
+
+class InProcessJobQueue(JobQueue):
+    """Runs jobs with a pool of threads of the current process. Jobs are lost if the
+    process exits before they finish.
+
+    A job runs in a new app context. Only the logged in user of the request that
+    submitted it is copied to the globals (`g`) of that context: other request
+    globals are tied to the request, which ends before the job does. Systems whose
+    job is lost are marked as failed by `SystemDBUtils.fail_interrupted_systems`.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._futures: set[Future] = set()
+        self._lock = threading.Lock()
+
+    def submit(self, job: Callable[[], None]) -> None:
+        app = current_app._get_current_object()  # type: ignore
+        user = get_user()
+
+        def run() -> None:
+            with app.app_context():
+                if user is not None:
+                    g._user = user
+                try:
+                    job()
+                except Exception:
+                    logging.getLogger().exception("background job failed")
+
+        future = self._executor.submit(run)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future: Future) -> None:
+        with self._lock:
+            self._futures.discard(future)
+
+    def join(self) -> None:
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures)
+
+
+_job_queue: JobQueue | None = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue | None:
+    """Returns the job queue of this process or None if background jobs are
+    disabled (`SYSTEM_JOB_WORKERS` is 0)."""
+    global _job_queue
+    max_workers: int = current_app.config.get("SYSTEM_JOB_WORKERS", 0)
+    if max_workers <= 0:
+        return None
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = InProcessJobQueue(max_workers)
+        return _job_queue
@@ -1,64 +1,473 @@
-"""A client for Cloud Storage. Cloud Storage is an object storage
-and it's main use is to store system outputs.
+"""A client for the blob storage of the app, which is Cloud Storage by default.
+The main use of the storage is to store system outputs.
 """
 from __future__ import annotations
 
+import codecs
+import hashlib
 import json
-import zlib
-from collections.abc import Iterable
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import BinaryIO, TypeVar
 
-from flask import current_app, g
+import google.auth
+from explainaboard.utils.cache_api import get_cache_dir
+from flask import current_app
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage as cloud_storage
 from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
 
+from explainaboard_web.impl.blob_codecs import (
+    HEADER_SIZE,
+    Codec,
+    CodecDictionary,
+    ZlibCodec,
+    decode,
+    encode,
+    get_codec,
+    read_header,
+)
+from explainaboard_web.impl.storage_backends import (
+    FilesystemBackend,
+    GCSBackend,
+    MemoryBackend,
+    StorageBackend,
+)
 
-class Storage:
-    """A Google Cloud Storage client that makes it easy to store and download
-    objects from Cloud Storage. There's only one bucket used for each environment
-    so this class doesn't provide a way to choose from different buckets.
+ItemType = TypeVar("ItemType")
+ResultType = TypeVar("ResultType")
+
+
+class BlobCache:
+    """A size-bounded on-disk cache of downloaded blobs.
+
+    Each entry is a file named after the SHA-256 digest of the blob name and of the
+    version of its contents (see `StorageBackend.version`), so the cache can be
+    shared by all the worker processes on a host and an overwritten blob never
+    hits the entry of its old contents. Contents are written to a temporary file and
+    atomically renamed, which means readers never observe a partially written
+    entry. The modification time of an entry is bumped on every hit and the least
+    recently used entries are evicted once the cache grows beyond `max_bytes`.
+    Entries of deleted or overwritten blobs are never hit again and are evicted
+    like the others.
     """
 
-    def __init__(self) -> None:
-        # If the app is running in an ECS container, the GCP credentials are
-        # passed in as an environment variable and stored in config as a string.
-        if current_app.config.get("GCP_SERVICE_CREDENTIALS"):
-            credentials = service_account.Credentials.from_service_account_info(
-                json.loads(current_app.config["GCP_SERVICE_CREDENTIALS"])
+    _EVICTION_TARGET_RATIO = 0.8
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        # estimated total size of the cache. It is recomputed from the FS whenever
+        # eviction runs because other processes write to the same directory.
+        self._size_estimate: int | None = None
+        self._lock = threading.Lock()
+        # separate from `_lock` so lookups don't wait for an eviction
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, blob_name: str, version: str) -> str:
+        digest = hashlib.sha256(f"{blob_name}\n{version}".encode()).hexdigest()
+        return os.path.join(self._cache_dir, digest[:2], digest)
+
+    def _count(self, hit: bool) -> None:
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def open(self, blob_name: str, version: str) -> BinaryIO | None:
+        """Opens the cached contents for reading or returns None if they are not
+        cached."""
+        path = self._entry_path(blob_name, version)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+        with suppress(OSError):
+            os.utime(path)
+        self._count(hit=True)
+        return f
+
+    def get(self, blob_name: str, version: str) -> bytes | None:
+        """Returns the cached contents or None if they are not cached."""
+        f = self.open(blob_name, version)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def get_range(
+        self, blob_name: str, version: str, start: int, end: int
+    ) -> bytes | None:
+        """Returns bytes [start, end) of the cached contents or None if they are not
+        cached. Only the range is read from the disk."""
+        f = self.open(blob_name, version)
+        if f is None:
+            return None
+        with f:
+            f.seek(start)
+            return f.read(max(end - start, 0))
+
+    def put(self, blob_name: str, version: str, contents: bytes) -> None:
+        path = self._entry_path(blob_name, version)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(contents)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # the directory may have been removed by the eviction of another
+            # process. Caching is best-effort so the error is not propagated.
+            logging.getLogger().warning(f"failed to cache blob {blob_name}: {e}")
+            if tmp_path:
+                with suppress(OSError):
+                    os.remove(tmp_path)
+            return
+        self._add_size(len(contents))
+
+    def _list_entries(self) -> list[tuple[float, int, str]]:
+        """Returns (mtime, size, path) of all the cached files."""
+        entries = []
+        for dir_path, _, file_names in os.walk(self._cache_dir):
+            for file_name in file_names:
+                if file_name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                with suppress(OSError):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _add_size(self, size: int) -> None:
+        with self._lock:
+            if self._size_estimate is None:
+                self._size_estimate = sum(entry[1] for entry in self._list_entries())
+            else:
+                self._size_estimate += size
+            if self._size_estimate > self._max_bytes:
+                self._size_estimate = self._evict()
+
+    def _evict(self) -> int:
+        """Removes the least recently used files until the cache is smaller than
+        the eviction target. Returns the size of the cache after eviction."""
+        entries = sorted(self._list_entries())
+        total = sum(entry[1] for entry in entries)
+        target = int(self._max_bytes * self._EVICTION_TARGET_RATIO)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            with suppress(OSError):
+                os.remove(path)
+                total -= size
+                # removes the directory if it is empty
+                os.rmdir(os.path.dirname(path))
+        return total
+
+    def stats(self) -> dict[str, int]:
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_blob_cache: BlobCache | None = None
+_blob_cache_pid: int | None = None
+_blob_cache_lock = threading.Lock()
+
+
+def get_blob_cache() -> BlobCache | None:
+    """Returns the BlobCache of this process or None if the cache is disabled. Like
+    `get_storage`, each worker process creates its own after the fork. The files are
+    shared by all the processes."""
+    global _blob_cache, _blob_cache_pid
+    max_bytes = current_app.config.get("BLOB_CACHE_MAX_BYTES", 0)
+    if not max_bytes:
+        return None
+    with _blob_cache_lock:
+        if _blob_cache is None or _blob_cache_pid != os.getpid():
+            cache_dir = current_app.config.get("BLOB_CACHE_DIR") or os.path.join(
+                get_cache_dir(), "blobs"
             )
-            client = cloud_storage.Client(credentials=credentials)
-        # If the app is running locally, the developer should authenticate with
-        # a user account and the client reads the credentials from its default
-        # location on the FS.
-        else:
-            client = cloud_storage.Client()
+            _blob_cache = BlobCache(cache_dir, max_bytes)
+            _blob_cache_pid = os.getpid()
+        return _blob_cache
+
+
+class Storage:
+    """A client that makes it easy to store and download objects. The objects are
+    kept by a `StorageBackend` (a Cloud Storage bucket, a local directory, ...).
+    There's only one bucket used for each environment so this class doesn't provide
+    a way to choose from different buckets. Reading or deleting a missing blob
+    raises `BlobNotFound` whatever the backend.
+
+    Storage is thread-safe. The app uses one per process (see `get_storage`).
+
+    Args:
+        backend: stores the blobs
+        blob_cache: caches downloaded blobs. None disables caching.
+        transfer_workers: maximum number of blobs transferred concurrently by the
+            `*_many` methods of all the threads that share this Storage
+        codec: compresses the blobs written by `compress_and_upload`. Blobs are
+            decompressed with the codec recorded in their header.
+        dictionary_id: id of the dictionary (see `upload_dictionary`) used to
+            compress blobs. None compresses without a dictionary.
+    """
 
-        self._bucket_name = current_app.config["STORAGE_BUCKET_NAME"]
-        self._bucket = client.bucket(self._bucket_name)
+    _DICTIONARY_PREFIX = "__codec_dictionaries__/"
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        blob_cache: BlobCache | None = None,
+        transfer_workers: int = 8,
+        codec: Codec | None = None,
+        dictionary_id: int | None = None,
+    ) -> None:
+        self._backend = backend
+        self._blob_cache = blob_cache
+        self._transfer_workers = max(transfer_workers, 1)
+        # bounds the number of concurrent transfers. Created on first use.
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+        self._codec = codec or ZlibCodec()
+        self._dictionary_id = dictionary_id
+        self._dictionaries: dict[int, CodecDictionary] = {}
+        self._dictionaries_lock = threading.Lock()
+
+    def _map(
+        self, fn: Callable[[ItemType], ResultType], items: list[ItemType]
+    ) -> list[ResultType]:
+        """Applies `fn` to `items` concurrently and returns the results in order.
+        Exceptions raised by `fn` are re-raised."""
+        if len(items) <= 1 or self._transfer_workers == 1:
+            return [fn(item) for item in items]
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._transfer_workers, thread_name_prefix="storage"
+                )
+        return list(self._executor.map(fn, items))
 
     def upload(self, blob_name: str, contents: str | bytes) -> None:
-        blob = self._bucket.blob(blob_name)
-        blob.upload_from_string(contents)
+        if isinstance(contents, str):
+            contents = contents.encode()
+        version = self._backend.upload(blob_name, contents)
+        if self._blob_cache:
+            # the new contents are likely to be read soon
+            self._blob_cache.put(blob_name, version, contents)
+
+    def upload_many(self, blobs: Iterable[tuple[str, str | bytes]]) -> None:
+        """Uploads (blob_name, contents) pairs concurrently"""
+        self._map(lambda blob: self.upload(*blob), list(blobs))
+
+    def upload_dictionary(self, dictionary: CodecDictionary) -> None:
+        """Stores a compression dictionary so blobs compressed with it can be
+        decompressed by any process."""
+        self.upload(
+            f"{self._DICTIONARY_PREFIX}{dictionary.dictionary_id:08x}", dictionary.data
+        )
+        with self._dictionaries_lock:
+            self._dictionaries[dictionary.dictionary_id] = dictionary
+
+    def get_dictionary(self, dictionary_id: int) -> CodecDictionary:
+        """Returns a dictionary stored by `upload_dictionary`. Dictionaries are
+        immutable so they are kept in memory once downloaded."""
+        with self._dictionaries_lock:
+            dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            dictionary = CodecDictionary.from_bytes(
+                self.download(f"{self._DICTIONARY_PREFIX}{dictionary_id:08x}")
+            )
+            if dictionary.dictionary_id != dictionary_id:
+                raise ValueError(f"dictionary {dictionary_id:08x} is corrupted")
+            with self._dictionaries_lock:
+                self._dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def compress(self, contents: bytes) -> bytes:
+        """Compresses `contents` with the codec of this Storage and prepends the
+        codec header"""
+        dictionary = None
+        if self._dictionary_id is not None:
+            dictionary = self.get_dictionary(self._dictionary_id)
+        return encode(contents, self._codec, dictionary)
+
+    def decompress(self, data: bytes) -> bytes:
+        """Decompresses data returned by `compress` or compressed with zlib without
+        a header (legacy blobs)"""
+        return decode(data, self.get_dictionary)
 
     def compress_and_upload(self, blob_name: str, contents: str) -> None:
-        compressed_contents = zlib.compress(contents.encode())
-        self.upload(blob_name, compressed_contents)
+        self.upload(blob_name, self.compress(contents.encode()))
+
+    def compress_and_upload_many(self, blobs: Iterable[tuple[str, str]]) -> None:
+        """Same as `compress_and_upload` for multiple (blob_name, contents) pairs,
+        which are compressed and uploaded concurrently"""
+        self._map(lambda blob: self.compress_and_upload(*blob), list(blobs))
+
+    def _download_and_cache(self, blob_name: str) -> bytes:
+        assert self._blob_cache
+        contents, version = self._backend.download_versioned(blob_name)
+        self._blob_cache.put(blob_name, version, contents)
+        return contents
 
     def download(self, blob_name: str) -> bytes:
-        blob = self._bucket.blob(blob_name)
-        return blob.download_as_bytes()
+        """Downloads a blob. If the blob is cached, only its version is requested
+        from the backend."""
+        if not self._blob_cache:
+            return self._backend.download(blob_name)
+        version = self._backend.version(blob_name)
+        cached_contents = self._blob_cache.get(blob_name, version)
+        if cached_contents is not None:
+            return cached_contents
+        return self._download_and_cache(blob_name)
+
+    def download_many(self, blob_names: Iterable[str]) -> list[bytes]:
+        """Downloads blobs concurrently and returns their contents in order"""
+        return self._map(self.download, list(blob_names))
+
+    def download_range(self, blob_name: str, start: int, end: int) -> bytes:
+        """Downloads bytes [start, end) of a blob.
+
+        If the blob cache is enabled, the whole blob is downloaded and cached on a
+        miss so the following reads of the blob (e.g. the next pages of its items)
+        are served from the local disk.
+        """
+        if not self._blob_cache:
+            return self._backend.download_range(blob_name, start, end)
+        version = self._backend.version(blob_name)
+        cached_contents = self._blob_cache.get_range(blob_name, version, start, end)
+        if cached_contents is not None:
+            return cached_contents
+        return self._download_and_cache(blob_name)[start:end]
 
     def download_and_decompress(self, blob_name: str) -> str:
-        return zlib.decompress(self.download(blob_name)).decode()
+        return self.decompress(self.download(blob_name)).decode()
+
+    def open(self, blob_name: str) -> BinaryIO:
+        """Opens a blob for streaming reads. Cached blobs are read from the local
+        disk. The file returned by a `FilesystemBackend` is a regular file."""
+        if self._blob_cache:
+            f = self._blob_cache.open(blob_name, self._backend.version(blob_name))
+            if f is not None:
+                return f
+        return self._backend.open(blob_name)
+
+    def iter_decompressed(
+        self, blob_name: str, read_size: int = 1 << 16
+    ) -> Iterator[str]:
+        """Streams a blob uploaded with `compress_and_upload` and yields the
+        decompressed contents piece by piece, each at most `read_size` characters
+        long, so the whole blob is never held in memory (except for codecs that
+        don't support streaming, such as lz4)."""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+
+        def decode_pieces(decompressed: bytes) -> Iterator[str]:
+            for i in range(0, len(decompressed), read_size):
+                yield decoder.decode(decompressed[i : i + read_size])
+
+        with self.open(blob_name) as f:
+            data = f.read(HEADER_SIZE)
+            header = read_header(data)
+            dictionary = None
+            if header.dictionary_id is not None:
+                dictionary = self.get_dictionary(header.dictionary_id).data
+            decompressor = header.codec.decompressobj(dictionary)
+            data = data[header.size :] or f.read(read_size)
+            while data:
+                # the output is bounded so a highly compressed piece of input
+                # doesn't expand into a large buffer
+                while data:
+                    yield decoder.decode(decompressor.decompress(data, read_size))
+                    data = decompressor.unconsumed_tail
+                data = f.read(read_size)
+        yield from decode_pieces(decompressor.flush())
+        yield decoder.decode(b"", final=True)
 
     def delete(self, blob_names: Iterable[str]) -> None:
-        self._bucket.delete_blobs([self._bucket.blob(name) for name in blob_names])
+        """Deletes blobs, in batches if the backend supports them"""
+        # the cached contents of the blobs are never hit again and are evicted
+        self._backend.delete_many(list(blob_names))
+
+
+def _create_bucket() -> cloud_storage.Bucket:
+    """Creates a client with a connection pool of `STORAGE_HTTP_POOL_SIZE`
+    connections and returns the bucket of the app."""
+    # If the app is running in an ECS container, the GCP credentials are
+    # passed in as an environment variable and stored in config as a string.
+    if current_app.config.get("GCP_SERVICE_CREDENTIALS"):
+        credentials = service_account.Credentials.from_service_account_info(
+            json.loads(current_app.config["GCP_SERVICE_CREDENTIALS"]),
+            scopes=cloud_storage.Client.SCOPE,
+        )
+        project = credentials.project_id
+    # If the app is running locally, the developer should authenticate with
+    # a user account and the client reads the credentials from its default
+    # location on the FS.
+    else:
+        credentials, project = google.auth.default(scopes=cloud_storage.Client.SCOPE)
+
+    pool_size = current_app.config.get("STORAGE_HTTP_POOL_SIZE", 32)
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    client = cloud_storage.Client(
+        project=project, credentials=credentials, _http=session
+    )
+    return client.bucket(current_app.config["STORAGE_BUCKET_NAME"])
+
+
+def _create_backend() -> StorageBackend:
+    """Creates the backend selected by `STORAGE_BACKEND`"""
+    backend = current_app.config.get("STORAGE_BACKEND") or "gcs"
+    if backend == "gcs":
+        if not current_app.config.get("STORAGE_BUCKET_NAME"):
+            raise ValueError("STORAGE_BUCKET_NAME is required by the gcs backend")
+        return GCSBackend(_create_bucket())
+    elif backend == "filesystem":
+        if not current_app.config.get("STORAGE_DIR"):
+            raise ValueError("STORAGE_DIR is required by the filesystem backend")
+        return FilesystemBackend(current_app.config["STORAGE_DIR"])
+    elif backend == "memory":
+        return MemoryBackend()
+    raise ValueError(f"unknown storage backend: {backend}")
+
+
+_storage: Storage | None = None
+_storage_pid: int | None = None
+_storage_lock = threading.Lock()
 
 
 def get_storage() -> Storage:
     """
-    Returns the global Storage instance. A Storage object is created if not present
-    in g.
+    Returns the Storage instance of the current process. It is created on first
+    use so each gunicorn worker creates its own client (and connection pool) after
+    the fork.
     """
-    if "_storage" not in g:
-        g._storage = Storage()
-    return g._storage
+    global _storage, _storage_pid
+    with _storage_lock:
+        if _storage is None or _storage_pid != os.getpid():
+            backend = _create_backend()
+            _storage = Storage(
+                backend,
+                # local blobs are read as fast as cached ones
+                blob_cache=None if backend.local else get_blob_cache(),
+                transfer_workers=current_app.config.get("STORAGE_TRANSFER_WORKERS", 8),
+                codec=get_codec(
+                    current_app.config.get("BLOB_CODEC") or "zlib",
+                    current_app.config.get("BLOB_CODEC_LEVEL"),
+                ),
+                dictionary_id=current_app.config.get("BLOB_CODEC_DICTIONARY"),
+            )
+            _storage_pid = os.getpid()
+        return _storage
@@ -0,0 +1,296 @@
+"""Backends that store the bytes of the blobs managed by `Storage`.
+
+`Storage` implements caching, compression and concurrent transfers on top of a
+backend, which only has to read and write whole blobs and byte ranges. The backend
+of the app is selected by `STORAGE_BACKEND` (see `storage.get_storage`).
+"""
+from __future__ import annotations
+
+import io
+import itertools
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from typing import BinaryIO
+
+from google.api_core.exceptions import NotFound
+from google.cloud import storage as cloud_storage
+
+
+class BlobNotFound(Exception):
+    """Raised by all the backends when a blob doesn't exist"""
+
+    def __init__(self, blob_name: str) -> None:
+        super().__init__(f"blob not found: {blob_name}")
+        self.blob_name = blob_name
+
+
+@contextmanager
+def _not_found_as(blob_name: str, *errors: type[Exception]) -> Iterator[None]:
+    """Raises BlobNotFound instead of the backend specific `errors`"""
+    try:
+        yield
+    except errors as e:
+        raise BlobNotFound(blob_name) from e
+
+
+class StorageBackend(ABC):
+    """Stores blobs by name. Implementations must be thread-safe.
+
+    Blob names are `/` separated paths such as `<system_id>/__SYSOUT__`. Reading or
+    deleting a blob that doesn't exist raises `BlobNotFound`.
+    """
+
+    # True if reads are served from the local host, in which case caching the
+    # blobs on the local disk doesn't save anything
+    local: bool = False
+
+    @abstractmethod
+    def upload(self, blob_name: str, contents: bytes) -> str:
+        """Creates or overwrites a blob and returns its new version"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def version(self, blob_name: str) -> str:
+        """Returns a token that identifies the current contents of a blob (e.g. the
+        generation of a Cloud Storage object). It changes whenever the blob is
+        overwritten, so it is used to key the cached contents of the blob."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def download(self, blob_name: str) -> bytes:
+        raise NotImplementedError
+
+    @abstractmethod
+    def download_versioned(self, blob_name: str) -> tuple[bytes, str]:
+        """Returns the contents of a blob and the version of these contents"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def download_range(self, blob_name: str, start: int, end: int) -> bytes:
+        """Returns bytes [start, end) of a blob. The range is truncated at the end of
+        the blob."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, blob_name: str) -> BinaryIO:
+        """Opens a blob for streaming reads"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, blob_name: str) -> None:
+        raise NotImplementedError
+
+    def delete_many(self, blob_names: list[str]) -> None:
+        """Deletes blobs. Backends that support batched requests override it."""
+        for blob_name in blob_names:
+            self.delete(blob_name)
+
+
+class GCSBackend(StorageBackend):
+    """Stores blobs in a Cloud Storage bucket.
+
+    Args:
+        bucket: a `google.cloud.storage.Bucket` or a stand-in with the same API
+    """
+
+    # maximum number of requests in a batch recommended by Cloud Storage
+    _BATCH_SIZE = 100
+
+    def __init__(self, bucket: cloud_storage.Bucket) -> None:
+        self._bucket = bucket
+
+    def upload(self, blob_name: str, contents: bytes) -> str:
+        blob = self._bucket.blob(blob_name)
+        blob.upload_from_string(contents)
+        return str(blob.generation)
+
+    def version(self, blob_name: str) -> str:
+        # only fetches the metadata
+        blob = self._bucket.blob(blob_name)
+        with _not_found_as(blob_name, NotFound):
+            blob.reload()
+        return str(blob.generation)
+
+    def download(self, blob_name: str) -> bytes:
+        with _not_found_as(blob_name, NotFound):
+            return self._bucket.blob(blob_name).download_as_bytes()
+
+    def download_versioned(self, blob_name: str) -> tuple[bytes, str]:
+        blob = self._bucket.blob(blob_name)
+        # the generation is read from the headers of the download response
+        with _not_found_as(blob_name, NotFound):
+            contents = blob.download_as_bytes()
+        return contents, str(blob.generation)
+
+    def download_range(self, blob_name: str, start: int, end: int) -> bytes:
+        if end <= start:
+            return b""
+        blob = self._bucket.blob(blob_name)
+        # the end of the range is inclusive for Cloud Storage
+        with _not_found_as(blob_name, NotFound):
+            return blob.download_as_bytes(start=start, end=end - 1)
+
+    def open(self, blob_name: str) -> BinaryIO:
+        blob = self._bucket.blob(blob_name)
+        # the reader only fetches the blob on the first read. Loading the metadata
+        # first raises BlobNotFound here and pins the generation that is read.
+        with _not_found_as(blob_name, NotFound):
+            blob.reload()
+        return blob.open("rb")
+
+    def delete(self, blob_name: str) -> None:
+        with _not_found_as(blob_name, NotFound):
+            self._bucket.blob(blob_name).delete()
+
+    def delete_many(self, blob_names: list[str]) -> None:
+        # each batch is sent as a single HTTP request. The error of a failed
+        # request is raised when the batch is sent, without the name of its blob.
+        for i in range(0, len(blob_names), self._BATCH_SIZE):
+            batch_names = blob_names[i : i + self._BATCH_SIZE]
+            with _not_found_as(", ".join(batch_names), NotFound):
+                with self._bucket.client.batch():
+                    for blob_name in batch_names:
+                        self._bucket.blob(blob_name).delete()
+
+
+class FilesystemBackend(StorageBackend):
+    """Stores each blob as a file under `root_dir`, e.g. on a local NVMe drive of a
+    single node deployment.
+
+    Writes go to a temporary file that is atomically renamed, so readers never see
+    a partially written blob and a blob that is overwritten while it is being read
+    stays intact for the reader. `open` returns a regular file, which can be
+    memory-mapped or served with `os.sendfile` (e.g. through `flask.send_file`),
+    and ranged reads are a single `pread`.
+    """
+
+    local = True
+    # raised for a missing file or a name under a blob, e.g. "a/b" if "a" exists
+    _NOT_FOUND_ERRORS = (FileNotFoundError, NotADirectoryError)
+
+    def __init__(self, root_dir: str) -> None:
+        self._root_dir = os.path.realpath(root_dir)
+        os.makedirs(self._root_dir, exist_ok=True)
+
+    def path(self, blob_name: str) -> str:
+        """Returns the path of the file of a blob. Raises ValueError if the name
+        points outside of the root directory."""
+        path = os.path.normpath(os.path.join(self._root_dir, blob_name))
+        if os.path.commonpath([self._root_dir, path]) != self._root_dir or (
+            path == self._root_dir
+        ):
+            raise ValueError(f"invalid blob name: {blob_name}")
+        return path
+
+    @staticmethod
+    def _file_version(stat: os.stat_result) -> str:
+        # blobs are replaced by renaming a new file so the inode changes as well
+        return f"{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}"
+
+    def upload(self, blob_name: str, contents: bytes) -> str:
+        path = self.path(blob_name)
+        dir_path = os.path.dirname(path)
+        os.makedirs(dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(contents)
+                f.flush()
+                version = self._file_version(os.fstat(f.fileno()))
+            os.replace(tmp_path, path)
+        except BaseException:
+            with suppress(OSError):
+                os.remove(tmp_path)
+            raise
+        return version
+
+    def open(self, blob_name: str) -> BinaryIO:
+        with _not_found_as(blob_name, *self._NOT_FOUND_ERRORS):
+            return open(self.path(blob_name), "rb")
+
+    def version(self, blob_name: str) -> str:
+        with _not_found_as(blob_name, *self._NOT_FOUND_ERRORS):
+            return self._file_version(os.stat(self.path(blob_name)))
+
+    def download(self, blob_name: str) -> bytes:
+        with self.open(blob_name) as f:
+            return f.read()
+
+    def download_versioned(self, blob_name: str) -> tuple[bytes, str]:
+        with self.open(blob_name) as f:
+            return f.read(), self._file_version(os.fstat(f.fileno()))
+
+    def download_range(self, blob_name: str, start: int, end: int) -> bytes:
+        if end <= start:
+            return b""
+        with _not_found_as(blob_name, *self._NOT_FOUND_ERRORS):
+            fd = os.open(self.path(blob_name), os.O_RDONLY)
+        try:
+            # pread doesn't move the file offset so no locking is needed
+            chunks = []
+            while start < end:
+                chunk = os.pread(fd, end - start, start)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                start += len(chunk)
+            return b"".join(chunks)
+        finally:
+            os.close(fd)
+
+    def delete(self, blob_name: str) -> None:
+        path = self.path(blob_name)
+        with _not_found_as(blob_name, *self._NOT_FOUND_ERRORS):
+            os.remove(path)
+        # removes the directories that became empty
+        dir_path = os.path.dirname(path)
+        with suppress(OSError):
+            while dir_path != self._root_dir:
+                os.rmdir(dir_path)
+                dir_path = os.path.dirname(dir_path)
+
+
+class MemoryBackend(StorageBackend):
+    """Keeps blobs in a dict. Intended for tests and benchmarks."""
+
+    local = True
+
+    def __init__(self) -> None:
+        self.blobs: dict[str, bytes] = {}
+        self._versions: dict[str, str] = {}
+        self._version_counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def upload(self, blob_name: str, contents: bytes) -> str:
+        with self._lock:
+            self.blobs[blob_name] = bytes(contents)
+            self._versions[blob_name] = str(next(self._version_counter))
+            return self._versions[blob_name]
+
+    def version(self, blob_name: str) -> str:
+        with self._lock, _not_found_as(blob_name, KeyError):
+            return self._versions[blob_name]
+
+    def download(self, blob_name: str) -> bytes:
+        with self._lock, _not_found_as(blob_name, KeyError):
+            return self.blobs[blob_name]
+
+    def download_versioned(self, blob_name: str) -> tuple[bytes, str]:
+        with self._lock, _not_found_as(blob_name, KeyError):
+            return self.blobs[blob_name], self._versions[blob_name]
+
+    def download_range(self, blob_name: str, start: int, end: int) -> bytes:
+        with self._lock, _not_found_as(blob_name, KeyError):
+            return self.blobs[blob_name][start:end]
+
+    def open(self, blob_name: str) -> BinaryIO:
+        return io.BytesIO(self.download(blob_name))
+
+    def delete(self, blob_name: str) -> None:
+        with self._lock, _not_found_as(blob_name, KeyError):
+            del self.blobs[blob_name]
+            del self._versions[blob_name]
@@ -1,10 +1,14 @@
 import base64
+import json
 import os
 import pickle
+import struct
 import zlib
+from collections.abc import Iterable, Iterator
 from functools import lru_cache
 from typing import Any
 
+import numpy as np
 from bson.binary import Binary
 from flask import abort, jsonify
 
@@ -45,12 +49,163 @@ def decode_base64(encoded: str) -> str:
     return base64.b64decode(encoded).decode("utf-8")
 
 
+# Typed encoding of numeric arrays. Layout (little-endian):
+#   magic (4 bytes) | version (u8) | codec (u8) | dtype length (u8) | ndim (u8) |
+#   dtype string | shape (ndim * u64) | raw buffer (compressed if codec != 0)
+_NDARRAY_MAGIC = b"EBND"
+_NDARRAY_VERSION = 1
+_NDARRAY_HEADER = struct.Struct("<4sBBBB")
+_NDARRAY_CODEC_NONE = 0
+_NDARRAY_CODEC_ZLIB = 1
+# bytes are grouped by their position within each element before compression
+# (e.g. all the exponent bytes of float64 values are stored together), which
+# makes metric stats much more compressible.
+_NDARRAY_CODEC_SHUFFLE_ZLIB = 2
+
+
+def _encode_ndarray(array: np.ndarray, compress: bool) -> bytes:
+    # unlike np.ascontiguousarray, keeps the shape of 0-d arrays
+    array = np.require(array, dtype=array.dtype.newbyteorder("<"), requirements="C")
+    dtype = array.dtype.str.encode()
+    if compress:
+        codec = _NDARRAY_CODEC_SHUFFLE_ZLIB
+        shuffled = array.reshape(-1).view(np.uint8).reshape(-1, array.itemsize).T
+        # level 1 is several times faster than the default level and compresses
+        # shuffled buffers almost as well
+        buffer = zlib.compress(shuffled.tobytes(), 1)
+    else:
+        codec = _NDARRAY_CODEC_NONE
+        buffer = array.tobytes()
+    return b"".join(
+        [
+            _NDARRAY_HEADER.pack(
+                _NDARRAY_MAGIC, _NDARRAY_VERSION, codec, len(dtype), array.ndim
+            ),
+            dtype,
+            struct.pack(f"<{array.ndim}Q", *array.shape),
+            buffer,
+        ]
+    )
+
+
+def _decode_ndarray(data: bytes) -> np.ndarray:
+    _, version, codec, dtype_len, ndim = _NDARRAY_HEADER.unpack_from(data)
+    if version != _NDARRAY_VERSION:
+        raise ValueError(f"unsupported ndarray encoding version {version}")
+    offset = _NDARRAY_HEADER.size
+    dtype = np.dtype(data[offset : offset + dtype_len].decode())
+    offset += dtype_len
+    shape = struct.unpack_from(f"<{ndim}Q", data, offset)
+    offset += 8 * ndim
+    buffer = memoryview(data)[offset:]
+    if codec == _NDARRAY_CODEC_NONE:
+        array = np.frombuffer(buffer, dtype=dtype)
+    else:
+        decompressed = np.frombuffer(zlib.decompress(buffer), dtype=np.uint8)
+        if codec == _NDARRAY_CODEC_SHUFFLE_ZLIB:
+            decompressed = np.ascontiguousarray(
+                decompressed.reshape(dtype.itemsize, -1).T
+            ).reshape(-1)
+        elif codec != _NDARRAY_CODEC_ZLIB:
+            raise ValueError(f"unsupported ndarray codec {codec}")
+        array = decompressed.view(dtype)
+    # arrays backed by the (immutable) input or decompressed bytes are copied so
+    # that all the decoded arrays are writable, like unpickled ones
+    return np.require(array.reshape(shape), requirements="W")
+
+
 # TODO(chihhao) consider moving to SDK?
-def binarize_bson(data: Any) -> Binary:
-    """convert and compress data to BSON binary data"""
+def binarize_bson(data: Any, compress: bool = True) -> Binary:
+    """convert and compress data to BSON binary data
+
+    Numeric numpy arrays are stored in a typed binary format (dtype, shape and the
+    raw little-endian buffer) that can be decoded without unpickling. Other objects
+    are pickled.
+    """
+    if isinstance(data, np.ndarray) and data.dtype.kind in "biuf":
+        return Binary(_encode_ndarray(data, compress))
     return Binary(zlib.compress(pickle.dumps(data, protocol=2)))
 
 
 def unbinarize_bson(data: Binary) -> Any:
-    """decompress and convert BSON binary data to Python objects"""
+    """decompress and convert BSON binary data to Python objects. Supports both the
+    typed array format and the legacy pickle format."""
+    if data[: len(_NDARRAY_MAGIC)] == _NDARRAY_MAGIC:
+        return _decode_ndarray(data)
     return pickle.loads(zlib.decompress(data))
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """Incrementally parses a JSON array that arrives in pieces and yields its
+    elements one at a time, so memory usage is bounded by the size of the largest
+    element rather than the size of the array.
+
+    Parsed elements are skipped by moving an offset and the consumed input is only
+    dropped when new chunks are read. An element that spans several chunks is parsed
+    again only once the unparsed input has doubled, so the work is linear in the
+    size of the input.
+
+    Raises:
+        ValueError: the input is not a valid JSON array.
+    """
+    decoder = json.JSONDecoder()
+    chunk_iter = iter(chunks)
+    buffer = ""
+    pos = 0
+    # the next element is parsed once buffer[pos:] is at least this long
+    min_parse_length = 0
+    exhausted = False
+    # what the parser expects next: "[" -> "element_or_end" -> "separator" ->
+    # "element" -> "separator" -> ... until "]"
+    expecting = "["
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\n\r":
+            pos += 1
+        if pos < len(buffer):
+            char = buffer[pos]
+            if expecting == "[":
+                if char != "[":
+                    raise ValueError("expected a JSON array")
+                pos += 1
+                expecting = "element_or_end"
+                continue
+            if expecting == "separator":
+                if char == "]":
+                    return
+                if char != ",":
+                    raise ValueError(f"expected ',' or ']' at {char!r}")
+                pos += 1
+                expecting = "element"
+                continue
+            if expecting == "element_or_end" and char == "]":
+                return
+            if exhausted or len(buffer) - pos >= min_parse_length:
+                try:
+                    element, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if exhausted:
+                        raise
+                else:
+                    # an element is complete only if it is followed by a delimiter,
+                    # otherwise a number might have been truncated (e.g. "4." + "5")
+                    if exhausted or (end < len(buffer) and buffer[end] in ",] \t\n\r"):
+                        yield element
+                        pos = end
+                        min_parse_length = 0
+                        expecting = "separator"
+                        continue
+                min_parse_length = 2 * (len(buffer) - pos)
+        if exhausted:
+            raise ValueError("unexpected end of JSON array")
+        # reads chunks until the element may be complete and joins them once
+        pieces = [buffer[pos:]]
+        length = len(pieces[0])
+        while not exhausted and (length == len(pieces[0]) or length < min_parse_length):
+            try:
+                pieces.append(next(chunk_iter))
+                length += len(pieces[-1])
+            except StopIteration:
+                exhausted = True
+        buffer = "".join(pieces)
+        pos = 0
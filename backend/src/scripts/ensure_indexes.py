@@ -0,0 +1,39 @@
+import argparse
+
+from flask import Flask
+
+from explainaboard_web.impl.db_utils.indexes import ensure_indexes
+
+"""
+This is a utility script that creates the indexes declared in
+`impl/db_utils/indexes.py` that don't exist in the database yet. It is safe to run
+it multiple times. Indexes that are not declared are left untouched.
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser("Create the indexes of the metadata collections")
+    parser.add_argument("--uri", help="URI of the database")
+    parser.add_argument("--username", required=True, type=str, help="DB username")
+    parser.add_argument("--password", required=True, type=str, help="DB password")
+    parser.add_argument(
+        "--actually_update",
+        action="store_true",
+        help="Whether to actually create the indexes or only list the missing ones",
+    )
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    with app.app_context():
+        app.config["DATABASE_URI"] = args.uri
+        app.config["DB_USERNAME"] = args.username
+        app.config["DB_PASSWORD"] = args.password
+        missing = ensure_indexes(dry_run=not args.actually_update)
+        for name in missing:
+            print(f"created {name}" if args.actually_update else f"missing {name}")
+        if not missing:
+            print("all indexes exist")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from explainaboard_web.impl.chunked_blob import DEFAULT_CHUNK_SIZE, convert_legacy_blob
+from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.internal_models.system_model import SystemModel
+from explainaboard_web.impl.storage import get_storage
+
+"""
+This is a utility script that converts system outputs stored in the legacy format
+(all outputs in one compressed JSON list) to the chunked format (see
+`impl/chunked_blob.py`). Systems that haven't been migrated keep working because
+`SystemModel` falls back to the legacy reader, so the migration can run in the
+background and be interrupted at any time.
+
+Legacy blobs are not deleted by the migration: workers may still hold the old
+document in `SystemModel._properties_cache` or be in the middle of a request that
+reads the legacy blob. The migration records the legacy blob in
+`legacy_system_output` and a later run with `--delete_legacy` deletes the legacy
+blobs of the systems migrated more than `--min_age_minutes` ago.
+"""
+
+
+def migrate_system(entry: dict, chunk_size: int) -> bool:
+    """Converts the system output of a system. Returns False if the system was
+    modified (e.g. its outputs were replaced or it was deleted) while its blob was
+    being converted, in which case the system is left untouched."""
+    system_id = str(entry["_id"])
+    legacy_blob_name = entry["system_output"]
+    blob_name = SystemModel._new_blob_name(
+        system_id, SystemModel._CHUNKED_SYSTEM_OUTPUT_CONST
+    )
+    storage = get_storage()
+    chunk_index = convert_legacy_blob(storage, legacy_blob_name, blob_name, chunk_size)
+    # compare-and-set: the system is only updated if it still points to the blob
+    # that was converted
+    updated = DBUtils.update_many(
+        DBUtils.DEV_SYSTEM_METADATA,
+        {
+            "_id": entry["_id"],
+            "system_output": legacy_blob_name,
+            "system_output_index": {"$exists": False},
+        },
+        {
+            "system_output": blob_name,
+            "system_output_index": chunk_index.to_dict(),
+            "legacy_system_output": {
+                "blob_name": legacy_blob_name,
+                "migrated_at": datetime.utcnow(),
+            },
+            # the cached properties of the system are keyed on this field
+            "properties_version": SystemModel._new_properties_version(),
+        },
+    )
+    if not updated:
+        storage.delete([blob_name])
+    return bool(updated)
+
+
+def delete_legacy_blob(entry: dict) -> None:
+    get_storage().delete([entry["legacy_system_output"]["blob_name"]])
+    DBUtils.get_collection(DBUtils.DEV_SYSTEM_METADATA).update_one(
+        {"_id": entry["_id"]}, {"$unset": {"legacy_system_output": ""}}
+    )
+
+
+def delete_legacy_blobs(min_age_minutes: int, actually_update: bool) -> None:
+    migrated_before = datetime.utcnow() - timedelta(minutes=min_age_minutes)
+    entries, total = DBUtils.find(
+        DBUtils.DEV_SYSTEM_METADATA,
+        filt={"legacy_system_output.migrated_at": {"$lt": migrated_before}},
+        limit=0,
+        projection={"legacy_system_output": True},
+    )
+    print(f"{total} legacy blobs to delete")
+    for entry in entries:
+        blob_name = entry["legacy_system_output"]["blob_name"]
+        if actually_update:
+            delete_legacy_blob(entry)
+            print(f"deleted {blob_name} of {entry['_id']}")
+        else:
+            print(f"would delete {blob_name} of {entry['_id']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Convert system outputs to the chunked storage format"
+    )
+    parser.add_argument("--uri", help="URI of the database")
+    parser.add_argument("--username", required=True, type=str, help="DB username")
+    parser.add_argument("--password", required=True, type=str, help="DB password")
+    parser.add_argument(
+        "--bucket", required=True, type=str, help="name of the storage bucket"
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="number of system outputs in each chunk",
+    )
+    parser.add_argument(
+        "--delete_legacy",
+        action="store_true",
+        help="delete the legacy blobs of migrated systems instead of migrating",
+    )
+    parser.add_argument(
+        "--min_age_minutes",
+        type=int,
+        default=10,
+        help="only delete the legacy blobs of systems migrated at least this long "
+        "ago. Must be longer than the TTL of the properties cache (1 minute) and "
+        "than the longest request.",
+    )
+    parser.add_argument(
+        "--actually_update",
+        action="store_true",
+        help="Whether to actually update or not",
+    )
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    with app.app_context():
+        app.config["DATABASE_URI"] = args.uri
+        app.config["DB_USERNAME"] = args.username
+        app.config["DB_PASSWORD"] = args.password
+        app.config["STORAGE_BUCKET_NAME"] = args.bucket
+        if args.delete_legacy:
+            delete_legacy_blobs(args.min_age_minutes, args.actually_update)
+            return
+        entries, total = DBUtils.find(
+            DBUtils.DEV_SYSTEM_METADATA,
+            filt={
+                "system_output": {"$exists": True},
+                "system_output_index": {"$exists": False},
+            },
+            limit=0,
+            projection={"system_output": True},
+        )
+        print(f"{total} systems to migrate")
+        skipped = []
+        for entry in entries:
+            if not args.actually_update:
+                print(f"would migrate {entry['_id']} ({entry['system_output']})")
+            elif migrate_system(entry, args.chunk_size):
+                print(f"migrated {entry['_id']}")
+            else:
+                print(f"skipped {entry['_id']}: modified during the migration")
+                skipped.append(entry["_id"])
+        if skipped:
+            print(
+                f"{len(skipped)} systems were skipped, run the script again to "
+                f"migrate them: {skipped}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import json
+import time
+
+from flask import Flask
+
+from explainaboard_web.impl.blob_codecs import (
+    Codec,
+    CodecDictionary,
+    decode,
+    encode,
+    get_codec,
+    train_dictionary,
+)
+from explainaboard_web.impl.chunked_blob import ChunkIndex, download_chunked
+from explainaboard_web.impl.columnar_blob import decode_columnar
+from explainaboard_web.impl.db_utils.db_utils import CountMode, DBUtils
+from explainaboard_web.impl.internal_models.system_model import SystemModel
+from explainaboard_web.impl.storage import get_storage
+
+"""
+Compares the compression ratio and the encode/decode throughput of the blob codecs
+(see `impl/blob_codecs.py`) on the system outputs and analysis cases of the most
+recent systems. The dictionary is trained on the blobs of half of the systems and
+evaluated on the other half. With `--upload_dictionary`, the dictionary is stored
+so it can be selected with the BLOB_CODEC_DICTIONARY setting.
+"""
+
+_CODECS = [
+    ("zlib", 1),
+    ("zlib", 6),
+    ("zstd", 1),
+    ("zstd", 3),
+    ("zstd", 9),
+    ("lz4", 0),
+    ("lz4", 9),
+]
+
+
+def load_blobs(num_systems: int, items_per_blob: int) -> list[list[bytes]]:
+    """Returns the blobs of each system. Each list of items (system outputs or
+    analysis cases of a level) is split in blobs of `items_per_blob` items, which is
+    how the chunked format stores them."""
+    storage = get_storage()
+    entries, _ = DBUtils.find(
+        DBUtils.DEV_SYSTEM_METADATA,
+        filt={"system_output": {"$exists": True}},
+        sort=[("created_at", -1)],
+        limit=num_systems,
+        projection={
+            "system_output": True,
+            "system_output_index": True,
+            "analysis_cases": True,
+        },
+        count=CountMode.NONE,
+    )
+    systems = []
+    for entry in entries:
+        if entry.get("system_output_index"):
+            index = ChunkIndex.from_dict(entry["system_output_index"])
+            item_lists = [
+                download_chunked(storage, entry["system_output"], index, None)
+            ]
+        else:
+            item_lists = [
+                json.loads(storage.download_and_decompress(entry["system_output"]))
+            ]
+        for blob_name in (entry.get("analysis_cases") or {}).values():
+            if blob_name.endswith(SystemModel._COLUMNAR_ANALYSIS_CASES_SUFFIX):
+                cases = decode_columnar(storage.download(blob_name), None)
+            else:
+                cases = json.loads(storage.download_and_decompress(blob_name))
+            item_lists.append(cases)
+        systems.append(
+            [
+                json.dumps(items[i : i + items_per_blob]).encode()
+                for items in item_lists
+                for i in range(0, len(items), items_per_blob)
+            ]
+        )
+    return systems
+
+
+def benchmark(
+    codec: Codec, dictionary: CodecDictionary | None, blobs: list[bytes], repeat: int
+) -> tuple[float, float, float]:
+    """Returns the compression ratio and the encode and decode throughputs (MB/s
+    of uncompressed data)"""
+    encoded = [encode(blob, codec, dictionary) for blob in blobs]
+    raw_size = sum(len(blob) for blob in blobs)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for blob in blobs:
+            encode(blob, codec, dictionary)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for blob in encoded:
+            decode(blob, lambda _: dictionary)
+    decode_time = time.perf_counter() - start
+
+    mb = raw_size * repeat / 1e6
+    return (
+        raw_size / sum(len(blob) for blob in encoded),
+        mb / encode_time,
+        mb / decode_time,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark the blob codecs")
+    parser.add_argument("--uri", help="URI of the database")
+    parser.add_argument("--username", required=True, type=str, help="DB username")
+    parser.add_argument("--password", required=True, type=str, help="DB password")
+    parser.add_argument(
+        "--bucket", required=True, type=str, help="name of the storage bucket"
+    )
+    parser.add_argument("--num_systems", type=int, default=20)
+    parser.add_argument(
+        "--items_per_blob",
+        type=int,
+        default=1000,
+        help="number of system outputs or analysis cases compressed together",
+    )
+    parser.add_argument("--dictionary_size", type=int, default=1 << 16)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--upload_dictionary",
+        action="store_true",
+        help="store the trained dictionary and print its id",
+    )
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    with app.app_context():
+        app.config["DATABASE_URI"] = args.uri
+        app.config["DB_USERNAME"] = args.username
+        app.config["DB_PASSWORD"] = args.password
+        app.config["STORAGE_BUCKET_NAME"] = args.bucket
+        systems = load_blobs(args.num_systems, args.items_per_blob)
+        if len(systems) < 2:
+            raise ValueError("at least 2 systems are needed")
+        train_blobs = [blob for blobs in systems[::2] for blob in blobs]
+        eval_blobs = [blob for blobs in systems[1::2] for blob in blobs]
+        dictionary = train_dictionary(train_blobs, args.dictionary_size)
+        print(
+            f"{len(eval_blobs)} blobs, "
+            f"{sum(len(blob) for blob in eval_blobs) / 1e6:.1f} MB uncompressed"
+        )
+
+        print(
+            f"{'codec':>8} {'level':>6} {'dictionary':>11} {'ratio':>7} "
+            f"{'encode (MB/s)':>14} {'decode (MB/s)':>14}"
+        )
+        for name, level in _CODECS:
+            for codec_dictionary in [None, dictionary]:
+                ratio, encode_speed, decode_speed = benchmark(
+                    get_codec(name, level), codec_dictionary, eval_blobs, args.repeat
+                )
+                print(
+                    f"{name:>8} {level:>6} {str(codec_dictionary is not None):>11} "
+                    f"{ratio:>7.2f} {encode_speed:>14.1f} {decode_speed:>14.1f}"
+                )
+
+        if args.upload_dictionary:
+            get_storage().upload_dictionary(dictionary)
+            print(f"BLOB_CODEC_DICTIONARY={dictionary.dictionary_id:08x}")
+
+
+if __name__ == "__main__":
+    main()
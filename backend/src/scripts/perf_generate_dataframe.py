@@ -0,0 +1,160 @@
+import argparse
+import logging
+import random
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+
+from explainaboard_web.impl.db_utils.benchmark_db_utils import BenchmarkDBUtils
+
+"""
+Compares the time to build a leaderboard dataframe with the original row-by-row
+builder and the columnar `BenchmarkDBUtils.generate_dataframe_from_sys_infos`.
+Systems, datasets and configs are synthetic stand-ins so no DB is needed: dataset
+metadata is passed in through `dataset_metadata_cache`.
+"""
+
+
+def rowwise_dataframe(benchmark_config, systems, dataset_metadata_cache):
+    """The original cell-by-cell builder, for datasets listed in the config."""
+    dataset_configs = [dict(x) for x in benchmark_config.datasets]
+    dataset_to_id = {
+        (x["dataset_name"], x.get("sub_dataset", None), x.get("split", "test")): i
+        for i, x in enumerate(dataset_configs)
+    }
+    dataset_metadatas = [
+        dataset_metadata_cache[(x["dataset_name"], x.get("sub_dataset", None))]
+        for x in dataset_configs
+    ]
+    system_dataset_results = {}
+    for sys in systems:
+        if sys.system_name not in system_dataset_results:
+            system_dataset_results[sys.system_name] = [None for _ in dataset_configs]
+        dataset_id = dataset_to_id[
+            (sys.dataset.dataset_name, sys.dataset.sub_dataset, sys.dataset.split)
+        ]
+        system_dataset_results[sys.system_name][dataset_id] = sys
+    system_to_creator = {sys.system_name: sys.creator for sys in systems}
+
+    df_input = {
+        "system_name": [],
+        "dataset_name": [],
+        "sub_dataset": [],
+        "dataset_split": [],
+        "creator": [],
+    }
+    for dataset_config in dataset_configs:
+        for dataset_key in dataset_config.keys():
+            if not (dataset_key in df_input or dataset_key == "metrics"):
+                df_input[dataset_key] = []
+    df_input["metric"] = []
+    df_input["metric_weight"] = []
+    df_input["score"] = []
+
+    for sys_name, sys_results in system_dataset_results.items():
+        for dataset_config, dataset_metadata, sys in zip(
+            dataset_configs, dataset_metadatas, sys_results
+        ):
+            column_dict = dict(dataset_config)
+            column_dict["system_name"] = sys_name
+            dataset_metrics = dataset_config.get("metrics", benchmark_config.metrics)
+            for dataset_metric in dataset_metrics:
+                column_dict["metric"] = dataset_metric["name"]
+                column_dict["metric_weight"] = dataset_metric.get(
+                    "weight", 1.0 / len(dataset_metrics)
+                )
+                if sys is not None:
+                    column_dict["creator"] = sys.creator
+                    matching_results = []
+                    for level, m in sys.results.items():
+                        for k, v in m.items():
+                            if k == dataset_metric["name"]:
+                                matching_results.append(v)
+                    performance = max(matching_results) if matching_results else None
+                    column_dict["score"] = (
+                        performance
+                        if performance
+                        else (dataset_metric.get("default") or 0.0)
+                    )
+                else:
+                    column_dict["creator"] = system_to_creator[sys_name]
+                    column_dict["score"] = dataset_metric.get("default") or 0.0
+                for df_key, df_arr in df_input.items():
+                    if df_key in column_dict:
+                        info = column_dict[df_key]
+                    elif df_key == "sub_dataset":
+                        info = None
+                    elif df_key == "dataset_split":
+                        info = "test"
+                    else:
+                        info = None
+                    df_arr.append(info)
+    return pd.DataFrame(df_input)
+
+
+def make_benchmark(num_systems: int, num_datasets: int, num_metrics: int):
+    rng = random.Random(0)
+    metrics = [f"metric{i}" for i in range(num_metrics)]
+    datasets = [(f"dataset{i}", None, "test") for i in range(num_datasets)]
+    config = SimpleNamespace(
+        datasets=[
+            {"dataset_name": name, "sub_dataset": sub, "split": split}
+            for name, sub, split in datasets
+        ],
+        metrics=[{"name": metric} for metric in metrics],
+        views=[],
+    )
+    dataset_metadata_cache = {
+        (name, sub): SimpleNamespace(dataset_name=name, languages=["en"])
+        for name, sub, _ in datasets
+    }
+    systems = []
+    for i in range(num_systems):
+        for name, sub, split in datasets:
+            systems.append(
+                SimpleNamespace(
+                    system_name=f"system{i}",
+                    creator=f"user{i % 10}",
+                    dataset=SimpleNamespace(
+                        dataset_name=name, sub_dataset=sub, split=split
+                    ),
+                    results={
+                        "example": {metric: rng.random() for metric in metrics},
+                        "token": {metric: rng.random() for metric in metrics},
+                    },
+                )
+            )
+    return config, systems, dataset_metadata_cache
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark leaderboard dataframe construction")
+    parser.add_argument("--systems", type=int, default=1_000)
+    parser.add_argument("--datasets", type=int, default=100)
+    parser.add_argument("--metrics", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    config, systems, dataset_metadata_cache = make_benchmark(
+        args.systems, args.datasets, args.metrics
+    )
+    print(f"{args.systems} systems x {args.datasets} datasets x {args.metrics} metrics")
+
+    start = time.perf_counter()
+    expected = rowwise_dataframe(config, systems, dataset_metadata_cache)
+    rowwise_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = BenchmarkDBUtils.generate_dataframe_from_sys_infos(
+        config, systems, dataset_metadata_cache
+    )
+    columnar_time = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(expected, actual)
+    print(f"row-by-row: {rowwise_time:.3f}s")
+    print(f"columnar:   {columnar_time:.3f}s ({rowwise_time / columnar_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
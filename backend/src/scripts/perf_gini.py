@@ -0,0 +1,59 @@
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from explainaboard_web.impl.db_utils.benchmark_db_utils import BenchmarkDBUtils
+
+"""
+Compares the time to compute the Gini coefficient of every column of a dataframe
+with the original pairwise loop and the vectorized `BenchmarkDBUtils._gini`.
+"""
+
+
+def pairwise_gini(df: pd.DataFrame) -> pd.Series:
+    data = []
+    for col in df.columns:
+        x = np.sort(df[col].to_numpy())
+        total = 0
+        for i, xi in enumerate(x[:-1], 1):
+            total += np.sum(np.abs(xi - x[i:]))
+        data.append(total / (len(x) ** 2 * np.mean(x)))
+    return pd.Series(data=data, index=df.columns)
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark Gini coefficient implementations")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cols", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>8} {'pairwise (ms)':>14} {'vectorized (ms)':>16} {'speedup':>8}")
+    for n_rows in [100, 1_000, 10_000]:
+        df = pd.DataFrame(
+            rng.random((n_rows, args.cols)),
+            columns=[f"score{i}" for i in range(args.cols)],
+        )
+        assert np.allclose(
+            pairwise_gini(df), BenchmarkDBUtils._gini(df, numeric_only=True)
+        )
+        pairwise_time = (
+            timeit.timeit(lambda: pairwise_gini(df), number=args.repeat) / args.repeat
+        )
+        vectorized_time = (
+            timeit.timeit(
+                lambda: BenchmarkDBUtils._gini(df, numeric_only=True),
+                number=args.repeat,
+            )
+            / args.repeat
+        )
+        print(
+            f"{n_rows:>8} {pairwise_time * 1000:>14.3f} "
+            f"{vectorized_time * 1000:>16.3f} {pairwise_time / vectorized_time:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
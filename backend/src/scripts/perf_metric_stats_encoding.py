@@ -0,0 +1,61 @@
+import argparse
+import pickle
+import timeit
+import zlib
+
+import numpy as np
+
+from explainaboard_web.impl.utils import binarize_bson, unbinarize_bson
+
+"""
+Compares the size of the encoded metric stats and the time to decode them for the
+legacy pickle+zlib encoding and the typed ndarray encoding used by `binarize_bson`.
+Metric stats are synthetic arrays whose shapes match common metrics (one statistic
+per sample for accuracy-like metrics, several statistics for F1/BLEU-like metrics).
+"""
+
+
+def legacy_binarize(data):
+    return zlib.compress(pickle.dumps(data, protocol=2))
+
+
+def legacy_unbinarize(data):
+    return pickle.loads(zlib.decompress(data))
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark metric stats encodings")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shapes = [(1_000, 1), (100_000, 1), (100_000, 4), (1_000_000, 2)]
+    print(
+        f"{'shape':>14} {'encoding':>20} {'size (KB)':>10} "
+        f"{'encode (ms)':>12} {'decode (ms)':>12}"
+    )
+    for shape in shapes:
+        # most metric stats are counts or 0/1 scores, which compress well
+        data = rng.integers(0, 5, size=shape).astype(np.float64)
+        encodings = {
+            "pickle+zlib": (legacy_binarize, legacy_unbinarize),
+            "ndarray+shuffle+zlib": (binarize_bson, unbinarize_bson),
+            "ndarray": (
+                lambda x: binarize_bson(x, compress=False),
+                unbinarize_bson,
+            ),
+        }
+        for name, (encode, decode) in encodings.items():
+            encoded = encode(data)
+            assert np.array_equal(decode(encoded), data)
+            encode_time = timeit.timeit(lambda: encode(data), number=args.repeat)
+            decode_time = timeit.timeit(lambda: decode(encoded), number=args.repeat)
+            print(
+                f"{str(shape):>14} {name:>20} {len(encoded) / 1024:>10.1f} "
+                f"{encode_time / args.repeat * 1000:>12.3f} "
+                f"{decode_time / args.repeat * 1000:>12.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import datetime
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import google.auth.crypt
+import google.auth.jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from explainaboard_web.impl import auth
+
+_AUDIENCE = "explainaboard-test"
+
+
+def _generate_key(key_id: str) -> tuple[google.auth.crypt.RSASigner, str]:
+    """Returns a signer and the certificate of a new key"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, key_id)])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    signer = google.auth.crypt.RSASigner.from_string(private_pem, key_id=key_id)
+    return signer, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class TestVerifyFirebaseToken(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        # key id -> (signer, certificate)
+        cls.keys = {key_id: _generate_key(key_id) for key_id in ["k1", "k2"]}
+
+    def setUp(self) -> None:
+        self.published_certs = {"k1": self.keys["k1"][1]}
+        self.session = MagicMock()
+        self.session.get.side_effect = self._get
+        patchers = [
+            patch.object(auth, "_http_session", self.session),
+            patch.object(auth, "_certs_fetched_at", float("-inf")),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for cache in [auth._certs_cache, auth._verified_tokens]:
+            cache.clear()
+            self.addCleanup(cache.clear)
+
+    def _get(self, url, timeout):
+        response = MagicMock()
+        response.json.return_value = dict(self.published_certs)
+        response.headers = {"Cache-Control": "public, max-age=600"}
+        return response
+
+    def _token(
+        self, key_id="k1", audience=_AUDIENCE, expires_in=3600, user_id="user1"
+    ) -> str:
+        now = int(time.time())
+        payload = {
+            "aud": audience,
+            "iat": now,
+            "exp": now + expires_in,
+            "user_id": user_id,
+        }
+        return google.auth.jwt.encode(self.keys[key_id][0], payload).decode()
+
+    def test_cached(self):
+        token = self._token()
+        with patch.object(
+            google.auth.jwt, "decode", wraps=google.auth.jwt.decode
+        ) as decode:
+            for _ in range(3):
+                claims = auth._verify_firebase_token(token, _AUDIENCE)
+                self.assertEqual(claims["user_id"], "user1")
+            auth._verify_firebase_token(self._token(user_id="user2"), _AUDIENCE)
+        self.assertEqual(decode.call_count, 2)
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            auth._verify_firebase_token(self._token(audience="other"), _AUDIENCE)
+        with self.assertRaises(ValueError):
+            auth._verify_firebase_token(self._token(expires_in=-60), _AUDIENCE)
+        with self.assertRaises(ValueError):
+            auth._verify_firebase_token(self._token()[:-2], _AUDIENCE)
+
+    def test_key_rotation(self):
+        auth._verify_firebase_token(self._token(), _AUDIENCE)
+        self.published_certs["k2"] = self.keys["k2"][1]
+        # the last refresh was long ago
+        with patch.object(auth, "_certs_fetched_at", float("-inf")):
+            auth._verify_firebase_token(self._token(key_id="k2"), _AUDIENCE)
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_refresh_rate_limited(self):
+        auth._verify_firebase_token(self._token(), _AUDIENCE)
+        with patch.object(auth, "_certs_fetched_at", time.monotonic()):
+            with self.assertRaises(ValueError):
+                auth._verify_firebase_token(self._token(key_id="k2"), _AUDIENCE)
+        self.assertEqual(self.session.get.call_count, 1)
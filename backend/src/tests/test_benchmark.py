@@ -1,4 +1,7 @@
+import datetime
 import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
 
 import numpy as np
 import pandas as pd
@@ -133,3 +136,308 @@ class TestBenchmark(unittest.TestCase):
         table = BenchmarkDBUtils.dataframe_to_table("my_view", orig_df)
         exp_scores = [[0.7, 0.8], [0.6, 0.9], [0.5, 0.0]]
         self.assertDeepAlmostEqual(exp_scores, table.scores)
+
+
+class TestGenerateDataframe(unittest.TestCase):
+    def _system(self, name, creator, dataset_name, results):
+        return SimpleNamespace(
+            system_name=name,
+            creator=creator,
+            dataset=SimpleNamespace(
+                dataset_name=dataset_name, sub_dataset=None, split="test"
+            ),
+            results=results,
+        )
+
+    def test_generate_dataframe_from_sys_infos(self):
+        config = SimpleNamespace(
+            datasets=[
+                {"dataset_name": "data1", "split": "test"},
+                {
+                    "dataset_name": "data2",
+                    "split": "test",
+                    "metrics": [{"name": "F1", "default": 0.1}],
+                },
+            ],
+            metrics=[{"name": "Accuracy"}, {"name": "F1", "weight": 2.0}],
+            views=[SimpleNamespace(operations=[{"op": "mean", "group_by": ["lang"]}])],
+        )
+        dataset_metadata_cache = {
+            ("data1", None): SimpleNamespace(dataset_name="data1", languages=["en"]),
+            ("data2", None): SimpleNamespace(dataset_name="data2", languages=[]),
+        }
+        systems = [
+            self._system(
+                "sys1",
+                "user1",
+                "data1",
+                {"example": {"Accuracy": 0.5, "F1": 0.2}, "span": {"F1": 0.4}},
+            ),
+            self._system("sys2", "user2", "data2", {"example": {"F1": 0.0}}),
+        ]
+        df = BenchmarkDBUtils.generate_dataframe_from_sys_infos(
+            config, systems, dataset_metadata_cache
+        )
+        expected = pd.DataFrame(
+            {
+                "system_name": ["sys1", "sys1", "sys1", "sys2", "sys2", "sys2"],
+                "dataset_name": ["data1", "data1", "data2"] * 2,
+                "sub_dataset": [None] * 6,
+                "dataset_split": ["test"] * 6,
+                "creator": ["user1"] * 3 + ["user2"] * 3,
+                "split": ["test"] * 6,
+                "lang": [None] * 6,
+                "metric": ["Accuracy", "F1", "F1"] * 2,
+                "metric_weight": [0.5, 2.0, 1.0] * 2,
+                "score": [0.5, 0.4, 0.1, 0.0, 0.0, 0.1],
+            }
+        )
+        pd.testing.assert_frame_equal(expected, df)
+
+
+def _reference_dataframe_to_table(
+    input_df: pd.DataFrame, col_name: str
+) -> tuple[list, list, list]:
+    """The original row-by-row implementation of `dataframe_to_table`."""
+
+    def _col_name(elem_names, df_entry):
+        return "\n".join(
+            ["score"]
+            + [
+                f"{elem}={df_entry[elem]}"
+                for elem in elem_names
+                if df_entry[elem] and type(df_entry[elem]) == str
+            ]
+        )
+
+    elem_names = [x for x in input_df.columns if x not in {"score", col_name}]
+    system_idx = sorted(list(set(input_df[col_name])))
+    row_col_names = [_col_name(elem_names, x) for _, x in input_df.iterrows()]
+    column_idx = sorted(list(set(row_col_names)))
+    scores = pd.DataFrame(
+        {k: [0.0 for _ in system_idx] for k in column_idx}, index=system_idx
+    )
+    for (_, df_data), col_id in zip(input_df.iterrows(), row_col_names):
+        scores[col_id][df_data[col_name]] = df_data["score"]
+    scores = scores.sort_values(scores.columns[0], axis=0, ascending=False)
+    return (
+        list(scores.index),
+        list(scores.columns),
+        [[scores[j][i] for j in scores.columns] for i in scores.index],
+    )
+
+
+class TestDataframeToTable(unittest.TestCase):
+    def _fixtures(self) -> list[pd.DataFrame]:
+        languages = ["bam", "ewe", "hau", "", None]
+        rng = np.random.default_rng(0)
+        return [
+            # from TestBenchmark.test_dataframe_to_table
+            pd.DataFrame(
+                {
+                    "system_name": ["sys1", "sys2", "sys3", "sys1", "sys2", "sys3"],
+                    "dataset_name": ["data1"] * 3 + ["data2"] * 3,
+                    "score": [0.6, 0.7, 0.5, 0.9, 0.8, 0.0],
+                }
+            ),
+            # from TestBenchmark.test_masakhaner_aggregate, with empty, missing and
+            # duplicated cells
+            pd.DataFrame(
+                {
+                    "dataset_name": ["masakhaner"] * 12,
+                    "sub_dataset": [f"masakhaner-{x}" for x in languages * 2]
+                    + ["masakhaner-bam", None],
+                    "system_name": ["sys1"] * 5 + ["sys2"] * 5 + ["sys3", "sys1"],
+                    "source_language": languages * 2 + ["bam", None],
+                    "metric": ["F1"] * 12,
+                    "score": rng.random(12),
+                }
+            ),
+        ]
+
+    def test_matches_row_by_row(self):
+        for df in self._fixtures():
+            for col_name in ["system_name", "dataset_name"]:
+                table = BenchmarkDBUtils.dataframe_to_table(
+                    "my_view", df, {"my_view": [("2022-01-01", 0.9)]}, col_name
+                )
+                system_names, column_names, scores = _reference_dataframe_to_table(
+                    df, col_name
+                )
+                self.assertListEqual(system_names, table.system_names)
+                self.assertListEqual(column_names, table.column_names)
+                np.testing.assert_allclose(scores, table.scores)
+                self.assertListEqual([0.9], table.plot_y_values)
+
+
+def _reference_gini(df: pd.DataFrame) -> pd.Series:
+    """The original O(n^2) per-column implementation of `BenchmarkDBUtils._gini`."""
+    data = []
+    for col in df.columns:
+        x = np.sort(df[col].to_numpy())
+        total = 0
+        for i, xi in enumerate(x[:-1], 1):
+            total += np.sum(np.abs(xi - x[i:]))
+        data.append(total / (len(x) ** 2 * np.mean(x)))
+    return pd.Series(data=data, index=df.columns)
+
+
+class TestGini(unittest.TestCase):
+    def test_matches_pairwise_definition(self):
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            n_rows = int(rng.integers(1, 50))
+            n_cols = int(rng.integers(1, 5))
+            values = rng.random((n_rows, n_cols)) * rng.choice([1, 100])
+            if rng.random() < 0.3:
+                # ties are common for discrete scores
+                values = np.round(values, 1)
+            df = pd.DataFrame(values, columns=[f"c{i}" for i in range(n_cols)])
+            expected = _reference_gini(df)
+            actual = BenchmarkDBUtils._gini(df, numeric_only=True)
+            self.assertListEqual(list(expected.index), list(actual.index))
+            np.testing.assert_allclose(actual.to_numpy(), expected.to_numpy())
+
+    def test_numeric_only(self):
+        df = pd.DataFrame(
+            {
+                "system_name": ["sys1", "sys2", "sys3"],
+                "score": [1.0, 2.0, 3.0],
+                "count": [1, 1, 1],
+            }
+        )
+        gini = BenchmarkDBUtils._gini(df, numeric_only=True)
+        self.assertListEqual(["score", "count"], list(gini.index))
+        self.assertAlmostEqual(4 / 18, gini["score"])
+        self.assertAlmostEqual(0.0, gini["count"])
+
+
+class TestPlotState(unittest.TestCase):
+    def setUp(self):
+        self.systems = {
+            "a": ["2022-01-01", "2022-01-01 00:00:00", "sys_a"],
+            "b": ["2022-01-05", "2022-01-05 00:00:00", "sys_b"],
+        }
+        self.state = {
+            "version": BenchmarkDBUtils._PLOT_STATE_VERSION,
+            "config_hash": "hash",
+            "systems": self.systems,
+            "plots": {},
+        }
+
+    def test_up_to_date(self):
+        self.assertIsNone(
+            BenchmarkDBUtils._first_affected_date(self.state, "hash", self.systems)
+        )
+
+    def test_recompute_all(self):
+        for state, config_hash in [
+            (None, "hash"),
+            (self.state, "new_hash"),
+            ({**self.state, "version": -1}, "hash"),
+        ]:
+            self.assertEqual(
+                "",
+                BenchmarkDBUtils._first_affected_date(state, config_hash, self.systems),
+            )
+
+    def test_first_affected_date(self):
+        added = {**self.systems, "c": ["2022-01-07", "2022-01-07 00:00:00", "sys_c"]}
+        updated = {**self.systems, "b": ["2022-01-05", "2022-02-01 00:00:00", "sys_b"]}
+        renamed = {**self.systems, "b": ["2022-01-05", "2022-01-05 00:00:00", "new"]}
+        removed = {"b": self.systems["b"]}
+        for systems, expected in [
+            (added, "2022-01-07"),
+            (updated, "2022-01-05"),
+            (renamed, "2022-01-05"),
+            (removed, "2022-01-01"),
+        ]:
+            self.assertEqual(
+                expected,
+                BenchmarkDBUtils._first_affected_date(self.state, "hash", systems),
+            )
+
+
+class TestComputePlots(unittest.TestCase):
+    def setUp(self):
+        self.config = SimpleNamespace(
+            datasets=None,
+            metrics=[{"name": "Accuracy"}],
+            views=[
+                # aggregated system by system
+                SimpleNamespace(name="mean", trend=None, operations=[{"op": "mean"}]),
+                # aggregated over all the systems
+                SimpleNamespace(
+                    name="gini",
+                    trend="all",
+                    operations=[{"op": "gini", "skip_group_system": True}],
+                ),
+            ],
+        )
+        patcher = patch(
+            "explainaboard_web.impl.db_utils.benchmark_db_utils.DatasetDBUtils"
+            ".find_datasets",
+            side_effect=lambda dataset_name, **kwargs: SimpleNamespace(
+                total=1,
+                datasets=[SimpleNamespace(dataset_name=dataset_name, languages=[])],
+            ),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _system(self, name, day, dataset_name, score):
+        return SimpleNamespace(
+            system_id=f"{name}-{day}",
+            system_name=name,
+            creator="user1",
+            created_at=datetime.datetime(2022, 1, day),
+            dataset=SimpleNamespace(
+                dataset_name=dataset_name, sub_dataset=None, split="test"
+            ),
+            results={"example": {"Accuracy": score}},
+        )
+
+    def _compute_plots(self, systems):
+        """:return: the plots and the systems passed to each dataframe build"""
+        builds = []
+        generate = BenchmarkDBUtils.generate_dataframe_from_sys_infos
+
+        def generate_and_record(config, systems, *args):
+            builds.append(sorted(sys.system_id for sys in systems))
+            return generate(config, systems, *args)
+
+        with patch.object(
+            BenchmarkDBUtils,
+            "generate_dataframe_from_sys_infos",
+            side_effect=generate_and_record,
+        ):
+            plots = BenchmarkDBUtils._compute_plots(self.config, systems, None, "")
+        return plots, builds
+
+    def test_running_table(self):
+        systems = [
+            self._system("sys1", 1, "data1", 0.5),
+            self._system("sys2", 2, "data1", 0.7),
+            self._system("sys3", 3, "data1", 0.6),
+            # same name as an existing system
+            self._system("sys1", 4, "data1", 0.9),
+        ]
+        plots, builds = self._compute_plots(systems)
+        # one build per date with only the systems whose rows changed
+        self.assertEqual(
+            builds, [["sys1-1"], ["sys2-2"], ["sys3-3"], ["sys1-1", "sys1-4"]]
+        )
+        self.assertEqual(
+            [(date, round(score, 6)) for date, score in plots["mean"]],
+            [("2022-01-01", 0.5), ("2022-01-02", 0.7), ("2022-01-04", 0.9)],
+        )
+        self.assertEqual(len(plots["gini"]), 4)
+
+    def test_new_dataset(self):
+        systems = [
+            self._system("sys1", 1, "data1", 0.5),
+            self._system("sys2", 2, "data2", 0.7),
+        ]
+        _, builds = self._compute_plots(systems)
+        # every system has rows for the new dataset
+        self.assertEqual(builds, [["sys1-1"], ["sys1-1", "sys2-2"]])
@@ -0,0 +1,130 @@
+import json
+import zlib
+from unittest import TestCase
+
+from explainaboard_web.impl.blob_codecs import (
+    CodecDictionary,
+    decode,
+    encode,
+    get_codec,
+    read_header,
+    train_dictionary,
+)
+from explainaboard_web.impl.storage import Storage
+from explainaboard_web.impl.storage_backends import MemoryBackend
+
+_CODECS = ["zlib", "zstd", "lz4"]
+
+
+def _analysis_cases(n: int, seed: int) -> bytes:
+    cases = [
+        {
+            "sample_id": str(seed * n + i),
+            "features": {"text_length": i % 17, "label": f"label{(seed + i) % 3}"},
+        }
+        for i in range(n)
+    ]
+    return json.dumps(cases).encode()
+
+
+class TestBlobCodecs(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.dictionary = train_dictionary(
+            [_analysis_cases(20, seed) for seed in range(200)], size=4096
+        )
+
+    def test_round_trip(self):
+        data = _analysis_cases(100, 1000)
+        for name in _CODECS:
+            for dictionary in [None, self.dictionary]:
+                codec = get_codec(name)
+                blob = encode(data, codec, dictionary)
+                header = read_header(blob)
+                self.assertEqual(header.codec.name, name)
+                self.assertEqual(
+                    header.dictionary_id,
+                    dictionary.dictionary_id if dictionary else None,
+                )
+                self.assertEqual(decode(blob, lambda _: self.dictionary), data)
+
+    def test_dictionary_improves_ratio(self):
+        data = _analysis_cases(5, 1000)
+        for name in ["zstd", "lz4"]:
+            codec = get_codec(name)
+            self.assertLess(
+                len(encode(data, codec, self.dictionary)), len(encode(data, codec))
+            )
+
+    def test_legacy(self):
+        data = _analysis_cases(10, 0)
+        self.assertEqual(read_header(zlib.compress(data)).size, 0)
+        self.assertEqual(decode(zlib.compress(data)), data)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            get_codec("brotli")
+        blob = encode(b"data", get_codec("zstd"), self.dictionary)
+        with self.assertRaises(ValueError):
+            decode(blob)
+        with self.assertRaises(ValueError):
+            decode(blob[:3] + b"\xff" + blob[4:])
+
+    def test_bounded_decompression(self):
+        data = b"x" * (1 << 20)
+        for name in ["zlib", "zstd"]:
+            codec = get_codec(name)
+            decompressor = codec.decompressobj()
+            compressed = codec.compress(data)
+            pieces = []
+            while compressed:
+                pieces.append(decompressor.decompress(compressed, 1000))
+                compressed = decompressor.unconsumed_tail
+            pieces.append(decompressor.flush())
+            self.assertEqual(b"".join(pieces), data)
+            self.assertLessEqual(max(len(piece) for piece in pieces[:-1]), 1000)
+
+    def test_dictionary_id(self):
+        dictionary = CodecDictionary.from_bytes(self.dictionary.data)
+        self.assertEqual(dictionary, self.dictionary)
+        self.assertNotEqual(dictionary.dictionary_id, 0)
+
+
+class TestStorageCodecs(TestCase):
+    def setUp(self) -> None:
+        self.backend = MemoryBackend()
+        self.contents = json.dumps([{"text": "é" * i} for i in range(300)])
+
+    def test_legacy_blob(self):
+        storage = Storage(self.backend)
+        self.backend.upload("legacy", zlib.compress(self.contents.encode()))
+        self.assertEqual(storage.download_and_decompress("legacy"), self.contents)
+        self.assertEqual("".join(storage.iter_decompressed("legacy", 7)), self.contents)
+
+    def test_codecs(self):
+        for name in _CODECS:
+            storage = Storage(self.backend, codec=get_codec(name))
+            storage.compress_and_upload(name, self.contents)
+        # blobs are decoded with the codec in their header
+        storage = Storage(self.backend)
+        for name in _CODECS:
+            self.assertEqual(storage.download_and_decompress(name), self.contents)
+            pieces = list(storage.iter_decompressed(name, 64))
+            self.assertEqual("".join(pieces), self.contents)
+            self.assertLessEqual(max(len(piece) for piece in pieces), 64)
+
+    def test_dictionary(self):
+        dictionary = train_dictionary(
+            [_analysis_cases(20, seed) for seed in range(200)], size=4096
+        )
+        storage = Storage(
+            self.backend,
+            codec=get_codec("zstd"),
+            dictionary_id=dictionary.dictionary_id,
+        )
+        storage.upload_dictionary(dictionary)
+        storage.compress_and_upload("cases", self.contents)
+        # another process downloads the dictionary
+        storage = Storage(self.backend)
+        self.assertEqual(storage.download_and_decompress("cases"), self.contents)
+        self.assertEqual("".join(storage.iter_decompressed("cases")), self.contents)
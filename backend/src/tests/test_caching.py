@@ -0,0 +1,39 @@
+import time
+from unittest import TestCase
+
+from explainaboard_web.impl.caching import TTLCache
+
+
+class TestTTLCache(TestCase):
+    def test_get_and_set(self):
+        cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=None)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+    def test_lru_eviction(self):
+        cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=None)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expiration(self):
+        cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1, ttl=0.01)
+        cache.set("b", 2)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_pop(self):
+        cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=None)
+        cache.set("a", 1)
+        cache.pop("a")
+        cache.pop("missing")
+        self.assertIsNone(cache.get("a"))
@@ -0,0 +1,94 @@
+import json
+import zlib
+from unittest import TestCase
+
+from explainaboard_web.impl.blob_codecs import ZstdCodec
+from explainaboard_web.impl.chunked_blob import (
+    ChunkIndex,
+    convert_legacy_blob,
+    download_chunked,
+    iter_chunked,
+    upload_chunked,
+)
+from explainaboard_web.impl.storage import Storage
+from explainaboard_web.impl.storage_backends import MemoryBackend
+
+
+class _RecordingBackend(MemoryBackend):
+    """Records the reads"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads: list[tuple[int, int] | None] = []
+
+    def download(self, blob_name: str) -> bytes:
+        self.reads.append(None)
+        return super().download(blob_name)
+
+    def download_range(self, blob_name: str, start: int, end: int) -> bytes:
+        self.reads.append((start, end))
+        return super().download_range(blob_name, start, end)
+
+
+class TestChunkedBlob(TestCase):
+    def setUp(self) -> None:
+        self.backend = _RecordingBackend()
+        self.storage = Storage(self.backend)
+        self.items = [{"id": str(i), "text": f"sample {i}"} for i in range(25)]
+        self.index = upload_chunked(self.storage, "blob", self.items, chunk_size=10)
+
+    def test_index(self):
+        self.assertEqual(self.index.num_items, 25)
+        self.assertEqual(self.index.num_chunks, 3)
+        self.assertEqual(self.index.offsets[-1], len(self.backend.blobs["blob"]))
+        self.assertEqual(ChunkIndex.from_dict(self.index.to_dict()), self.index)
+
+    def test_download_all(self):
+        items = download_chunked(self.storage, "blob", self.index, None)
+        self.assertEqual(items, self.items)
+
+    def test_download_subset_reads_only_needed_chunks(self):
+        items = download_chunked(self.storage, "blob", self.index, [21, 3, -1])
+        self.assertEqual(items, [self.items[21], self.items[3], self.items[24]])
+        offsets = self.index.offsets
+        self.assertEqual(
+            self.backend.reads, [(offsets[0], offsets[1]), (offsets[2], offsets[3])]
+        )
+
+    def test_adjacent_chunks_are_read_together(self):
+        download_chunked(self.storage, "blob", self.index, [5, 15])
+        self.assertEqual(self.backend.reads, [(0, self.index.offsets[2])])
+
+    def test_iter_chunked(self):
+        chunks = list(iter_chunked(self.storage, "blob", self.index, chunks_per_read=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertEqual([item for chunk in chunks for item in chunk], self.items)
+        self.assertEqual(len(self.backend.reads), 2)
+
+    def test_invalid_id(self):
+        with self.assertRaises(IndexError):
+            download_chunked(self.storage, "blob", self.index, [25])
+
+    def test_empty(self):
+        index = upload_chunked(self.storage, "empty", [])
+        self.assertEqual(download_chunked(self.storage, "empty", index, None), [])
+
+    def test_convert_legacy_blob(self):
+        self.storage.upload("legacy", zlib.compress(json.dumps(self.items).encode()))
+        index = convert_legacy_blob(self.storage, "legacy", "new", chunk_size=7)
+        self.assertEqual(
+            download_chunked(self.storage, "new", index, [0, 8, 24]),
+            [self.items[0], self.items[8], self.items[24]],
+        )
+
+    def test_codec(self):
+        storage = Storage(self.backend, codec=ZstdCodec())
+        index = upload_chunked(storage, "zstd", self.items, chunk_size=10)
+        self.assertEqual(
+            download_chunked(storage, "zstd", index, [3, 24]),
+            [self.items[3], self.items[24]],
+        )
+        # the codec is recorded in the chunks
+        self.assertEqual(
+            download_chunked(self.storage, "zstd", index, None), self.items
+        )
@@ -0,0 +1,136 @@
+import io
+from unittest import TestCase
+
+import pyarrow as pa
+
+from explainaboard_web.impl.blob_codecs import (
+    ArrowCodec,
+    decode,
+    encode,
+    get_codec,
+    read_header,
+)
+from explainaboard_web.impl.columnar_blob import (
+    decode_columnar,
+    download_columnar,
+    encode_columnar,
+    iter_columnar,
+)
+from explainaboard_web.impl.storage import Storage
+from explainaboard_web.impl.storage_backends import MemoryBackend
+
+
+class _RecordingBackend(MemoryBackend):
+    """Records the ranged reads"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads: list[tuple[int, int]] = []
+
+    def download_range(self, blob_name: str, start: int, end: int) -> bytes:
+        self.reads.append((start, end))
+        return super().download_range(blob_name, start, end)
+
+
+class TestColumnarBlob(TestCase):
+    def setUp(self) -> None:
+        # same shape as the dicts of AnalysisCaseSpan
+        self.items = [
+            {
+                "sample_id": str(i // 3),
+                "features": {"span_length": i % 4, "span_tag": f"tag{i % 5}"},
+                "token_span": [i, i + 1],
+                "char_span": [i * 5, i * 5 + 4],
+                "text": f"text {i}",
+                "orig_str": "source" if i % 2 else None,
+            }
+            for i in range(25)
+        ]
+        self.data, self.index = encode_columnar(self.items, batch_size=10)
+        self.backend = _RecordingBackend()
+        self.backend.upload("blob", self.data)
+        self.storage = Storage(self.backend)
+
+    def test_decode_all(self):
+        self.assertEqual(decode_columnar(self.data, None), self.items)
+        self.assertEqual(list(iter_columnar(io.BytesIO(self.data))), self.items)
+        self.assertEqual(
+            download_columnar(self.storage, "blob", self.index, None), self.items
+        )
+
+    def test_index(self):
+        self.assertEqual(self.index.num_items, 25)
+        self.assertEqual(self.index.num_chunks, 3)
+        self.assertLessEqual(self.index.offsets[-1], len(self.data))
+
+    def test_header(self):
+        # the blob is self-describing and decodes to the Arrow stream
+        self.assertIsInstance(read_header(self.data).codec, ArrowCodec)
+        table = pa.ipc.open_stream(decode(self.data)).read_all()
+        self.assertEqual(table.to_pylist(), self.items)
+        with self.assertRaises(ValueError):
+            decode_columnar(encode(b"[]", get_codec("zlib")), None)
+
+    def test_decode_subset(self):
+        self.assertEqual(
+            decode_columnar(self.data, [21, 3, -1, 3]),
+            [self.items[21], self.items[3], self.items[24], self.items[3]],
+        )
+        self.assertEqual(decode_columnar(self.data, []), [])
+
+    def test_download_subset_reads_only_needed_batches(self):
+        items = download_columnar(self.storage, "blob", self.index, [21, -1, 15])
+        self.assertEqual(items, [self.items[21], self.items[24], self.items[15]])
+        offsets = self.index.offsets
+        # the schema, then batches 1 and 2 in one read
+        self.assertEqual(
+            self.backend.reads, [(0, offsets[0]), (offsets[1], offsets[3])]
+        )
+
+    def test_schema_is_read_with_first_batch(self):
+        items = download_columnar(self.storage, "blob", self.index, [3, 21])
+        self.assertEqual(items, [self.items[3], self.items[21]])
+        offsets = self.index.offsets
+        self.assertEqual(
+            self.backend.reads, [(0, offsets[1]), (offsets[2], offsets[3])]
+        )
+
+    def test_invalid_id(self):
+        for item_id in [25, -26]:
+            with self.assertRaises(IndexError):
+                decode_columnar(self.data, [item_id])
+            with self.assertRaises(IndexError):
+                download_columnar(self.storage, "blob", self.index, [item_id])
+
+    def test_tuples(self):
+        # dataclasses.asdict keeps tuples, which are read back as lists like JSON
+        data, _ = encode_columnar([{"token_span": (0, 1)}])
+        self.assertEqual(decode_columnar(data, None), [{"token_span": [0, 1]}])
+
+    def test_floats(self):
+        items = [{"score": 1.0, "scores": [0.5, 2.0]}, {"score": None, "scores": []}]
+        self.assertEqual(decode_columnar(encode_columnar(items)[0], None), items)
+
+    def test_empty(self):
+        data, index = encode_columnar([])
+        self.assertEqual(index.num_chunks, 0)
+        self.assertEqual(decode_columnar(data, None), [])
+        self.assertEqual(decode_columnar(data, []), [])
+        self.assertEqual(list(iter_columnar(io.BytesIO(data))), [])
+
+    def test_unsupported(self):
+        for items in [
+            [{"a": 1}, {"b": 1}],
+            [{"a": 1}, {"a": 1, "b": 1}],
+            [{"features": {"a": 1}}, {"features": {}}],
+            [{"spans": [{"a": 1}]}, {"spans": [{"b": 1}]}],
+            [{"a": 1}, {"a": "1"}],
+            # ints would be read back as floats
+            [{"a": 1}, {"a": 2.5}],
+            [{"a": 2.5}, {"a": 1}],
+            [{"features": {"a": 1}}, {"features": {"a": 2.5}}],
+            [{"a": [1, 2.5]}],
+            [{"spans": [{"a": 1}]}, {"spans": [{"a": 2.5}]}],
+        ]:
+            with self.assertRaises(ValueError):
+                encode_columnar(items)
@@ -0,0 +1,61 @@
+import threading
+import time
+from unittest import TestCase
+
+from flask import Flask, g
+
+from explainaboard_web.impl.concurrency import StageTimer, map_in_threads
+
+
+class TestMapInThreads(TestCase):
+    def setUp(self) -> None:
+        self.app = Flask(__name__)
+
+    def test_results_in_order(self):
+        with self.app.app_context():
+            results = map_in_threads(lambda x: x * 2, range(10), max_workers=4)
+        self.assertEqual(results, [x * 2 for x in range(10)])
+
+    def test_shares_request_globals(self):
+        def get_user(_):
+            self.assertNotEqual(threading.current_thread(), main_thread)
+            return g._user
+
+        main_thread = threading.current_thread()
+        with self.app.app_context():
+            g._user = "user1"
+            self.assertEqual(map_in_threads(get_user, [1, 2], 2), ["user1", "user1"])
+
+    def test_serial(self):
+        with self.app.app_context():
+            results = map_in_threads(
+                lambda _: threading.current_thread(), [1, 2], max_workers=1
+            )
+        self.assertEqual(results, [threading.current_thread()] * 2)
+
+    def test_raises(self):
+        def fail(x):
+            raise ValueError(x)
+
+        with self.app.app_context():
+            with self.assertRaises(ValueError):
+                map_in_threads(fail, [1, 2], max_workers=2)
+
+
+class TestStageTimer(TestCase):
+    def test_server_timing(self):
+        timer = StageTimer()
+        with timer.time("sys1", "load"):
+            time.sleep(0.01)
+        with timer.time("sys1", "load"):
+            pass
+        with timer.time("sys2", "analyses"):
+            pass
+        durations = timer.durations()
+        self.assertEqual(list(durations), [("sys1", "load"), ("sys2", "analyses")])
+        self.assertGreaterEqual(durations[("sys1", "load")], 0.01)
+        header = timer.to_server_timing()
+        self.assertRegex(
+            header,
+            r'^load;desc="sys1";dur=\d+\.\d, analyses;desc="sys2";dur=\d+\.\d$',
+        )
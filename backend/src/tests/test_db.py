@@ -0,0 +1,67 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import Flask
+
+from explainaboard_web.impl import db
+from explainaboard_web.impl.db import PoolStats, get_db
+
+
+class TestGetDB(TestCase):
+    def setUp(self) -> None:
+        self.app = Flask(__name__)
+        self.app.config.update(
+            DATABASE_URI="mongodb://<username>:<password>@localhost:27017",
+            DB_USERNAME="user",
+            DB_PASSWORD="password",
+            DB_MAX_POOL_SIZE=7,
+            DB_READ_PREFERENCE="secondaryPreferred",
+        )
+        patcher = patch.object(db, "_client", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shared(self):
+        with self.app.app_context():
+            client = get_db()
+        with self.app.app_context():
+            self.assertIs(get_db(), client)
+        self.assertEqual(client.options.pool_options.max_pool_size, 7)
+        self.assertEqual(client.read_preference.mongos_mode, "secondaryPreferred")
+
+    def test_new_client_after_fork(self):
+        with self.app.app_context():
+            client = get_db()
+            with patch.object(db.os, "getpid", return_value=-1):
+                self.assertIsNot(get_db(), client)
+
+    def test_config_change_closes_client(self):
+        with self.app.app_context():
+            client = get_db()
+            self.app.config["DB_MAX_POOL_SIZE"] = 8
+            with patch.object(client, "close") as close:
+                self.assertIsNot(get_db(), client)
+            close.assert_called_once()
+
+
+class TestPoolStats(TestCase):
+    def test_stats(self):
+        stats = PoolStats()
+        for _ in range(2):
+            stats.connection_created(None)
+            stats.connection_check_out_started(None)
+            stats.connection_checked_out(None)
+        stats.connection_check_out_started(None)
+        stats.connection_checked_in(None)
+        stats.connection_check_out_started(None)
+        stats.connection_check_out_failed(None)
+        self.assertEqual(
+            stats.stats(),
+            {
+                "pool_connections_created": 2,
+                "pool_connections_closed": 0,
+                "pool_checked_out": 1,
+                "pool_waiting": 1,
+                "pool_check_out_failed": 1,
+            },
+        )
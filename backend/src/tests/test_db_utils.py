@@ -0,0 +1,177 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pymongo import ReadPreference
+
+from explainaboard_web.impl.db_utils.db_utils import (
+    CountMode,
+    DBUtils,
+    _CollectionRegistry,
+)
+
+
+class _FakeDatabase:
+    def __init__(self, name: str, collection_names: list[str]) -> None:
+        self.name = name
+        self.collection_names = collection_names
+        self.n_listed = 0
+
+    def list_collection_names(self) -> list[str]:
+        self.n_listed += 1
+        return list(self.collection_names)
+
+
+class TestCollectionRegistry(TestCase):
+    def setUp(self) -> None:
+        self.registry = _CollectionRegistry()
+        self.database = _FakeDatabase("metadata", ["c1", "c2"])
+
+    def test_lists_once(self):
+        for _ in range(5):
+            self.assertTrue(self.registry.exists(self.database, "c1"))
+            self.assertTrue(self.registry.exists(self.database, "c2"))
+        self.assertEqual(self.database.n_listed, 1)
+        self.assertEqual(
+            self.registry.stats(),
+            {
+                "collection_checks": 10,
+                "collection_list_round_trips": 1,
+                "round_trips_saved": 9,
+            },
+        )
+
+    def test_refreshes_on_miss(self):
+        self.registry.refresh(self.database)
+        self.assertFalse(self.registry.exists(self.database, "c3"))
+        self.assertEqual(self.database.n_listed, 2)
+
+        self.database.collection_names.append("c3")
+        self.assertTrue(self.registry.exists(self.database, "c3"))
+        self.assertTrue(self.registry.exists(self.database, "c3"))
+        self.assertEqual(self.database.n_listed, 3)
+
+    def test_databases_are_separate(self):
+        other = _FakeDatabase("other", ["c3"])
+        self.assertTrue(self.registry.exists(self.database, "c1"))
+        self.assertFalse(self.registry.exists(other, "c1"))
+        self.assertTrue(self.registry.exists(other, "c3"))
+
+    def test_discard(self):
+        self.assertTrue(self.registry.exists(self.database, "c1"))
+        self.database.collection_names.remove("c1")
+        self.registry.discard("metadata", "c1")
+        self.assertFalse(self.registry.exists(self.database, "c1"))
+
+
+class TestFind(TestCase):
+    def setUp(self) -> None:
+        self.collection = MagicMock()
+        self.collection.count_documents.return_value = 5
+        self.collection.estimated_document_count.return_value = 7
+        patcher = patch.object(DBUtils, "get_collection", return_value=self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_count_modes(self):
+        filt = {"task": "qa"}
+        _, total = DBUtils.find(DBUtils.USER_METADATA, filt, count=CountMode.NONE)
+        self.assertIsNone(total)
+        self.collection.count_documents.assert_not_called()
+
+        _, total = DBUtils.find(DBUtils.USER_METADATA, filt)
+        self.assertEqual(total, 5)
+        self.collection.count_documents.assert_called_with(filt)
+
+        _, total = DBUtils.find(
+            DBUtils.USER_METADATA, filt, count=CountMode.CAPPED, count_cap=3
+        )
+        self.assertEqual(total, 5)
+        self.collection.count_documents.assert_called_with(filt, limit=3)
+
+        _, total = DBUtils.find(DBUtils.USER_METADATA, count=CountMode.ESTIMATED)
+        self.assertEqual(total, 7)
+
+    def test_find_page(self):
+        self.collection.aggregate.return_value = iter(
+            [{"documents": [{"_id": 1}], "total": [{"total": 11}]}]
+        )
+        documents, total = DBUtils.find_page(
+            DBUtils.USER_METADATA,
+            {"task": "qa"},
+            sort=[("created_at", -1)],
+            skip=10,
+            limit=10,
+            projection={"system_info": False},
+        )
+        self.assertEqual(documents, [{"_id": 1}])
+        self.assertEqual(total, 11)
+        self.collection.aggregate.assert_called_once_with(
+            [
+                {"$match": {"task": "qa"}},
+                {"$sort": {"created_at": -1}},
+                {"$project": {"system_info": False}},
+                {
+                    "$facet": {
+                        "documents": [{"$skip": 10}, {"$limit": 10}],
+                        "total": [{"$count": "total"}],
+                    }
+                },
+            ]
+        )
+
+    def test_find_one_by_id_reads_primary(self):
+        primary = self.collection.with_options.return_value
+        primary.find_one.return_value = {"_id": "id"}
+        self.assertEqual(
+            DBUtils.find_one_by_id(DBUtils.USER_METADATA, "id"), {"_id": "id"}
+        )
+        self.collection.with_options.assert_called_once_with(
+            read_preference=ReadPreference.PRIMARY
+        )
+        self.collection.find_one.assert_not_called()
+
+    def test_find_page_empty(self):
+        self.collection.aggregate.return_value = iter([{"documents": [], "total": []}])
+        self.assertEqual(DBUtils.find_page(DBUtils.USER_METADATA), ([], 0))
+
+
+class TestExecuteTransaction(TestCase):
+    def setUp(self) -> None:
+        client = MagicMock()
+        self.session = client.start_session.return_value.__enter__.return_value
+        self.session.in_transaction = True
+        patcher = patch.object(DBUtils, "get_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_after_commit(self):
+        calls = []
+
+        def callback(session):
+            DBUtils.after_commit(session, lambda: calls.append("after commit"))
+            self.assertEqual(calls, [])
+            return 1
+
+        self.assertEqual(DBUtils.execute_transaction(callback), 1)
+        self.assertEqual(calls, ["after commit"])
+        self.session.start_transaction.assert_called_once_with(
+            read_preference=ReadPreference.PRIMARY
+        )
+        self.assertEqual(DBUtils._after_commit, {})
+
+    def test_aborted(self):
+        calls = []
+
+        def callback(session):
+            DBUtils.after_commit(session, lambda: calls.append("after commit"))
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            DBUtils.execute_transaction(callback)
+        self.assertEqual(calls, [])
+        self.assertEqual(DBUtils._after_commit, {})
+
+    def test_without_session(self):
+        calls = []
+        DBUtils.after_commit(None, lambda: calls.append("now"))
+        self.assertEqual(calls, ["now"])
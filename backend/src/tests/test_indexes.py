@@ -0,0 +1,173 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from pymongo import DESCENDING, MongoClient
+
+from explainaboard_web.impl.db_utils.db_utils import DBCollection, DBUtils
+from explainaboard_web.impl.db_utils.indexes import INDEXES, ensure_indexes
+
+# URI of a mongod the explain plan tests can create databases in, e.g.
+# mongodb://localhost:27017
+_TEST_MONGO_URI = os.environ.get("EXPLAINABOARD_TEST_MONGO_URI")
+
+
+def _explain_stages(explain) -> list[str]:
+    """Returns the query plan stages and the aggregation stages found anywhere in
+    the output of an explain command"""
+    stages = []
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "stage" and isinstance(value, str):
+                stages.append(value)
+            elif key.startswith("$"):
+                stages.append(key)
+            stages.extend(_explain_stages(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            stages.extend(_explain_stages(value))
+    return stages
+
+
+def _plan_stages(plan: dict) -> list[str]:
+    """Returns the stages of a query plan and all its input stages"""
+    stages = [plan["stage"]]
+    for child in plan.get("inputStages", []) + [plan.get("inputStage")]:
+        if child:
+            stages.extend(_plan_stages(child))
+    return stages
+
+
+class TestIndexSpecs(TestCase):
+    def test_unique_names(self):
+        names = [(spec.collection.collection_name, spec.name) for spec in INDEXES]
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_collections(self):
+        collections = [
+            value for value in vars(DBUtils).values() if isinstance(value, DBCollection)
+        ]
+        for spec in INDEXES:
+            self.assertIn(spec.collection, collections)
+
+    def test_index_model(self):
+        spec = INDEXES[0]
+        document = spec.to_index_model().document
+        self.assertEqual(document["name"], spec.name)
+        self.assertEqual(document["partialFilterExpression"], spec.partial_filter)
+
+
+@unittest.skipUnless(_TEST_MONGO_URI, "EXPLAINABOARD_TEST_MONGO_URI is not set")
+class TestQueryPlans(TestCase):
+    """Hot queries must be served by an index. The queries have the same shape as
+    the ones built by the DB utils."""
+
+    _DB_PREFIX = "test_indexes_"
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.client = MongoClient(_TEST_MONGO_URI)
+
+        def get_collection(collection: DBCollection):
+            return cls.client[cls._DB_PREFIX + collection.db_name][
+                collection.collection_name
+            ]
+
+        cls.systems = get_collection(DBUtils.DEV_SYSTEM_METADATA)
+        cls.users = get_collection(DBUtils.USER_METADATA)
+        cls.significance_tests = get_collection(DBUtils.SIGNIFICANCE_TEST_CACHE)
+        now = datetime.utcnow()
+        cls.systems.insert_many(
+            [
+                {
+                    "system_name": f"system{i}",
+                    "task": f"task{i % 5}",
+                    "creator": f"user{i % 7}",
+                    "is_private": i % 3 == 0,
+                    "shared_users": [f"user{i % 11}@example.com"] if i % 4 else [],
+                    "system_tags": [f"tag{i % 6}"],
+                    "dataset": {
+                        "dataset_name": f"dataset{i % 9}",
+                        "sub_dataset": None,
+                        "split": "test",
+                    },
+                    "created_at": now - timedelta(minutes=i),
+                }
+                for i in range(500)
+            ]
+        )
+        cls.users.insert_many(
+            [{"_id": f"user{i}", "email": f"user{i}@example.com"} for i in range(50)]
+        )
+        ensure_indexes(get_collection)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        for db_name in {spec.collection.db_name for spec in INDEXES}:
+            cls.client.drop_database(cls._DB_PREFIX + db_name)
+        cls.client.close()
+
+    def assertIndexed(self, collection, filt: dict, sort: list | None = None):
+        cursor = collection.find(filt)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = _plan_stages(cursor.explain()["queryPlanner"]["winningPlan"])
+        self.assertNotIn("COLLSCAN", stages, f"{filt} is not indexed: {stages}")
+
+    def _find_systems_filter(self, conditions: list[dict]) -> dict:
+        """same as SystemDBUtils.query_systems for a logged in user"""
+        permission = {
+            "$or": [
+                {"is_private": False},
+                {"creator": "user1"},
+                {"shared_users": "user1@example.com"},
+            ]
+        }
+        status = {"status": {"$nin": ["pending", "processing", "failed"]}}
+        return {"$and": conditions + [status, permission]}
+
+    def test_find_systems(self):
+        sort = [("created_at", DESCENDING)]
+        for conditions in [
+            [],
+            [{"task": "task1"}],
+            [
+                {"dataset.dataset_name": "dataset1"},
+                {"dataset.sub_dataset": None},
+                {"dataset.split": "test"},
+            ],
+            [{"creator": "user2"}],
+            [{"system_name": {"$regex": r"^system1.*"}}],
+            [{"system_tags": {"$all": ["tag1"]}}],
+        ]:
+            self.assertIndexed(
+                self.systems, self._find_systems_filter(conditions), sort
+            )
+
+    def test_find_page(self):
+        """DBUtils.find_page, which is used to list systems with a total"""
+        pipeline = DBUtils.page_pipeline(
+            self._find_systems_filter([{"task": "task1"}]),
+            [("created_at", DESCENDING)],
+            20,
+            10,
+            {"system_info": False, "metric_stats": False},
+        )
+        explain = self.systems.database.command(
+            "aggregate", self.systems.name, pipeline=pipeline, explain=True
+        )
+        stages = _explain_stages(explain)
+        self.assertNotIn("COLLSCAN", stages, stages)
+        # the documents are not sorted in memory
+        self.assertNotIn("SORT", stages, stages)
+        self.assertNotIn("$sort", stages, stages)
+        result = next(self.systems.aggregate(pipeline))
+        self.assertEqual(len(result["documents"]), 10)
+        self.assertNotIn("metric_stats", result["documents"][0])
+
+    def test_find_user(self):
+        self.assertIndexed(self.users, {"$or": [{"_id": "user1"}, {"email": "user1"}]})
+
+    def test_significance_tests(self):
+        self.assertIndexed(self.significance_tests, {"system_ids": "id1"})
@@ -0,0 +1,55 @@
+import threading
+from unittest import TestCase
+
+from flask import Flask, g
+
+from explainaboard_web.impl.jobs import InProcessJobQueue
+
+
+class TestInProcessJobQueue(TestCase):
+    def setUp(self) -> None:
+        self.app = Flask(__name__)
+        self.queue = InProcessJobQueue(max_workers=2)
+
+    def test_runs_after_request(self):
+        results: list[str] = []
+        started = threading.Event()
+
+        def job():
+            started.wait()
+            results.append(g._user)
+
+        with self.app.app_context():
+            g._user = "user1"
+            self.queue.submit(job)
+        # the app context of the request has been torn down
+        started.set()
+        self.queue.join()
+        self.assertEqual(results, ["user1"])
+
+    def test_only_copies_user(self):
+        results: list[bool] = []
+
+        def job():
+            results.append(hasattr(g, "_users"))
+
+        with self.app.app_context():
+            g._user = "user1"
+            g._users = {}
+            self.queue.submit(job)
+        self.queue.join()
+        self.assertEqual(results, [False])
+
+    def test_failure_does_not_stop_queue(self):
+        results: list[int] = []
+
+        def fail():
+            raise ValueError()
+
+        with self.app.app_context():
+            with self.assertLogs(level="ERROR"):
+                self.queue.submit(fail)
+                self.queue.join()
+            self.queue.submit(lambda: results.append(1))
+        self.queue.join()
+        self.assertEqual(results, [1])
@@ -0,0 +1,186 @@
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from explainaboard_web.impl.analyses import significance_analysis
+from explainaboard_web.impl.analyses.significance_analysis import (
+    bootstrap_win_matrix,
+    bootstrap_wins,
+    pairwise_significance_test,
+)
+
+
+class _MeanStats:
+    """A stand-in for MetricStats whose metric is the mean of one statistic."""
+
+    def __init__(self, data: np.ndarray) -> None:
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def filter(self, indices: np.ndarray) -> np.ndarray:
+        return self.data[indices]
+
+
+class _MeanMetric:
+    def aggregate_stats(self, stats: np.ndarray) -> np.ndarray:
+        return stats.mean(axis=-1)
+
+    def calc_metric_from_aggregate(self, agg_stats: np.ndarray) -> np.ndarray:
+        return agg_stats
+
+
+class TestBootstrapWins(TestCase):
+    def setUp(self) -> None:
+        data_rng = np.random.default_rng(0)
+        self.better = _MeanStats(data_rng.random(1000) + 0.2)
+        self.worse = _MeanStats(data_rng.random(1000))
+        self.similar = _MeanStats(data_rng.random(1000))
+
+    def _loop_wins(self, sys1, sys2, n_samples, prop_samples, seed):
+        """The original per-sample loop with all the indices drawn at once."""
+        rng = np.random.default_rng(seed)
+        n_elems = max(int(prop_samples * len(sys1)), 1)
+        indices = rng.integers(len(sys1), size=(n_samples, n_elems))
+        wins = [0, 0, 0]
+        metric = _MeanMetric()
+        sys1_scores = metric.aggregate_stats(sys1.filter(indices))
+        sys2_scores = metric.aggregate_stats(sys2.filter(indices))
+        for sys1_score, sys2_score in zip(sys1_scores, sys2_scores):
+            if sys1_score > sys2_score:
+                wins[0] += 1
+            elif sys1_score < sys2_score:
+                wins[1] += 1
+            else:
+                wins[2] += 1
+        return wins
+
+    def test_matches_loop(self):
+        for sys1, sys2 in [(self.better, self.worse), (self.worse, self.similar)]:
+            wins, n_drawn = bootstrap_wins(
+                _MeanMetric(), sys1, sys2, 500, 0.5, np.random.default_rng(1)
+            )
+            self.assertEqual(n_drawn, 500)
+            self.assertListEqual(
+                list(wins), self._loop_wins(sys1, sys2, 500, 0.5, seed=1)
+            )
+
+    def test_ties(self):
+        wins, _ = bootstrap_wins(
+            _MeanMetric(), self.worse, self.worse, 100, 0.5, np.random.default_rng()
+        )
+        self.assertListEqual(list(wins), [0, 0, 100])
+
+    def test_batches(self):
+        with patch.object(significance_analysis, "_MAX_BATCH_INDICES", 1000):
+            wins, n_drawn = bootstrap_wins(
+                _MeanMetric(), self.better, self.worse, 7, 0.3, np.random.default_rng()
+            )
+        self.assertEqual(n_drawn, 7)
+        self.assertEqual(wins.sum(), 7)
+
+    def test_early_stopping(self):
+        wins, n_drawn = bootstrap_wins(
+            _MeanMetric(),
+            self.better,
+            self.worse,
+            10000,
+            0.5,
+            np.random.default_rng(0),
+            early_stopping_alpha=0.05,
+        )
+        self.assertLess(n_drawn, 10000)
+        self.assertEqual(wins[0], n_drawn)
+
+    def test_no_early_stopping_near_threshold(self):
+        # the p-value is not clearly on one side of the threshold for similar systems
+        _, n_drawn = bootstrap_wins(
+            _MeanMetric(),
+            self.worse,
+            self.similar,
+            300,
+            0.01,
+            np.random.default_rng(0),
+            early_stopping_alpha=0.5,
+        )
+        self.assertEqual(n_drawn, 300)
+
+
+class TestBootstrapWinMatrix(TestCase):
+    def setUp(self) -> None:
+        data_rng = np.random.default_rng(0)
+        self.stats = [
+            _MeanStats(data_rng.random(500) + offset) for offset in [0.0, 0.1, 0.0]
+        ]
+
+    def test_matches_pairwise(self):
+        wins = bootstrap_win_matrix(
+            _MeanMetric(), self.stats[:2], 200, 0.5, np.random.default_rng(3)
+        )
+        pairwise_wins, _ = bootstrap_wins(
+            _MeanMetric(), *self.stats[:2], 200, 0.5, np.random.default_rng(3)
+        )
+        self.assertEqual(wins[0, 1], pairwise_wins[0])
+        self.assertEqual(wins[1, 0], pairwise_wins[1])
+
+    def test_matrix(self):
+        with patch.object(significance_analysis, "_MAX_BATCH_INDICES", 10000):
+            wins = bootstrap_win_matrix(
+                _MeanMetric(), self.stats, 100, 0.5, np.random.default_rng()
+            )
+        self.assertEqual(wins.shape, (3, 3))
+        self.assertListEqual(list(np.diag(wins)), [0, 0, 0])
+        self.assertTrue(np.all(wins + wins.T <= 100))
+        # the second system is the best one
+        self.assertGreater(wins[1, 0], 90)
+        self.assertGreater(wins[1, 2], 90)
+
+
+class _DictCache:
+    def __init__(self) -> None:
+        self.results: dict[str, tuple[list[int], int]] = {}
+
+    def get(self, metric_name):
+        return self.results.get(metric_name)
+
+    def put(self, metric_name, wins, n_drawn):
+        self.results[metric_name] = (wins, n_drawn)
+
+
+class TestPairwiseSignificanceTest(TestCase):
+    def setUp(self) -> None:
+        data_rng = np.random.default_rng(0)
+        metric_config = SimpleNamespace(to_metric=_MeanMetric)
+        self.infos = [
+            SimpleNamespace(
+                system_name=name,
+                analysis_levels=[SimpleNamespace(metric_configs={"m1": metric_config})],
+            )
+            for name in ["sys1", "sys2"]
+        ]
+        self.stats = [
+            {"m1": _MeanStats(data_rng.random(300) + offset)} for offset in [0, 0.02]
+        ]
+
+    def _test(self, **kwargs):
+        return pairwise_significance_test(
+            *self.infos, *self.stats, n_samples=100, prop_samples=0.5, **kwargs
+        )[0].test_data
+
+    def test_seed(self):
+        self.assertEqual(self._test(seed=1), self._test(seed=1))
+
+    def test_cache(self):
+        cache = _DictCache()
+        result = self._test(cache=cache)
+        wins, n_drawn = cache.results["m1"]
+        self.assertEqual(n_drawn, 100)
+        self.assertEqual(sum(wins), 100)
+        self.assertEqual(result["system1_win_count"], wins[0] / 100)
+
+        with patch.object(significance_analysis, "bootstrap_wins") as mock_wins:
+            self.assertEqual(self._test(cache=cache), result)
+        mock_wins.assert_not_called()
@@ -0,0 +1,45 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.db_utils.significance_test_db_utils import (
+    SignificanceTestDBCache,
+)
+
+
+class _FakeCollection:
+    def __init__(self) -> None:
+        self.docs: dict[str, dict] = {}
+
+    def find(self, filt: dict) -> list[dict]:
+        return [
+            doc
+            for doc in self.docs.values()
+            if all(doc.get(key) == value for key, value in filt.items())
+        ]
+
+    def replace_one(self, filt: dict, doc: dict, upsert: bool) -> None:
+        self.docs[filt["_id"]] = doc
+
+
+class TestSignificanceTestDBCache(TestCase):
+    def setUp(self) -> None:
+        self.collection = _FakeCollection()
+        patcher = patch.object(DBUtils, "get_collection", return_value=self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _cache(self, system_ids: list[str], versions: tuple) -> SignificanceTestDBCache:
+        return SignificanceTestDBCache(
+            *system_ids, 1000, 0.5, 0.05, "0.1", properties_versions=versions
+        )
+
+    def test_flipped(self):
+        self._cache(["a", "b"], ("1", "2")).put("F1", [3, 1, 0], 4)
+        self.assertEqual(self._cache(["b", "a"], ("2", "1")).get("F1"), ([1, 3, 0], 4))
+
+    def test_recomputed_stats_miss(self):
+        self._cache(["a", "b"], ("1", "2")).put("F1", [3, 1, 0], 4)
+        # the stats of system "b" were recomputed
+        self.assertIsNone(self._cache(["a", "b"], ("1", "3")).get("F1"))
+        self.assertIsNone(self._cache(["b", "a"], ("1", "2")).get("F1"))
@@ -0,0 +1,363 @@
+import io
+import os
+import tempfile
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import Flask
+from google.api_core.exceptions import NotFound
+
+from explainaboard_web.impl import storage
+from explainaboard_web.impl.blob_codecs import decode
+from explainaboard_web.impl.storage import BlobCache, Storage, get_blob_cache
+from explainaboard_web.impl.storage_backends import (
+    BlobNotFound,
+    FilesystemBackend,
+    GCSBackend,
+    MemoryBackend,
+    StorageBackend,
+)
+
+
+class _FakeBlob:
+    def __init__(self, bucket: "_FakeBucket", name: str) -> None:
+        self._bucket = bucket
+        self._name = name
+        self.generation: int | None = None
+
+    def upload_from_string(self, contents: str | bytes) -> None:
+        if isinstance(contents, str):
+            contents = contents.encode()
+        self._bucket.record()
+        self.generation = self._bucket.store(self._name, contents)
+
+    def _check_exists(self) -> None:
+        if self._name not in self._bucket.blobs:
+            raise NotFound(self._name)
+
+    def reload(self) -> None:
+        self._bucket.record()
+        self._check_exists()
+        self.generation = self._bucket.generations[self._name]
+
+    def download_as_bytes(self, start: int | None = None, end: int | None = None):
+        self._bucket.record()
+        self._check_exists()
+        contents = self._bucket.blobs[self._name]
+        self.generation = self._bucket.generations[self._name]
+        if start is not None:
+            contents = contents[start : end + 1]
+        return contents
+
+    def open(self, mode: str):
+        return io.BytesIO(self._bucket.blobs[self._name])
+
+    def delete(self) -> None:
+        self._bucket.record()
+        self._check_exists()
+        del self._bucket.blobs[self._name]
+        del self._bucket.generations[self._name]
+
+
+class _FakeBucket:
+    """Stands in for a Cloud Storage bucket and records the threads that make
+    requests"""
+
+    def __init__(self, n_concurrent: int = 0) -> None:
+        self.blobs: dict[str, bytes] = {}
+        self.generations: dict[str, int] = {}
+        self.threads: set[int] = set()
+        self.batches = 0
+        self._in_batch = False
+        # the first `n_concurrent` requests wait for each other so the test fails
+        # (times out) unless they are made concurrently
+        self._n_concurrent = n_concurrent
+        self._barrier = threading.Barrier(max(n_concurrent, 1), timeout=5)
+        self._n_requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> "_FakeBucket":
+        return self
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Requests made in the block are sent as one request"""
+        self.record()
+        self.batches += 1
+        self._in_batch = True
+        try:
+            yield
+        finally:
+            self._in_batch = False
+
+    def blob(self, name: str) -> _FakeBlob:
+        return _FakeBlob(self, name)
+
+    def store(self, name: str, contents: bytes) -> int:
+        with self._lock:
+            self.blobs[name] = contents
+            self.generations[name] = self.generations.get(name, 0) + 1
+            return self.generations[name]
+
+    def record(self) -> None:
+        if self._in_batch:
+            return
+        with self._lock:
+            self._n_requests += 1
+            wait = self._n_requests <= self._n_concurrent
+            self.threads.add(threading.get_ident())
+        if wait:
+            self._barrier.wait()
+
+
+class TestBlobCache(TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = self._tmp_dir.name
+
+    def tearDown(self) -> None:
+        self._tmp_dir.cleanup()
+
+    def test_get_and_put(self):
+        cache = BlobCache(self.cache_dir, max_bytes=1024)
+        self.assertIsNone(cache.get("sys/__SYSOUT__", "1"))
+        cache.put("sys/__SYSOUT__", "1", b"contents")
+        self.assertEqual(cache.get("sys/__SYSOUT__", "1"), b"contents")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+    def test_versions(self):
+        cache = BlobCache(self.cache_dir, max_bytes=1024)
+        cache.put("blob", "1", b"old contents")
+        self.assertIsNone(cache.get("blob", "2"))
+        cache.put("blob", "2", b"new contents")
+        self.assertEqual(cache.get("blob", "2"), b"new contents")
+
+    def test_get_range(self):
+        cache = BlobCache(self.cache_dir, max_bytes=1024)
+        self.assertIsNone(cache.get_range("blob", "1", 2, 6))
+        cache.put("blob", "1", b"contents")
+        self.assertEqual(cache.get_range("blob", "1", 2, 6), b"nten")
+        self.assertEqual(cache.get_range("blob", "1", 6, 20), b"ts")
+
+    def test_stats_concurrent(self):
+        cache = BlobCache(self.cache_dir, max_bytes=1024)
+        cache.put("blob", "1", b"contents")
+
+        def read():
+            for _ in range(200):
+                cache.get("blob", "1")
+                cache.get("missing", "1")
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.stats(), {"hits": 1600, "misses": 1600})
+
+    def test_shared_between_instances(self):
+        BlobCache(self.cache_dir, max_bytes=1024).put("blob", "1", b"contents")
+        self.assertEqual(
+            BlobCache(self.cache_dir, max_bytes=1024).get("blob", "1"), b"contents"
+        )
+
+    def test_lru_eviction(self):
+        cache = BlobCache(self.cache_dir, max_bytes=100)
+        cache.put("a", "1", b"a" * 40)
+        cache.put("b", "1", b"b" * 40)
+        # make "a" the most recently used entry
+        for i, name in enumerate(["b", "a"]):
+            os.utime(cache._entry_path(name, "1"), (i, i))
+        cache.put("c", "1", b"c" * 40)
+        self.assertIsNone(cache.get("b", "1"))
+        self.assertEqual(cache.get("a", "1"), b"a" * 40)
+        self.assertEqual(cache.get("c", "1"), b"c" * 40)
+
+
+class TestGetBlobCache(TestCase):
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.app = Flask(__name__)
+        self.app.config.update(BLOB_CACHE_MAX_BYTES=1024, BLOB_CACHE_DIR=tmp_dir.name)
+        patcher = patch.object(storage, "_blob_cache", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_shared(self):
+        with self.app.app_context():
+            self.assertIs(get_blob_cache(), get_blob_cache())
+
+    def test_new_cache_after_fork(self):
+        with self.app.app_context():
+            cache = get_blob_cache()
+            with patch.object(storage.os, "getpid", return_value=-1):
+                self.assertIsNot(get_blob_cache(), cache)
+
+    def test_disabled(self):
+        self.app.config["BLOB_CACHE_MAX_BYTES"] = 0
+        with self.app.app_context():
+            self.assertIsNone(get_blob_cache())
+
+
+class TestStorage(TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp_dir.cleanup)
+        self.bucket = _FakeBucket()
+        self.cache = BlobCache(self._tmp_dir.name, max_bytes=1 << 20)
+        self.storage = Storage(GCSBackend(self.bucket), self.cache, transfer_workers=4)
+
+    def test_upload_and_download_many(self):
+        self.bucket = _FakeBucket(n_concurrent=4)
+        self.storage = Storage(GCSBackend(self.bucket), self.cache, transfer_workers=4)
+        blobs = [(f"blob{i}", f"contents{i}".encode()) for i in range(20)]
+        self.storage.upload_many(blobs)
+        self.assertGreaterEqual(len(self.bucket.threads), 4)
+        self.assertEqual(self.bucket.blobs, dict(blobs))
+
+        names = [name for name, _ in reversed(blobs)]
+        self.assertEqual(
+            self.storage.download_many(names), [data for _, data in reversed(blobs)]
+        )
+
+    def test_overwritten_blob_is_not_stale(self):
+        self.storage.upload("a", b"old")
+        self.assertEqual(self.storage.download("a"), b"old")
+        # overwritten by another process, which doesn't share the cache
+        GCSBackend(self.bucket).upload("a", b"new")
+        self.assertEqual(self.storage.download("a"), b"new")
+        self.assertEqual(self.storage.download_range("a", 1, 3), b"ew")
+        with self.storage.open("a") as f:
+            self.assertEqual(f.read(), b"new")
+
+    def test_compress_and_upload_many(self):
+        self.storage.compress_and_upload_many([("a", "aaa"), ("b", "bbb")])
+        self.assertEqual(decode(self.bucket.blobs["b"]), b"bbb")
+        self.assertEqual(self.storage.download_and_decompress("a"), "aaa")
+
+    def test_shared_executor(self):
+        self.bucket = _FakeBucket(n_concurrent=4)
+        self.storage = Storage(GCSBackend(self.bucket), None, transfer_workers=4)
+        for i in range(3):
+            self.storage.upload_many([(f"{i}-{j}", b"contents") for j in range(4)])
+        self.assertEqual(len(self.bucket.threads - {threading.get_ident()}), 4)
+
+    def test_delete(self):
+        self.storage.upload_many([("a", b"a"), ("b", b"b"), ("c", b"c")])
+        self.storage.delete(["a", "b"])
+        self.assertEqual(list(self.bucket.blobs), ["c"])
+        self.assertEqual(self.bucket.batches, 1)
+        with self.assertRaises(BlobNotFound):
+            self.storage.download("a")
+        with self.assertRaises(BlobNotFound):
+            self.storage.delete(["a", "c"])
+
+    def test_download_range_caches_whole_blob(self):
+        GCSBackend(self.bucket).upload("a", b"0123456789")
+        self.assertEqual(self.storage.download_range("a", 2, 5), b"234")
+        self.assertEqual(self.cache.get("a", "1"), b"0123456789")
+        # the next ranges are sliced from the cached blob
+        self.assertEqual(self.storage.download_range("a", 6, 8), b"67")
+        self.assertEqual(self.cache.stats(), {"hits": 2, "misses": 1})
+
+
+class _BackendTests:
+    """Tests that all the backends must pass"""
+
+    def create_backend(self) -> StorageBackend:
+        raise NotImplementedError
+
+    def setUp(self) -> None:
+        self.backend = self.create_backend()
+
+    def test_upload_and_download(self):
+        self.backend.upload("sys/__SYSOUT__", b"contents")
+        self.assertEqual(self.backend.download("sys/__SYSOUT__"), b"contents")
+        self.backend.upload("sys/__SYSOUT__", b"new contents")
+        self.assertEqual(self.backend.download("sys/__SYSOUT__"), b"new contents")
+
+    def test_download_range(self):
+        self.backend.upload("a", b"0123456789")
+        self.assertEqual(self.backend.download_range("a", 2, 5), b"234")
+        self.assertEqual(self.backend.download_range("a", 8, 20), b"89")
+        self.assertEqual(self.backend.download_range("a", 4, 4), b"")
+
+    def test_open(self):
+        self.backend.upload("a", b"0123456789")
+        with self.backend.open("a") as f:
+            self.assertEqual(f.read(4), b"0123")
+            self.assertEqual(f.read(), b"456789")
+
+    def test_versions(self):
+        version = self.backend.upload("a", b"old")
+        self.assertEqual(self.backend.version("a"), version)
+        self.assertEqual(self.backend.download_versioned("a"), (b"old", version))
+        new_version = self.backend.upload("a", b"new")
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(self.backend.download_versioned("a"), (b"new", new_version))
+
+    def test_delete(self):
+        self.backend.upload("sys/a", b"a")
+        self.backend.upload("sys/b", b"b")
+        self.backend.delete("sys/a")
+        with self.assertRaises(BlobNotFound):
+            self.backend.download("sys/a")
+        self.assertEqual(self.backend.download("sys/b"), b"b")
+
+    def test_not_found(self):
+        self.backend.upload("sys/a", b"a")
+        for read in [
+            self.backend.version,
+            self.backend.download,
+            self.backend.download_versioned,
+            lambda name: self.backend.download_range(name, 0, 1),
+            self.backend.open,
+            self.backend.delete,
+            lambda name: self.backend.delete_many([name]),
+        ]:
+            for name in ["missing", "sys/missing", "missing/a", "sys/a/b"]:
+                with self.assertRaises(BlobNotFound, msg=name):
+                    read(name)
+
+    def test_storage(self):
+        storage = Storage(self.backend, transfer_workers=4)
+        storage.compress_and_upload_many([(f"blob{i}", "x" * i) for i in range(10)])
+        self.assertEqual(storage.download_and_decompress("blob3"), "xxx")
+        self.assertEqual("".join(storage.iter_decompressed("blob9", 2)), "x" * 9)
+
+
+class TestGCSBackend(_BackendTests, TestCase):
+    def create_backend(self) -> StorageBackend:
+        return GCSBackend(_FakeBucket())
+
+
+class TestMemoryBackend(_BackendTests, TestCase):
+    def create_backend(self) -> StorageBackend:
+        return MemoryBackend()
+
+
+class TestFilesystemBackend(_BackendTests, TestCase):
+    def create_backend(self) -> StorageBackend:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.root_dir = os.path.realpath(tmp_dir.name)
+        return FilesystemBackend(self.root_dir)
+
+    def test_files(self):
+        self.backend.upload("sys/__SYSOUT__", b"contents")
+        path = os.path.join(self.root_dir, "sys", "__SYSOUT__")
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"contents")
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["__SYSOUT__"])
+        self.backend.delete("sys/__SYSOUT__")
+        self.assertEqual(os.listdir(self.root_dir), [])
+
+    def test_invalid_blob_name(self):
+        for name in ["../outside", "/etc/passwd", "", "a/../.."]:
+            with self.assertRaises(ValueError):
+                self.backend.upload(name, b"contents")
@@ -0,0 +1,201 @@
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+
+from explainaboard_web.impl.db_utils import system_db_utils
+from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.db_utils.system_db_utils import (
+    FindSystemsReturn,
+    SystemDBUtils,
+)
+from explainaboard_web.impl.internal_models.system_model import SystemModel
+from explainaboard_web.impl.jobs import JobQueue
+
+
+class _ManualJobQueue(JobQueue):
+    """Runs the submitted jobs when `join` is called"""
+
+    def __init__(self) -> None:
+        self.jobs: list[Callable[[], None]] = []
+
+    def submit(self, job: Callable[[], None]) -> None:
+        self.jobs.append(job)
+
+    def join(self) -> None:
+        for job in self.jobs:
+            job()
+        self.jobs.clear()
+
+
+class TestAsyncProcessing(TestCase):
+    def setUp(self) -> None:
+        self.app = Flask(__name__)
+        self.queue = _ManualJobQueue()
+        self.system = MagicMock(system_id="sys1")
+        self.updates: list[dict] = []
+        self.metadata = MagicMock(dataset_metadata_id=None)
+        self.metadata.to_dict.return_value = {"system_name": "sys"}
+        patchers = [
+            patch.object(DBUtils, "update_one_by_id", side_effect=self._update),
+            patch.object(
+                DBUtils, "execute_transaction", side_effect=lambda cb: cb("session")
+            ),
+            patch.object(SystemModel, "from_dict", return_value=self.system),
+            patch.object(SystemDBUtils, "_load_sys_output"),
+            patch.object(SystemDBUtils, "_bump_generations"),
+            patch.object(SystemDBUtils, "_check_interrupted_systems"),
+            patch.object(system_db_utils, "get_job_queue", return_value=self.queue),
+            patch.object(
+                system_db_utils,
+                "get_user",
+                return_value=MagicMock(id="user1", preferred_username="user1"),
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _update(self, collection, docid, field_to_value, session=None):
+        self.updates.append(field_to_value)
+
+    def _create_system(self):
+        with self.app.app_context():
+            system = SystemDBUtils.create_system(
+                self.metadata, MagicMock(), async_processing=True
+            )
+        self.assertIs(system, self.system)
+        self.assertEqual(system.status, SystemModel._STATUS_PENDING)
+        self.system.save_to_db.assert_called_once_with()
+        # nothing is processed in the request
+        self.assertEqual(len(self.queue.jobs), 1)
+        self.assertEqual(self.updates, [])
+        return system
+
+    def test_pending_to_ready(self):
+        system = self._create_system()
+        self.queue.join()
+        self.assertEqual(
+            [update["status"] for update in self.updates],
+            [SystemModel._STATUS_PROCESSING, SystemModel._STATUS_READY],
+        )
+        system.update_overall_statistics.assert_called_once_with("session")
+        SystemDBUtils._bump_generations.assert_called_once_with(system)
+
+    def test_pending_to_failed(self):
+        system = self._create_system()
+        system.update_overall_statistics.side_effect = ValueError("bad metric")
+        with self.assertLogs(level="ERROR"):
+            self.queue.join()
+        self.assertEqual(
+            [update["status"] for update in self.updates],
+            [SystemModel._STATUS_PROCESSING, SystemModel._STATUS_FAILED],
+        )
+        # the messages of invalid inputs are shown to the user
+        self.assertEqual(self.updates[-1]["status_message"], "bad metric")
+        SystemDBUtils._bump_generations.assert_not_called()
+
+    def test_internal_error_is_not_shown(self):
+        self._create_system()
+        SystemDBUtils._load_sys_output.side_effect = RuntimeError("secret")
+        with self.assertLogs(level="ERROR"):
+            self.queue.join()
+        self.assertEqual(self.updates[-1]["status"], SystemModel._STATUS_FAILED)
+        self.assertNotIn("secret", self.updates[-1]["status_message"])
+
+
+class TestFailInterruptedSystems(TestCase):
+    def test_fail_interrupted_systems(self):
+        app = Flask(__name__)
+        app.config["SYSTEM_JOB_TIMEOUT_SECONDS"] = 60
+        with patch.object(DBUtils, "update_many", return_value=2) as update_many:
+            with app.app_context():
+                self.assertEqual(SystemDBUtils.fail_interrupted_systems(), 2)
+        collection, filt, field_to_value = update_many.call_args.args
+        self.assertEqual(collection, DBUtils.DEV_SYSTEM_METADATA)
+        self.assertEqual(
+            filt["status"],
+            {"$in": [SystemModel._STATUS_PENDING, SystemModel._STATUS_PROCESSING]},
+        )
+        cutoff = filt["created_at"]["$lt"]
+        self.assertAlmostEqual(
+            cutoff.timestamp(),
+            (datetime.utcnow() - timedelta(seconds=60)).timestamp(),
+            delta=5,
+        )
+        self.assertEqual(field_to_value["status"], SystemModel._STATUS_FAILED)
+
+
+class TestFindSystemsStatus(TestCase):
+    def setUp(self) -> None:
+        patcher = patch.object(
+            SystemDBUtils, "query_systems", return_value=FindSystemsReturn([], 0)
+        )
+        self.query_systems = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _filters_status(self) -> bool:
+        conditions = self.query_systems.call_args.args[0]
+        return any("status" in condition for condition in conditions)
+
+    def test_listing_hides_systems_that_are_not_ready(self):
+        SystemDBUtils.find_systems(page=0, page_size=10, task="text-classification")
+        self.assertTrue(self._filters_status())
+
+    def test_creator_and_id_lookups_return_all_systems(self):
+        SystemDBUtils.find_systems(page=0, page_size=10, creator="user1")
+        self.assertFalse(self._filters_status())
+        SystemDBUtils.find_systems(
+            page=0, page_size=10, ids=["62f3b2b1e4b0a1a2b3c4d5e6"]
+        )
+        self.assertFalse(self._filters_status())
+
+
+class TestUpdateSystem(TestCase):
+    def setUp(self) -> None:
+        self.metadata = MagicMock(
+            system_name="sys",
+            is_private=False,
+            shared_users=[],
+            system_details={},
+            system_tags=["tag"],
+        )
+        self.metadata.to_dict.return_value = {}
+        patchers = [
+            patch.object(DBUtils, "find_one_by_id_and_update"),
+            patch.object(SystemDBUtils, "_parse_system_details_in_doc"),
+            patch.object(system_db_utils.SystemGenerationDBUtils, "bump"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.previous = {
+            "task": "text-classification",
+            "dataset": {"dataset_name": "sst2"},
+            "system_name": "sys",
+            "is_private": False,
+            "shared_users": [],
+            "system_details": {},
+            "system_tags": [],
+        }
+
+    def test_bumps_generations_of_the_previous_document(self):
+        DBUtils.find_one_by_id_and_update.return_value = self.previous
+        self.assertTrue(SystemDBUtils.update_system_by_id("sys1", self.metadata))
+        # a single round trip
+        DBUtils.find_one_by_id_and_update.assert_called_once()
+        system_db_utils.SystemGenerationDBUtils.bump.assert_called_once_with(
+            system_db_utils.SystemGenerationDBUtils.keys_of_system(
+                "text-classification", "sst2"
+            )
+        )
+
+    def test_unchanged(self):
+        self.previous["system_tags"] = ["tag"]
+        DBUtils.find_one_by_id_and_update.return_value = self.previous
+        self.assertFalse(SystemDBUtils.update_system_by_id("sys1", self.metadata))
+        DBUtils.find_one_by_id_and_update.return_value = None
+        self.assertFalse(SystemDBUtils.update_system_by_id("sys1", self.metadata))
+        system_db_utils.SystemGenerationDBUtils.bump.assert_not_called()
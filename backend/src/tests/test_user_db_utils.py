@@ -0,0 +1,95 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from flask import Flask
+
+from explainaboard_web.impl.db_utils.db_utils import DBUtils
+from explainaboard_web.impl.db_utils.user_db_utils import UserDBUtils
+
+
+class TestUserCache(TestCase):
+    def setUp(self) -> None:
+        self.app = Flask(__name__)
+        self.docs = {
+            f"id{i}": {
+                "_id": f"id{i}",
+                "email": f"user{i}@example.com",
+                "email_verified": True,
+                "api_key": f"key{i}",
+                "preferred_username": f"user{i}",
+            }
+            for i in range(3)
+        }
+        self.queries: list[dict] = []
+        patchers = [
+            patch.object(DBUtils, "find", side_effect=self._find),
+            patch.object(DBUtils, "update_one_by_id", side_effect=self._update),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        UserDBUtils._user_cache.clear()
+        self.addCleanup(UserDBUtils._user_cache.clear)
+
+    def _find(self, collection, filt, limit, count):
+        self.queries.append(filt)
+        if "$or" in filt:
+            keys = {value for cond in filt["$or"] for value in cond.values()}
+            docs = [
+                doc
+                for doc in self.docs.values()
+                if doc["_id"] in keys or doc["email"] in keys
+            ]
+        else:
+            docs = [self.docs[_id] for _id in filt["_id"]["$in"] if _id in self.docs]
+        return iter([dict(doc) for doc in docs]), None
+
+    def _update(self, collection, docid, field_to_value):
+        self.docs[docid].update(field_to_value)
+
+    def test_find_user(self):
+        with self.app.app_context():
+            user = UserDBUtils.find_user("id0")
+            self.assertEqual(user.email, "user0@example.com")
+            self.assertIs(UserDBUtils.find_user("user0@example.com"), user)
+        with self.app.app_context():
+            # a new request gets a new object from the shared cache
+            other = UserDBUtils.find_user("id0")
+            self.assertIsNot(other, user)
+            self.assertEqual(other.email, "user0@example.com")
+            self.assertIsNone(UserDBUtils.find_user("missing"))
+        self.assertEqual(len(self.queries), 2)
+
+    def test_find_user_by_email_reads_db(self):
+        with self.app.app_context():
+            UserDBUtils.find_user("id0")
+        # another process changes the user
+        self.docs["id0"]["api_key"] = "new key"
+        self.docs["id1"]["email"] = "user0@example.com"
+        with self.app.app_context():
+            with self.assertRaises(RuntimeError):
+                UserDBUtils.find_user("user0@example.com")
+        del self.docs["id1"]
+        with self.app.app_context():
+            user = UserDBUtils.find_user("user0@example.com")
+            self.assertEqual(user.api_key, "new key")
+
+    def test_find_users_batches_misses(self):
+        with self.app.app_context():
+            UserDBUtils.find_user("id1")
+            users = UserDBUtils.find_users(["id2", "id1", "id0", "id2"])
+        self.assertEqual([user.id for user in users], ["id2", "id1", "id0"])
+        self.assertEqual(self.queries[1], {"_id": {"$in": ["id2", "id0"]}})
+
+        with self.app.app_context():
+            UserDBUtils.find_users(["id0", "id1", "id2"])
+        self.assertEqual(len(self.queries), 2)
+
+    def test_update_email_verified(self):
+        with self.app.app_context():
+            user = UserDBUtils.find_user("id0")
+            UserDBUtils.update_email_verified(user, False)
+            self.assertFalse(user.email_verified)
+        with self.app.app_context():
+            self.assertFalse(UserDBUtils.find_user("id0").email_verified)
+        self.assertEqual(len(self.queries), 2)
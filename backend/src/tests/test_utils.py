@@ -0,0 +1,68 @@
+import json
+import pickle
+import zlib
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from explainaboard_web.impl.utils import binarize_bson, iter_json_array, unbinarize_bson
+
+
+class TestIterJsonArray(TestCase):
+    def _split(self, text: str, size: int) -> list[str]:
+        return [text[i : i + size] for i in range(0, len(text), size)]
+
+    def test_elements_split_across_chunks(self):
+        data = [{"text": "a, b]", "ids": [1, 2]}, 4.5, -123, "str", None, True, []]
+        text = json.dumps(data, indent=2)
+        for size in range(1, 10):
+            self.assertEqual(list(iter_json_array(self._split(text, size))), data)
+
+    def test_large_element_is_parsed_a_few_times(self):
+        text = json.dumps(["x" * 100000, 1])
+        raw_decode = json.JSONDecoder.raw_decode
+        with patch.object(
+            json.JSONDecoder, "raw_decode", autospec=True, side_effect=raw_decode
+        ) as mock:
+            elements = list(iter_json_array(self._split(text, 10)))
+        self.assertEqual(elements, ["x" * 100000, 1])
+        self.assertLess(mock.call_count, 30)
+
+    def test_number_is_not_truncated(self):
+        self.assertEqual(list(iter_json_array(["[4.", "5, 12", "3]"])), [4.5, 123])
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_json_array([" [", " ] "])), [])
+
+    def test_invalid_json(self):
+        for text in ["", "{}", "[1,", "[1 2]", "[1,]"]:
+            with self.assertRaises(ValueError, msg=text):
+                list(iter_json_array([text]))
+
+
+class TestBinarizeBson(TestCase):
+    def test_ndarray_round_trip(self):
+        arrays = [
+            np.random.rand(100, 3),
+            np.arange(10, dtype=np.int32),
+            np.random.rand(4, 5).astype(">f4"),
+            np.zeros((0, 2)),
+            np.random.rand(6, 4)[:, ::2],
+            np.array(3.0),
+        ]
+        for array in arrays:
+            for compress in [True, False]:
+                decoded = unbinarize_bson(binarize_bson(array, compress=compress))
+                self.assertEqual(decoded.shape, array.shape)
+                self.assertTrue(np.array_equal(decoded, array))
+                self.assertTrue(decoded.flags.writeable)
+
+    def test_legacy_pickle_records(self):
+        array = np.random.rand(10, 2)
+        legacy = zlib.compress(pickle.dumps(array, protocol=2))
+        self.assertTrue(np.array_equal(unbinarize_bson(legacy), array))
+
+    def test_other_objects_are_pickled(self):
+        data = {"stats": [1.0, 2.0]}
+        self.assertEqual(unbinarize_bson(binarize_bson(data)), data)